@@ -1 +1,25 @@
 """Main package for the project."""
+
+import importlib
+
+# Public names and the modules defining them. They are imported on first
+# access, so importing the package does not load scipy, scikit-learn or
+# TensorFlow.
+_EXPORTS = {
+    'SpamFilter': '.main',
+    'NaiveBayesSpamFilter': '.naive_bayes',
+    'SpamFilterSVM': '.svm',
+    'RnnSpamDetector': '.rnn',
+}
+
+__all__ = list(_EXPORTS)
+
+def __getattr__(name):
+    if name not in _EXPORTS:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(_EXPORTS[name], __name__), name)
+    globals()[name] = value
+    return value
+
+def __dir__():
+    return sorted(set(globals()) | set(_EXPORTS))
@@ -0,0 +1,224 @@
+"""Streaming batch classifier for mbox files, Maildir directories and .eml files.
+
+Messages are read, parsed and scored through a chain of generators, so only
+one micro-batch of messages is held in memory at a time regardless of the
+size of the input.
+
+Usage:
+    python -m email_spam_filter.batch archive.mbox --model model.bin --format jsonl
+"""
+
+import argparse
+import csv
+import json
+import os
+import pickle
+import sys
+from email import message_from_bytes, policy
+from functools import partial
+from itertools import islice
+from . import model_format
+from .config import load_settings
+from .metrics import metrics
+
+def iter_mbox(path):
+    """Yield (key, raw bytes) for each message in an mbox file."""
+    with open(path, 'rb') as f:
+        lines = []
+        index = 0
+        previous_blank = True
+        for line in f:
+            if previous_blank and line.startswith(b'From '):
+                if lines:
+                    yield f"{path}:{index}", b''.join(lines)
+                    index += 1
+                lines = []
+            else:
+                lines.append(line)
+            previous_blank = line in (b'\n', b'\r\n')
+        if lines:
+            yield f"{path}:{index}", b''.join(lines)
+
+def _iter_files(directory, suffix=''):
+    """Yield (path, raw bytes) for regular files in a directory, without listing it up front."""
+    with os.scandir(directory) as entries:
+        for entry in entries:
+            if entry.is_file() and entry.name.endswith(suffix):
+                with open(entry.path, 'rb') as f:
+                    yield entry.path, f.read()
+
+def iter_maildir(path):
+    """Yield (key, raw bytes) for each message in a Maildir directory."""
+    for subdir in ('new', 'cur'):
+        if os.path.isdir(os.path.join(path, subdir)):
+            yield from _iter_files(os.path.join(path, subdir))
+
+def iter_eml_dir(path):
+    """Yield (key, raw bytes) for each .eml file in a directory."""
+    yield from _iter_files(path, suffix='.eml')
+
+def iter_messages(path):
+    """Pick the reader matching the input: mbox file, Maildir, or directory of .eml files."""
+    if os.path.isfile(path):
+        return iter_mbox(path)
+    if os.path.isdir(os.path.join(path, 'cur')) or os.path.isdir(os.path.join(path, 'new')):
+        return iter_maildir(path)
+    if os.path.isdir(path):
+        return iter_eml_dir(path)
+    raise FileNotFoundError(f"No mbox file, Maildir or .eml directory at {path}")
+
+def _body_text(msg):
+    """Return the plain-text body of a message, falling back to HTML."""
+    part = msg.get_body(preferencelist=('plain', 'html'))
+    if part is None:
+        return ''
+    try:
+        return part.get_content()
+    except (LookupError, ValueError):
+        payload = part.get_payload(decode=True) or b''
+        return payload.decode('utf-8', errors='replace')
+
+def parse_message(key, raw):
+    """Parse raw message bytes into the fields used for classification."""
+    msg = message_from_bytes(raw, policy=policy.default)
+    return {
+        'id': key,
+        'from': str(msg.get('from', '')),
+        'subject': str(msg.get('subject', '')),
+        'body': _body_text(msg),
+    }
+
+def iter_batches(iterable, batch_size):
+    """Group an iterable into lists of at most batch_size items."""
+    iterator = iter(iterable)
+    while True:
+        batch = list(islice(iterator, batch_size))
+        if not batch:
+            return
+        yield batch
+
+def classify_stream(messages, model, batch_size=512, threshold=None, rules=None):
+    """
+    Score parsed messages in micro-batches and yield one verdict per message.
+
+    Args:
+        messages: Iterable of parsed messages as returned by parse_message.
+        model: Trained model exposing predict, and optionally predict_proba.
+        batch_size: Number of messages scored per call to the model.
+        threshold: Spam probability cut-off; requires predict_proba. When
+            None, models with predict_proba use 0.5, and predict decides
+            for the others.
+        rules: Optional RuleSet; messages from whitelisted or blacklisted
+            senders get the rule's verdict and are not scored by the model.
+
+    Returns:
+        Generator of verdict dictionaries.
+    """
+    has_proba = hasattr(model, 'predict_proba')
+    if threshold is not None and not has_proba:
+        raise ValueError("A threshold requires a model with predict_proba.")
+    if threshold is None and has_proba:
+        # Reuse the probabilities instead of scoring every batch a second time through predict
+        threshold = 0.5
+
+    instrumented = metrics.enabled
+
+    def run(stage, func, *args):
+        return metrics.timed(stage, func, *args) if instrumented else func(*args)
+
+    for batch in iter_batches(messages, batch_size):
+        senders = [msg['from'] for msg in batch]
+        matches = run('rules', rules.match_batch, senders) if rules else [None] * len(batch)
+        scored = [msg for msg, match in zip(batch, matches) if match is None]
+        texts = [f"{msg['subject']}\n{msg['body']}" for msg in scored]
+        scores = run('model', model.predict_proba, texts) if has_proba and texts else []
+        if threshold is not None:
+            predictions = [score >= threshold for score in scores]
+        else:
+            predictions = run('model', model.predict, texts) if texts else []
+        if instrumented:
+            metrics.inc('verdicts', len(batch) - len(scored), source='rules')
+            metrics.inc('verdicts', len(scored), source='model')
+
+        j = 0
+        for msg, match in zip(batch, matches):
+            verdict = {
+                'id': msg['id'],
+                'from': msg['from'],
+                'subject': msg['subject'],
+            }
+            if match is None:
+                verdict['spam'] = bool(predictions[j])
+                if has_proba:
+                    verdict['score'] = float(scores[j])
+                j += 1
+            else:
+                verdict['spam'] = match
+                if has_proba:
+                    verdict['score'] = float(match)
+            yield verdict
+
+def write_jsonl(verdicts, out):
+    """Write verdicts as one JSON object per line."""
+    for verdict in verdicts:
+        out.write(json.dumps(verdict) + '\n')
+
+def write_csv(verdicts, out):
+    """Write verdicts as CSV with a header row."""
+    writer = None
+    for verdict in verdicts:
+        if writer is None:
+            writer = csv.DictWriter(out, fieldnames=list(verdict))
+            writer.writeheader()
+        writer.writerow(verdict)
+
+WRITERS = {
+    'jsonl': write_jsonl,
+    'csv': write_csv,
+}
+
+def load_model(path):
+    """Load a trained model from the binary model format, or from a pickle."""
+    if model_format.is_model_file(path):
+        return model_format.load_model(path)
+    with open(path, 'rb') as f:
+        return pickle.load(f)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Classify an mbox file, Maildir or .eml directory.')
+    parser.add_argument('input', help="mbox file, Maildir directory, or directory of .eml files")
+    parser.add_argument('--model', required=True, help="Path to a saved model file")
+    parser.add_argument('--format', choices=sorted(WRITERS), default='jsonl', help="Output format")
+    parser.add_argument('--output', help="Output file (defaults to stdout)")
+    parser.add_argument('--batch-size', type=int, default=512, help="Messages scored per model call")
+    parser.add_argument('--threshold', type=float, help="Spam probability cut-off")
+    parser.add_argument('--config', help="config.json whose whitelist and blacklist are applied first")
+    parser.add_argument('--metrics', help="Write stage timings and counters in Prometheus text format to this file")
+
+    args = parser.parse_args(argv)
+    if args.batch_size < 1:
+        parser.error("--batch-size must be at least 1.")
+
+    rules = None
+    if args.config:
+        rules = load_settings(args.config).rules
+
+    metrics.enabled = bool(args.metrics)
+    parse = partial(metrics.timed, 'parse', parse_message) if args.metrics else parse_message
+
+    model = load_model(args.model)
+    messages = (parse(key, raw) for key, raw in iter_messages(args.input))
+    verdicts = classify_stream(messages, model, args.batch_size, args.threshold, rules)
+
+    if args.output:
+        with open(args.output, 'w', newline='') as out:
+            WRITERS[args.format](verdicts, out)
+    else:
+        WRITERS[args.format](verdicts, sys.stdout)
+
+    if args.metrics:
+        with open(args.metrics, 'w') as f:
+            f.write(metrics.export())
+
+if __name__ == "__main__":
+    main()
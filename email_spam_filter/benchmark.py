@@ -0,0 +1,329 @@
+"""Reproducible training and scoring benchmarks for every model.
+
+A synthetic corpus is drawn from Zipf-distributed vocabularies, with spam and
+ham ranking the words differently so the models have something to learn. Each
+model is benchmarked in a fresh process, so its peak RSS is not inflated by
+the models measured before it. The benchmark records:
+
+- training time;
+- batch-scoring throughput for each batch size and worker count;
+- single-message p50/p99 latency;
+- accuracy on a held-out fifth of the corpus;
+- peak RSS;
+- for the CNN and RNN, the same measurements, plus weight memory and
+  agreement with the float32 verdicts, for each requested precision of the
+  NumPy runtime in ``lite``.
+
+Results are written as JSON to compare releases.
+
+Usage:
+    python -m email_spam_filter.benchmark --emails 20000 --output bench.json
+"""
+
+import argparse
+import importlib.util
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+MODELS = ('naive_bayes', 'svm', 'cnn', 'rnn')
+_NEURAL = ('cnn', 'rnn')
+
+def synthetic_corpus(n_emails=10000, vocab_size=20000, zipf=1.1, min_length=20, max_length=200,
+                     spam_ratio=0.3, seed=0):
+    """
+    Generate a labelled corpus of synthetic emails.
+
+    Args:
+        n_emails: Number of emails.
+        vocab_size: Number of distinct words.
+        zipf: Exponent of the Zipf distribution of word frequencies.
+        min_length: Minimum number of words per email.
+        max_length: Maximum number of words per email.
+        spam_ratio: Fraction of emails labelled spam.
+        seed: Random seed; the same arguments always produce the same corpus.
+
+    Returns:
+        Tuple of (emails, labels).
+    """
+    rng = np.random.default_rng(seed)
+    words = np.array([f"w{i}" for i in range(vocab_size)])
+    weights = 1.0 / np.arange(1, vocab_size + 1) ** zipf
+    cdf = np.cumsum(weights / weights.sum())
+    # Spam ranks a random fifth of the vocabulary differently from ham
+    spam_order = np.arange(vocab_size)
+    moved = rng.choice(vocab_size, size=vocab_size // 5, replace=False)
+    spam_order[moved] = rng.permutation(moved)
+
+    labels = (rng.random(n_emails) < spam_ratio).astype(int)
+    lengths = rng.integers(min_length, max_length + 1, size=n_emails)
+    ranks = np.minimum(np.searchsorted(cdf, rng.random(lengths.sum())), vocab_size - 1)
+    bounds = np.concatenate([[0], np.cumsum(lengths)])
+    emails = []
+    for label, start, stop in zip(labels, bounds[:-1], bounds[1:]):
+        ids = spam_order[ranks[start:stop]] if label else ranks[start:stop]
+        emails.append(' '.join(words[ids]))
+    return emails, labels.tolist()
+
+def _peak_rss_mb():
+    """Peak resident set size of this process in MiB."""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports KiB, macOS bytes
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+def _train(name, emails, labels, epochs, sequence_length):
+    """Train one model on raw texts and return an object with predict_proba over texts."""
+    if name == 'naive_bayes':
+        from .naive_bayes import NaiveBayesSpamFilter
+
+        model = NaiveBayesSpamFilter()
+        model.train(emails, labels)
+        return model
+    if name == 'svm':
+        from .svm import SpamFilterSVM
+
+        return SpamFilterSVM(estimator='linear').fit(emails, labels)
+
+    from .cascade import SequenceScorer
+    from .sequence import SequenceEncoder, build_vocabulary
+
+    vocabulary = build_vocabulary(emails, 5000)
+    X = SequenceEncoder(vocabulary, sequence_length).encode(emails)
+    y = np.asarray(labels)
+    if name == 'cnn':
+        from .cnn import build_cnn_model
+
+        model = build_cnn_model((sequence_length, 1))
+        model.fit(X[..., None].astype(np.float32), y, epochs=epochs, batch_size=128, verbose=0)
+    else:
+        from .rnn import RnnSpamDetector
+
+        model = RnnSpamDetector(vocab_size=len(vocabulary) + 2).model
+        model.fit(X, y, epochs=epochs, batch_size=128, verbose=0)
+    return SequenceScorer(model, vocabulary, sequence_length)
+
+def _score_with(model, emails):
+    return list(model.predict_proba(emails))
+
+def _time_scoring(model, emails, batch_sizes, latency_samples):
+    """Throughput per batch size and single-message latency percentiles of an in-process model."""
+    throughput = []
+    for batch_size in batch_sizes:
+        start = time.perf_counter()
+        for i in range(0, len(emails), batch_size):
+            model.predict_proba(emails[i:i + batch_size])
+        throughput.append({
+            'batch_size': batch_size,
+            'workers': None,
+            'messages_per_second': len(emails) / (time.perf_counter() - start),
+        })
+    latencies = []
+    for email in emails[:latency_samples]:
+        start = time.perf_counter()
+        model.predict_proba([email])
+        latencies.append(time.perf_counter() - start)
+    latencies = np.array(latencies) * 1000
+    return throughput, {
+        'p50': float(np.percentile(latencies, 50)),
+        'p99': float(np.percentile(latencies, 99)),
+    }
+
+def _bench_precisions(scorer, emails, labels, precisions, batch_sizes, latency_samples):
+    """Convert a trained neural model to the NumPy runtime at each precision and measure it."""
+    from .cascade import SequenceScorer
+    from .lite import LiteModel
+
+    reference = scorer.predict_proba(emails) >= 0.5
+    results = [{
+        'precision': 'keras-float32',
+        'weight_bytes': int(sum(np.asarray(w).nbytes for w in scorer.model.get_weights())),
+    }]
+    for precision in precisions:
+        lite = SequenceScorer(LiteModel.from_keras(scorer.model, precision), scorer.vocabulary,
+                              scorer.max_length, scorer.oov)
+        verdicts = lite.predict_proba(emails) >= 0.5
+        throughput, latency = _time_scoring(lite, emails, batch_sizes, latency_samples)
+        results.append({
+            'precision': precision,
+            'weight_bytes': lite.model.nbytes,
+            'accuracy': float(np.mean(verdicts == labels)),
+            'agreement': float(np.mean(verdicts == reference)),
+            'throughput': throughput,
+            'latency_ms': latency,
+        })
+    return results
+
+def bench_model(name, corpus, batch_sizes=(1, 32, 512), workers=(1,), latency_samples=200,
+                epochs=1, sequence_length=200, precisions=()):
+    """
+    Benchmark one model in the current process.
+
+    Args:
+        name: One of MODELS.
+        corpus: Keyword arguments for synthetic_corpus.
+        batch_sizes: Batch sizes for the throughput measurements.
+        workers: Worker process counts for the throughput measurements. The
+            neural models are not fork-safe and always score in-process, using
+            TensorFlow's own thread pools.
+        latency_samples: Number of single-message calls timed for latency.
+        epochs: Training epochs for the neural models.
+        sequence_length: Input length of the neural models.
+        precisions: Precisions of lite.PRECISIONS to compare the CNN and RNN
+            against when run by the NumPy runtime.
+
+    Returns:
+        Dictionary of results.
+    """
+    emails, labels = synthetic_corpus(**corpus)
+    split = int(len(emails) * 0.8)
+    train_emails, test_emails = emails[:split], emails[split:]
+    rss_before = _peak_rss_mb()
+
+    start = time.perf_counter()
+    model = _train(name, train_emails, labels[:split], epochs, sequence_length)
+    train_seconds = time.perf_counter() - start
+
+    # Warm up caches, traced graphs and lazily built state before timing
+    model.predict_proba(test_emails[:max(batch_sizes)])
+    from .tokenizer import default_tokenizer
+    default_tokenizer.clear()
+
+    throughput = []
+    for n_workers in ((None,) if name in _NEURAL else workers):
+        pool = None
+        if n_workers is not None:
+            from functools import partial
+            from .pool import ScoringPool
+
+            pool = ScoringPool({name: partial(_score_with, model)}, max_workers=n_workers).start()
+            pool.map(name, test_emails[:n_workers], batch_size=1)
+        for batch_size in batch_sizes:
+            start = time.perf_counter()
+            if pool is not None:
+                pool.map(name, test_emails, batch_size=batch_size)
+            else:
+                for i in range(0, len(test_emails), batch_size):
+                    model.predict_proba(test_emails[i:i + batch_size])
+            elapsed = time.perf_counter() - start
+            throughput.append({
+                'batch_size': batch_size,
+                'workers': n_workers,
+                'messages_per_second': len(test_emails) / elapsed,
+            })
+        if pool is not None:
+            pool.close()
+
+    latencies = []
+    for email in test_emails[:latency_samples]:
+        start = time.perf_counter()
+        model.predict_proba([email])
+        latencies.append(time.perf_counter() - start)
+    latencies = np.array(latencies) * 1000
+    test_labels = np.asarray(labels[split:])
+
+    result = {
+        'model': name,
+        'train_emails': len(train_emails),
+        'test_emails': len(test_emails),
+        'train_seconds': train_seconds,
+        'accuracy': float(np.mean((np.asarray(model.predict_proba(test_emails)) >= 0.5) == test_labels)),
+        'throughput': throughput,
+        'latency_ms': {
+            'p50': float(np.percentile(latencies, 50)),
+            'p99': float(np.percentile(latencies, 99)),
+        },
+        'rss_before_training_mb': rss_before,
+        'peak_rss_mb': _peak_rss_mb(),
+    }
+    if name in _NEURAL and precisions:
+        result['precisions'] = _bench_precisions(model, test_emails, test_labels, precisions,
+                                                 batch_sizes, latency_samples)
+    return result
+
+def run_benchmarks(models=MODELS, corpus=None, isolate=True, **options):
+    """
+    Benchmark several models and collect the results with environment details.
+
+    Args:
+        models: Names of the models to benchmark.
+        corpus: Keyword arguments for synthetic_corpus.
+        isolate: Run each model in a fresh process so peak RSS is per model.
+        **options: Passed on to bench_model.
+
+    Returns:
+        Dictionary ready to be written as JSON.
+    """
+    corpus = corpus or {}
+    has_tensorflow = importlib.util.find_spec('tensorflow') is not None
+    results = []
+    for name in models:
+        if name in _NEURAL and not has_tensorflow:
+            results.append({'model': name, 'skipped': "TensorFlow is not installed"})
+            continue
+        if isolate:
+            with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context('spawn')) as executor:
+                results.append(executor.submit(bench_model, name, corpus, **options).result())
+        else:
+            results.append(bench_model(name, corpus, **options))
+
+    return {
+        'environment': {
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+        },
+        'corpus': corpus,
+        'options': options,
+        'results': results,
+    }
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark training and scoring of the spam filter models.')
+    parser.add_argument('--models', nargs='+', choices=MODELS, default=list(MODELS), help="Models to benchmark")
+    parser.add_argument('--emails', type=int, default=10000, help="Size of the synthetic corpus")
+    parser.add_argument('--vocab-size', type=int, default=20000, help="Number of distinct words")
+    parser.add_argument('--zipf', type=float, default=1.1, help="Zipf exponent of word frequencies")
+    parser.add_argument('--min-length', type=int, default=20, help="Minimum words per email")
+    parser.add_argument('--max-length', type=int, default=200, help="Maximum words per email")
+    parser.add_argument('--spam-ratio', type=float, default=0.3, help="Fraction of spam")
+    parser.add_argument('--seed', type=int, default=0, help="Random seed of the corpus")
+    parser.add_argument('--batch-sizes', type=int, nargs='+', default=[1, 32, 512], help="Scoring batch sizes")
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, os.cpu_count() or 1],
+                        help="Worker process counts for Naive Bayes and SVM")
+    parser.add_argument('--latency-samples', type=int, default=200, help="Single-message calls timed")
+    parser.add_argument('--epochs', type=int, default=1, help="Training epochs of the neural models")
+    parser.add_argument('--precisions', nargs='*', choices=('float32', 'float16', 'int8'), default=[],
+                        help="Also run the CNN and RNN through the NumPy runtime at these precisions")
+    parser.add_argument('--output', help="JSON output file (defaults to stdout)")
+
+    args = parser.parse_args(argv)
+    corpus = {
+        'n_emails': args.emails,
+        'vocab_size': args.vocab_size,
+        'zipf': args.zipf,
+        'min_length': args.min_length,
+        'max_length': args.max_length,
+        'spam_ratio': args.spam_ratio,
+        'seed': args.seed,
+    }
+    report = run_benchmarks(args.models, corpus, batch_sizes=args.batch_sizes,
+                            workers=sorted(set(args.workers)), latency_samples=args.latency_samples,
+                            epochs=args.epochs, precisions=args.precisions)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+
+if __name__ == "__main__":
+    main()
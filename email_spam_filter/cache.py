@@ -0,0 +1,105 @@
+"""Verdict cache for bulk and duplicate campaigns.
+
+Messages are keyed by a hash of their normalised tokens, so copies of a
+campaign that differ only in case, markup, punctuation or tracking links share
+one entry. The key also includes the version of the model or configuration
+snapshot that produced the verdict; once a new snapshot is published, the old
+entries are never looked up again and are evicted by the LRU bound.
+"""
+
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from .metrics import metrics
+from .tokenizer import tokenize
+
+def fingerprint(text):
+    """Hash of the normalised tokens of a message."""
+    return hashlib.blake2b('\x1f'.join(tokenize(text)).encode('utf-8', 'surrogatepass'),
+                           digest_size=16).digest()
+
+class VerdictCache:
+    """Bounded LRU cache of verdicts with an optional time-to-live."""
+
+    def __init__(self, max_entries=100000, ttl=3600):
+        """
+        Args:
+            max_entries: Maximum number of verdicts kept; 0 disables the cache.
+            ttl: Seconds a verdict stays valid, or None to keep it until evicted.
+        """
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def compute(self, version, texts, score_batch):
+        """
+        Return one verdict per text, scoring only those not in the cache.
+
+        Args:
+            version: Version of the snapshot doing the scoring.
+            texts: List of message texts.
+            score_batch: Function scoring a list of texts, called at most once
+                with the distinct texts missing from the cache.
+
+        Returns:
+            List of verdicts in the order of texts.
+        """
+        if not self.max_entries:
+            return list(score_batch(texts))
+
+        keys = [(version, fingerprint(text)) for text in texts]
+        now = time.monotonic()
+        results = [None] * len(texts)
+        missing = {}
+        with self._lock:
+            for i, key in enumerate(keys):
+                entry = self._entries.get(key)
+                if entry is not None and (entry[0] is None or entry[0] > now):
+                    self._entries.move_to_end(key)
+                    results[i] = entry[1]
+                    self.hits += 1
+                else:
+                    missing.setdefault(key, []).append(i)
+                    self.misses += 1
+
+        if missing:
+            # Copies within the batch are scored once
+            scores = score_batch([texts[positions[0]] for positions in missing.values()])
+            expires = now + self.ttl if self.ttl is not None else None
+            with self._lock:
+                for (key, positions), score in zip(missing.items(), scores):
+                    for i in positions:
+                        results[i] = score
+                    self._entries[key] = (expires, score)
+                    self._entries.move_to_end(key)
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+        if metrics.enabled:
+            n_misses = sum(map(len, missing.values()))
+            metrics.inc('cache_lookups', len(texts) - n_misses, result='hit')
+            metrics.inc('cache_lookups', n_misses, result='miss')
+        return results
+
+    @property
+    def hit_rate(self):
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def clear(self):
+        """Drop all verdicts; the counters are kept."""
+        with self._lock:
+            self._entries.clear()
+
+    def __getstate__(self):
+        # Copies start empty; verdicts are cheap to recompute and tied to this process' snapshots
+        return {'max_entries': self.max_entries, 'ttl': self.ttl}
+
+    def __setstate__(self, state):
+        self.__init__(**state)
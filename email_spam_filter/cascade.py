@@ -0,0 +1,118 @@
+"""Cascade scoring across the Naive Bayes, SVM, CNN and RNN models.
+
+Models are tried from cheapest to most expensive. Each stage scores only the
+messages the previous stages were unsure about: a message whose spam
+probability falls outside the stage's confidence band ``(low, high)`` is
+decided there, and the rest escalate. The last available stage decides
+everything that reaches it. With typical traffic, most messages are settled
+by the vectorized Naive Bayes stage.
+"""
+
+import numpy as np
+from .inference import engine_for
+from .sequence import SequenceEncoder
+
+STAGES = ('naive_bayes', 'svm', 'cnn', 'rnn')
+
+# Probabilities inside a band are uncertain and escalate to the next stage
+DEFAULT_BANDS = {
+    'naive_bayes': (0.05, 0.95),
+    'svm': (0.15, 0.85),
+    'cnn': (0.25, 0.75),
+}
+
+class SequenceScorer:
+    """Adapts a Keras model over token-ID sequences to raw email text."""
+
+    def __init__(self, model, vocabulary, max_length, oov=1):
+        """
+        Args:
+            model: Keras model, or an RnnSpamDetector, taking (batch, max_length)
+                token IDs. Models with a 3-D input, such as the CNN, receive
+                (batch, max_length, 1) floats. Models with their own
+                predict_proba over token IDs, such as an RnnSpamDetector with
+                bucketing or a lite.LiteModel, are scored through it.
+            vocabulary: Mapping of token to ID used in training.
+            max_length: Sequence length the model was trained with.
+            oov: ID used for tokens missing from the vocabulary.
+        """
+        self.model = getattr(model, 'model', model)
+        self.detector = model if hasattr(model, 'predict_proba') else None
+        self.vocabulary = vocabulary
+        self.max_length = max_length
+        self.oov = oov
+        self.encoder = SequenceEncoder(vocabulary, max_length, oov=oov)
+
+    def encode(self, emails):
+        """Encode emails into a zero-padded (batch, max_length) matrix of token IDs."""
+        return self.encoder.encode(emails)
+
+    def predict_proba(self, emails):
+        """Return the spam probability of each email."""
+        X = self.encode(emails)
+        if self.detector is not None:
+            return self.detector.predict_proba(X)
+        if len(self.model.input_shape) == 3:
+            X = X[..., None].astype(np.float32)
+        return engine_for(self.model).predict(X)
+
+    def predict(self, emails, threshold=0.5):
+        """Return 1 for spam and 0 for ham for each email, comparing its probability with threshold."""
+        return (np.asarray(self.predict_proba(emails)).reshape(-1) >= threshold).astype(int)
+
+class Cascade:
+    """Ordered stages of (name, model, band); a band of None means the stage decides everything."""
+
+    def __init__(self, stages):
+        self.stages = stages
+        self.scored = dict.fromkeys([name for name, _, _ in stages], 0)
+
+    @property
+    def names(self):
+        return [name for name, _, _ in self.stages]
+
+    def predict_proba(self, emails):
+        """
+        Return the spam probability of each email from the stage that decided it.
+
+        Args:
+            emails: List of email texts.
+
+        Returns:
+            Array of spam probabilities.
+        """
+        probabilities = np.zeros(len(emails))
+        pending = np.arange(len(emails))
+        for name, model, band in self.stages:
+            if not len(pending):
+                break
+            scores = np.asarray(model.predict_proba([emails[i] for i in pending]), dtype=np.float64)
+            self.scored[name] += len(pending)
+            probabilities[pending] = scores.reshape(-1)
+            if band is None:
+                break
+            low, high = band
+            pending = pending[(probabilities[pending] > low) & (probabilities[pending] < high)]
+        return probabilities
+
+    def predict(self, emails, threshold=0.5):
+        """Return whether each email is spam, comparing the deciding probability with threshold."""
+        return self.predict_proba(emails) >= threshold
+
+def build_cascade(models, bands=None):
+    """
+    Build the cascade from the available models.
+
+    Args:
+        models: Mapping of stage name to a model with predict_proba over texts.
+        bands: Optional mapping of stage name to (low, high) overriding DEFAULT_BANDS.
+
+    Returns:
+        A Cascade, or None if no stage has a model.
+    """
+    bands = {**DEFAULT_BANDS, **{name: tuple(band) for name, band in (bands or {}).items()}}
+    names = [name for name in STAGES if name in models]
+    if not names:
+        return None
+    return Cascade([(name, models[name], bands.get(name) if name != names[-1] else None)
+                    for name in names])
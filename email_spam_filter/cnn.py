@@ -1,65 +1,23 @@
 import numpy as np
-from tensorflow.keras.models import Sequential
-from tensorflow.keras.layers import Dense, Conv1D, MaxPooling1D, Flatten
-import cProfile
-import pstats
-from concurrent.futures import ProcessPoolExecutor
-import json
-import time
-import threading
-from watchdog.observers import Observer
-from watchdog.events import FileSystemEventHandler
+from .inference import engine_for
+from .metrics import metrics
 
-class ConfigReloader(FileSystemEventHandler):
-    def __init__(self, config_path, callback):
-        self.config_path = config_path
-        self.callback = callback
-
-    def on_modified(self, event):
-        if event.src_path == self.config_path:
-            print(f"Configuration file {self.config_path} has been modified.")
-            with open(self.config_path, 'r') as f:
-                new_config = json.load(f)
-            self.callback(new_config)
-
-def load_config(config_path='config.json'):
-    try:
-        with open(config_path, 'r') as f:
-            return json.load(f)
-    except FileNotFoundError:
-        print("Configuration file not found. Using default settings.")
-        return {}
-
-class ConfigWatcher(threading.Thread):
-    def __init__(self, config_path, callback):
-        super().__init__()
-        self.config_path = config_path
-        self.callback = callback
-        self.observer = Observer()
-
-    def run(self):
-        event_handler = ConfigReloader(self.config_path, self.callback)
-        self.observer.schedule(event_handler, path=self.config_path, recursive=False)
-        self.observer.start()
-        try:
-            while True:
-                time.sleep(1)
-        except KeyboardInterrupt:
-            self.observer.stop()
-        self.observer.join()
-
-def build_cnn_model(input_shape):
+def build_cnn_model(input_shape, learning_rate=0.001):
     """
     Build a simple Convolutional Neural Network (CNN) model for spam detection.
     
     Args:
         input_shape: Tuple specifying the shape of the input data.
+        learning_rate: Learning rate of the Adam optimizer, e.g. the
+            learning_rate of the loaded Settings.
 
     Returns:
         A compiled CNN model ready for training or inference.
     """
-    config = load_config()
-    learning_rate = config.get('learning_rate', 0.001)
+    # TensorFlow is imported on first use so importing this module stays cheap
+    from tensorflow.keras.models import Sequential
+    from tensorflow.keras.layers import Dense, Conv1D, MaxPooling1D, Flatten
+    from tensorflow.keras.optimizers import Adam
 
     model = Sequential()
     # 1D Convolutional layer
@@ -71,35 +29,33 @@ def build_cnn_model(input_shape):
     model.add(Dense(1, activation='sigmoid'))  # Output layer for binary classification
 
     # Compile the model with binary crossentropy loss and an appropriate optimizer
-    model.compile(optimizer=f'adam', loss='binary_crossentropy', metrics=['accuracy'])
+    model.compile(optimizer=Adam(learning_rate=learning_rate), loss='binary_crossentropy', metrics=['accuracy'])
     
     return model
 
-def train_cnn_model(model, X_train, y_train, epochs=10, batch_size=32):
+def train_cnn_model(model, X_train, y_train=None, epochs=10, batch_size=32):
     """
     Train the CNN model on the provided data.
 
     Args:
         model: The compiled CNN model.
-        X_train: Training features.
-        y_train: Training labels.
+        X_train: Training features, or, with y_train None, a stream of
+            (X, y) batches read from disk, such as
+            streaming.Corpus.dataset(encoder, channels=True).
+        y_train: Training labels, or None for a stream of batches.
         epochs: Number of epochs for training.
-        batch_size: Batch size during training.
+        batch_size: Batch size during training; streams bring their own.
     
     Returns:
         History object containing training history information.
     """
-    profiler = cProfile.Profile()
-    profiler.enable()
-
-    # Train the model
-    history = model.fit(X_train, y_train, epochs=epochs, batch_size=batch_size)
-
-    profiler.disable()
-    stats = pstats.Stats(profiler).sort_stats('cumtime')
-    stats.print_stats(10)  # Print top 10 time-consuming functions
-
-    return history
+    if y_train is None:
+        args, options = (X_train,), {'epochs': epochs}
+    else:
+        args, options = (X_train, y_train), {'epochs': epochs, 'batch_size': batch_size}
+    if metrics.enabled:
+        return metrics.timed('train', model.fit, *args, **options)
+    return model.fit(*args, **options)
 
 def predict_spam(model, X_test):
     """
@@ -112,25 +68,26 @@ def predict_spam(model, X_test):
     Returns:
         Array of predicted probabilities indicating spam likelihood.
     """
-    # Profile this function for performance bottlenecks
-    profiler = cProfile.Profile()
-    profiler.enable()
-
-    # Use ProcessPoolExecutor for parallel processing if applicable
-    with ProcessPoolExecutor() as executor:
-        results = list(executor.map(model.predict, np.array_split(X_test, os.cpu_count())))
-
-    profiler.disable()
-    stats = pstats.Stats(profiler).sort_stats('cumtime')
-    stats.print_stats(10)  # Print top 10 time-consuming functions
-
-    return np.concatenate(results)
-
-def on_config_change(new_config):
-    print("Configuration updated:", new_config)
+    # Batches run in this process through the model's shared inference engine;
+    # TensorFlow's thread pools spread each batch across cores.
+    X_test = np.asarray(X_test, dtype=np.float32)
+    if metrics.enabled:
+        results = metrics.timed('model', engine_for(model).predict, X_test)
+    else:
+        results = engine_for(model).predict(X_test)
+    return results.reshape(-1, 1)
+
+def on_config_change(new_settings):
+    print("Configuration updated:", new_settings)
     # Add logic here to update any dependent components or settings
     # For example, re-compiling the model with a new learning rate if needed
 
 if __name__ == "__main__":
-    config_watcher = ConfigWatcher('config.json', on_config_change)
-    config_watcher.start()
\ No newline at end of file
+    from .config import load_settings
+    from .reload import FileWatcher
+
+    config_watcher = FileWatcher(['config.json'], lambda: on_config_change(load_settings(missing_ok=True))).start()
+    try:
+        config_watcher.join()
+    except KeyboardInterrupt:
+        config_watcher.stop()
\ No newline at end of file
@@ -0,0 +1,204 @@
+"""Single-pass configuration: file, environment and command line merged into Settings.
+
+Values are merged once, with the precedence command line > environment >
+config file > defaults. The result is validated and compiled into an
+immutable ``Settings`` tuple: the threshold becomes a float, the whitelist
+and blacklist a compiled RuleSet, and model paths are made absolute. Code
+that scores messages only reads attributes of a Settings object and never
+re-reads the JSON file.
+"""
+
+import json
+import os
+from collections import namedtuple
+from types import MappingProxyType
+from .cascade import STAGES
+from .registry import ALGORITHMS
+from .rules import compile_rules
+
+DEFAULTS = {
+    'algorithm': 'naive_bayes',
+    'threshold': 0.7,
+    'whitelist': [],
+    'blacklist': [],
+    'models': {},
+    'cascade': {},
+    'metrics': False,
+    'profiler': {},
+    'learning_rate': 0.001,
+}
+
+_MAPPINGS = ('models', 'cascade', 'profiler')
+
+class Settings(namedtuple('Settings', ['algorithm', 'threshold', 'whitelist', 'blacklist', 'rules',
+                                       'models', 'cascade', 'metrics', 'profiler', 'learning_rate'])):
+    """Validated, compiled configuration; build it with load_settings or build_settings."""
+
+    __slots__ = ()
+
+    def __reduce__(self):
+        # Mapping proxies cannot be pickled; send plain dicts and wrap them again
+        return _restore_settings, ({key: dict(value) if key in _MAPPINGS else value
+                                    for key, value in self._asdict().items()},)
+
+def _restore_settings(fields):
+    return Settings(**{key: MappingProxyType(value) if key in _MAPPINGS else value
+                       for key, value in fields.items()})
+
+def read_file(path, missing_ok=False):
+    """
+    Read a JSON configuration file.
+
+    Args:
+        path: Path to the file.
+        missing_ok: Return an empty configuration instead of raising when the
+            file does not exist.
+
+    Returns:
+        The configuration dictionary. Raises ValueError if the file is not
+        valid JSON.
+    """
+    try:
+        with open(path, 'r') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        if not missing_ok:
+            raise
+        print(f"Warning: {path} not found. Using default configuration.")
+        return {}
+    except json.JSONDecodeError as e:
+        raise ValueError(f"Invalid JSON in {path}: {e}")
+
+def _split_list(value):
+    """Split a comma-separated environment value, dropping empty entries."""
+    return [item.strip() for item in value.split(',') if item.strip()]
+
+def from_env(environ=None):
+    """Read THRESHOLD, WHITELIST, BLACKLIST and ALGORITHM; unset or empty variables are skipped."""
+    environ = os.environ if environ is None else environ
+    config = {}
+    if environ.get('THRESHOLD', '').strip():
+        try:
+            config['threshold'] = float(environ['THRESHOLD'])
+        except ValueError:
+            raise ValueError("Threshold from environment variable must be a number.")
+    for key in ('whitelist', 'blacklist'):
+        entries = _split_list(environ.get(key.upper(), ''))
+        if entries:
+            config[key] = entries
+    if environ.get('ALGORITHM', '').strip():
+        config['algorithm'] = environ['ALGORITHM'].strip()
+    return config
+
+def add_arguments(parser):
+    """Add the configuration options to an argparse parser."""
+    parser.add_argument('--config', default='config.json', help="Path to the configuration file")
+    parser.add_argument('--threshold', type=float, help="Sensitivity threshold for spam detection")
+    parser.add_argument('--whitelist', nargs='*', help="Email addresses or domains never marked as spam")
+    parser.add_argument('--blacklist', nargs='*', help="Email addresses or domains always marked as spam")
+    parser.add_argument('--algorithm', help="Spam detection algorithm")
+    return parser
+
+def from_args(args):
+    """Configuration values given on the command line, from a namespace built with add_arguments."""
+    config = {key: getattr(args, key, None) for key in ('threshold', 'whitelist', 'blacklist', 'algorithm')}
+    return {key: value for key, value in config.items() if value is not None}
+
+def merge(file_config=None, env_config=None, args_config=None):
+    """Merge configuration sources; later sources win, and missing keys take their default."""
+    merged = dict(DEFAULTS)
+    for source in (file_config, env_config, args_config):
+        merged.update(source or {})
+    return merged
+
+def validate(config):
+    """Raise ValueError if a merged configuration dictionary is malformed."""
+    if not isinstance(config, dict):
+        raise ValueError("Configuration must be a JSON object.")
+    threshold = config.get('threshold', DEFAULTS['threshold'])
+    if isinstance(threshold, bool) or not isinstance(threshold, (int, float)) or not 0 <= threshold <= 1:
+        raise ValueError("Threshold must be a number between 0 and 1.")
+    algorithm = config.get('algorithm', DEFAULTS['algorithm'])
+    if algorithm not in (*ALGORITHMS, 'cascade'):
+        raise ValueError(f"Algorithm must be one of {sorted(ALGORITHMS)} or 'cascade', not {algorithm!r}.")
+    for key in ('whitelist', 'blacklist'):
+        entries = config.get(key, [])
+        if not isinstance(entries, list) or not all(isinstance(item, str) for item in entries):
+            raise ValueError(f"{key.capitalize()} must be a list of strings.")
+    models = config.get('models', {})
+    if not isinstance(models, dict) or not all(isinstance(path, str) for path in models.values()):
+        raise ValueError("Models must map algorithm names to model file paths.")
+    for name in models:
+        if name not in ALGORITHMS:
+            raise ValueError(f"Unknown model '{name}'; models are listed under {sorted(ALGORITHMS)}.")
+    bands = config.get('cascade', {})
+    if not isinstance(bands, dict):
+        raise ValueError("Cascade must map stage names to [low, high] confidence bands.")
+    for name, band in bands.items():
+        if name not in STAGES:
+            raise ValueError(f"Unknown cascade stage '{name}'.")
+        if (not isinstance(band, list) or len(band) != 2
+                or not all(isinstance(bound, (int, float)) for bound in band)
+                or not 0 <= band[0] <= band[1] <= 1):
+            raise ValueError(f"Cascade band for '{name}' must be [low, high] with 0 <= low <= high <= 1.")
+    if not isinstance(config.get('metrics', False), bool):
+        raise ValueError("Metrics must be true or false.")
+    profiler = config.get('profiler', {})
+    if (not isinstance(profiler, dict)
+            or not isinstance(profiler.get('interval', 0.01), (int, float))
+            or profiler.get('interval', 0.01) <= 0):
+        raise ValueError("Profiler must be an object with a positive interval in seconds.")
+    learning_rate = config.get('learning_rate', DEFAULTS['learning_rate'])
+    if not isinstance(learning_rate, (int, float)) or learning_rate <= 0:
+        raise ValueError("Learning rate must be a positive number.")
+
+def build_settings(config, base_dir='.'):
+    """
+    Validate a merged configuration and compile it into Settings.
+
+    Args:
+        config: Configuration dictionary, e.g. from merge.
+        base_dir: Directory relative model paths are resolved against.
+
+    Returns:
+        Immutable Settings.
+    """
+    config = merge(config)
+    validate(config)
+    profiler = config['profiler']
+    return Settings(
+        algorithm=config['algorithm'],
+        threshold=float(config['threshold']),
+        whitelist=tuple(config['whitelist']),
+        blacklist=tuple(config['blacklist']),
+        rules=compile_rules(config),
+        models=MappingProxyType({name: os.path.join(os.path.abspath(base_dir), path)
+                                 for name, path in config['models'].items()}),
+        cascade=MappingProxyType({name: tuple(band) for name, band in config['cascade'].items()}),
+        metrics=config['metrics'],
+        profiler=MappingProxyType({'enabled': bool(profiler.get('enabled', False)),
+                                   'interval': float(profiler.get('interval', 0.01))}),
+        learning_rate=float(config['learning_rate']),
+    )
+
+def load_settings(config_path='config.json', args_config=None, environ=None, missing_ok=False,
+                  defaults=None):
+    """
+    Read the file and environment, merge them with command-line values and compile Settings.
+
+    Args:
+        config_path: Path to the JSON configuration file.
+        args_config: Command-line values, e.g. from from_args.
+        environ: Environment mapping; defaults to os.environ.
+        missing_ok: Use defaults when the file does not exist.
+        defaults: Optional values overriding DEFAULTS, below the file.
+
+    Returns:
+        Immutable Settings. Raises ValueError on invalid values.
+    """
+    file_config = read_file(config_path, missing_ok=missing_ok)
+    if not isinstance(file_config, dict):
+        raise ValueError("Configuration must be a JSON object.")
+    config = merge(defaults, file_config, from_env(environ))
+    config.update(args_config or {})
+    return build_settings(config, os.path.dirname(os.path.abspath(config_path)))
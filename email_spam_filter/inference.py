@@ -0,0 +1,174 @@
+"""Batched in-process inference for the Keras CNN and RNN models.
+
+Keras' ``model.predict`` builds a data pipeline on every call, and shipping a
+model to worker processes either fails to pickle or reloads TensorFlow in each
+child. ``InferenceEngine`` instead keeps the one model loaded in this process,
+traces a graph function per padded batch size, and lets TensorFlow's own
+thread pools spread each batch across cores. Single requests can be submitted
+concurrently and are coalesced into batches bounded by a size and a latency
+budget.
+"""
+
+import queue
+import threading
+import time
+import weakref
+from concurrent.futures import Future
+
+import numpy as np
+
+def configure_threads(intra_op_threads=None, inter_op_threads=None):
+    """
+    Size TensorFlow's CPU thread pools.
+
+    Must be called before TensorFlow runs its first operation; afterwards the
+    pools are fixed for the lifetime of the process.
+
+    Args:
+        intra_op_threads: Threads used inside a single operation such as a matmul.
+        inter_op_threads: Threads used to run independent operations in parallel.
+    """
+    import tensorflow as tf
+
+    if intra_op_threads is not None:
+        tf.config.threading.set_intra_op_parallelism_threads(intra_op_threads)
+    if inter_op_threads is not None:
+        tf.config.threading.set_inter_op_parallelism_threads(inter_op_threads)
+
+class InferenceEngine:
+    """Runs a Keras model on fixed-shape batches through traced graph functions."""
+
+    def __init__(self, model, batch_sizes=(1, 8, 32, 128, 512), max_latency=0.005):
+        """
+        Args:
+            model: Trained Keras model with a single input and a sigmoid output.
+                The engine holds it weakly; the caller keeps it alive.
+            batch_sizes: Padded batch sizes to trace. Each batch is padded up to
+                the nearest size, and larger inputs are split into chunks of
+                the largest size, so at most len(batch_sizes) graphs are traced.
+            max_latency: Longest time in seconds a submitted request waits for
+                others to join its batch.
+        """
+        # A weak reference, so a model cached in _engines can still be collected
+        self._model = weakref.ref(model)
+        self.batch_sizes = tuple(sorted(batch_sizes))
+        self.max_batch_size = self.batch_sizes[-1]
+        self.max_latency = max_latency
+        self._functions = {}
+        self._lock = threading.Lock()
+        self._requests = queue.Queue()
+        self._worker = None
+
+    @property
+    def model(self):
+        """The Keras model, or None once it has been garbage collected."""
+        return self._model()
+
+    def _function_for(self, batch):
+        """Return the traced graph function for this batch shape, tracing it once."""
+        key = (batch.shape, batch.dtype.str)
+        function = self._functions.get(key)
+        if function is None:
+            import tensorflow as tf
+
+            with self._lock:
+                function = self._functions.get(key)
+                if function is None:
+                    model = self._model
+                    spec = tf.TensorSpec(batch.shape, tf.as_dtype(batch.dtype))
+                    function = tf.function(lambda x: model()(x, training=False)).get_concrete_function(spec)
+                    self._functions[key] = function
+        return function
+
+    def _padded_size(self, n):
+        for size in self.batch_sizes:
+            if size >= n:
+                return size
+        return self.max_batch_size
+
+    def predict(self, X):
+        """
+        Predict spam probabilities for a batch of inputs.
+
+        Args:
+            X: Array of model inputs with the batch along the first axis.
+
+        Returns:
+            1-D array of spam probabilities.
+        """
+        X = np.asarray(X)
+        results = np.empty(len(X), dtype=np.float32)
+        for start in range(0, len(X), self.max_batch_size):
+            chunk = X[start:start + self.max_batch_size]
+            padded = np.zeros((self._padded_size(len(chunk)),) + chunk.shape[1:], dtype=chunk.dtype)
+            padded[:len(chunk)] = chunk
+            output = self._function_for(padded)(padded)
+            results[start:start + len(chunk)] = np.asarray(output).reshape(len(padded), -1)[:len(chunk), 0]
+        return results
+
+    def submit(self, x):
+        """
+        Queue a single input for dynamic batching.
+
+        Args:
+            x: One model input, without the batch axis.
+
+        Returns:
+            Future resolving to the spam probability of the input.
+        """
+        if self._worker is None:
+            with self._lock:
+                if self._worker is None:
+                    self._worker = threading.Thread(target=self._serve, daemon=True)
+                    self._worker.start()
+        future = Future()
+        self._requests.put((np.asarray(x), future))
+        return future
+
+    def _serve(self):
+        """Collect queued requests into batches and resolve their futures."""
+        while True:
+            request = self._requests.get()
+            if request is None:
+                return
+            batch = [request]
+            deadline = time.monotonic() + self.max_latency
+            while len(batch) < self.max_batch_size:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    request = self._requests.get(timeout=timeout)
+                except queue.Empty:
+                    break
+                if request is None:
+                    self._requests.put(None)
+                    break
+                batch.append(request)
+
+            try:
+                probabilities = self.predict(np.stack([x for x, _ in batch]))
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+            else:
+                for (_, future), probability in zip(batch, probabilities):
+                    future.set_result(float(probability))
+
+    def close(self):
+        """Stop the dynamic batching thread after it drains queued requests."""
+        with self._lock:
+            worker, self._worker = self._worker, None
+        if worker is not None:
+            self._requests.put(None)
+            worker.join()
+
+# One engine per loaded model, shared by every caller in this process
+_engines = weakref.WeakKeyDictionary()
+
+def engine_for(model):
+    """Return the shared InferenceEngine for a model, creating it on first use."""
+    engine = _engines.get(model)
+    if engine is None:
+        engine = _engines.setdefault(model, InferenceEngine(model))
+    return engine
@@ -0,0 +1,321 @@
+"""Lightweight NumPy runtime for the small CNN and RNN models.
+
+The Keras models built by ``cnn.build_cnn_model`` and ``RnnSpamDetector`` are
+a handful of layers: Embedding, Conv1D, MaxPooling1D, Flatten, SimpleRNN and
+Dense. ``LiteModel.from_keras`` copies their weights into a plain list of
+layers that NumPy runs as a few batched matrix products, without TensorFlow's
+per-call overhead.
+
+Weights can be stored at reduced precision. ``'float16'`` halves their
+memory. ``'int8'`` quarters it, with one float32 scale per output column (per
+row for embeddings) so each column uses the full int8 range. Weights are
+widened to float32 inside each matrix product, and activations and biases stay
+float32, so the results stay close to the float32 model.
+
+The recurrent layer processes only as many timesteps as the longest sequence
+in the batch; padding (ID 0) after it is masked in Keras and skipped here.
+
+``export`` writes the converted weights, and optionally the vocabulary the
+model was trained with, to a file in the binary model format. Listing that
+file under "models" in the configuration serves the model without importing
+TensorFlow: the weights are memory-mapped and scored by this module alone.
+"""
+
+import numpy as np
+from .model_format import decode_vocabulary, encode_vocabulary, read_model_of_kind, write_model
+from .sequence import OOV, PAD, sequence_lengths
+
+PRECISIONS = ('float32', 'float16', 'int8')
+
+# Keras layer class names and the operation running each
+_OPS = {
+    'Embedding': 'embedding',
+    'Conv1D': 'conv1d',
+    'MaxPooling1D': 'max_pool1d',
+    'Flatten': 'flatten',
+    'SimpleRNN': 'simple_rnn',
+    'Dense': 'dense',
+}
+
+def _sigmoid(x):
+    return 0.5 * (1.0 + np.tanh(0.5 * x))
+
+_ACTIVATIONS = {
+    'linear': lambda x: x,
+    'relu': lambda x: np.maximum(x, 0),
+    'tanh': np.tanh,
+    'sigmoid': _sigmoid,
+}
+
+def quantize(weights, precision, axis=0):
+    """
+    Store a weight matrix at the given precision.
+
+    Args:
+        weights: float32 array.
+        precision: One of PRECISIONS.
+        axis: Axis reduced to compute the int8 scales; 0 gives one scale per
+            column of a (inputs, outputs) kernel, 1 one per embedding row.
+
+    Returns:
+        Tuple of (values, scales); scales is None unless precision is 'int8'.
+    """
+    weights = np.asarray(weights, dtype=np.float32)
+    if precision == 'float32':
+        return weights, None
+    if precision == 'float16':
+        return weights.astype(np.float16), None
+    if precision != 'int8':
+        raise ValueError(f"Precision '{precision}' is not supported; use one of {PRECISIONS}.")
+    scales = np.abs(weights).max(axis=axis, keepdims=True) / 127
+    scales[scales == 0] = 1
+    values = np.clip(np.rint(weights / scales), -127, 127).astype(np.int8)
+    return values, scales.astype(np.float32)
+
+def _matmul(x, values, scales):
+    """x @ weights, widening stored weights to float32 and applying per-column scales."""
+    product = x @ values.astype(np.float32, copy=False)
+    return product if scales is None else product * scales
+
+class LiteModel:
+    """Sequential model of NumPy layers converted from a trained Keras model."""
+
+    def __init__(self, layers, input_shape, precision='float32'):
+        """
+        Args:
+            layers: List of layer dictionaries, as built by from_keras.
+            input_shape: Input shape without the batch axis, e.g. (200, 1) for
+                the CNN or (None,) for the RNN.
+            precision: Precision the weights are stored at.
+        """
+        self.layers = layers
+        self.input_shape = (None,) + tuple(input_shape)
+        self.precision = precision
+
+    @classmethod
+    def from_keras(cls, model, precision='float32'):
+        """
+        Convert a trained Keras model, or an RnnSpamDetector, to NumPy layers.
+
+        Args:
+            model: Sequential Keras model built from the supported layers.
+            precision: One of PRECISIONS.
+
+        Returns:
+            A LiteModel. Raises ValueError for unsupported layers or options.
+        """
+        if precision not in PRECISIONS:
+            raise ValueError(f"Precision '{precision}' is not supported; use one of {PRECISIONS}.")
+        model = getattr(model, 'model', model)
+        layers = []
+        for layer in model.layers:
+            kind = type(layer).__name__
+            if kind not in _OPS:
+                raise ValueError(f"Layer '{kind}' is not supported.")
+            config = layer.get_config()
+            weights = [np.asarray(w, dtype=np.float32) for w in layer.get_weights()]
+            spec = {'op': _OPS[kind]}
+            if kind == 'Embedding':
+                spec['embeddings'] = quantize(weights[0], precision, axis=1)
+                spec['mask_zero'] = bool(config.get('mask_zero', False))
+            elif kind == 'Conv1D':
+                if (tuple(config['strides']) != (1,) or config['padding'] != 'valid'
+                        or tuple(config['dilation_rate']) != (1,)):
+                    raise ValueError("Only Conv1D with stride 1, no dilation and 'valid' padding is supported.")
+                kernel_size, in_channels, filters = weights[0].shape
+                spec['kernel_size'] = kernel_size
+                spec['kernel'] = quantize(weights[0].reshape(kernel_size * in_channels, filters), precision)
+                spec['bias'] = weights[1]
+                spec['activation'] = config['activation']
+            elif kind == 'MaxPooling1D':
+                if config['padding'] != 'valid' or tuple(config['strides']) != tuple(config['pool_size']):
+                    raise ValueError("Only MaxPooling1D with strides equal to pool_size and 'valid' padding "
+                                     "is supported.")
+                spec['pool_size'] = config['pool_size'][0]
+            elif kind == 'SimpleRNN':
+                if config.get('return_sequences') or config.get('go_backwards'):
+                    raise ValueError("Only SimpleRNN returning its last state is supported.")
+                spec['kernel'] = quantize(weights[0], precision)
+                spec['recurrent_kernel'] = quantize(weights[1], precision)
+                spec['bias'] = weights[2]
+                spec['activation'] = config['activation']
+            elif kind == 'Dense':
+                spec['kernel'] = quantize(weights[0], precision)
+                spec['bias'] = weights[1]
+                spec['activation'] = config['activation']
+            if spec.get('activation', 'linear') not in _ACTIVATIONS:
+                raise ValueError(f"Activation '{spec['activation']}' is not supported.")
+            layers.append(spec)
+        input_shape = tuple(model.input_shape[1:]) if model.built else (None,)
+        return cls(layers, input_shape, precision)
+
+    @property
+    def nbytes(self):
+        """Memory held by the weights, scales and biases."""
+        total = 0
+        for spec in self.layers:
+            for value in spec.values():
+                if isinstance(value, tuple):
+                    total += sum(part.nbytes for part in value if part is not None)
+                elif isinstance(value, np.ndarray):
+                    total += value.nbytes
+        return total
+
+    def predict_proba(self, X):
+        """
+        Run the forward pass.
+
+        Args:
+            X: Batch of inputs: token IDs for an Embedding first layer, or
+                (batch, length) or (batch, length, channels) values for Conv1D.
+
+        Returns:
+            1-D float32 array of spam probabilities.
+        """
+        x = np.asarray(X)
+        mask = None
+        for spec in self.layers:
+            op = spec['op']
+            if op == 'embedding':
+                ids = x.astype(np.intp, copy=False)
+                if spec['mask_zero']:
+                    # Masked padding after the longest sequence changes nothing; drop it
+                    ids = ids[:, :max(int(sequence_lengths(ids).max(initial=0)), 1)]
+                    mask = ids != PAD
+                values, scales = spec['embeddings']
+                x = values[ids].astype(np.float32)
+                if scales is not None:
+                    x *= scales[ids]
+            elif op == 'conv1d':
+                x = x.astype(np.float32, copy=False)
+                if x.ndim == 2:
+                    x = x[..., None]
+                k = spec['kernel_size']
+                windows = np.lib.stride_tricks.sliding_window_view(x, k, axis=1)
+                # (batch, steps, channels, k) -> (batch, steps, k * channels), matching the kernel rows
+                windows = windows.transpose(0, 1, 3, 2).reshape(x.shape[0], x.shape[1] - k + 1, -1)
+                x = _ACTIVATIONS[spec['activation']](_matmul(windows, *spec['kernel']) + spec['bias'])
+            elif op == 'max_pool1d':
+                size = spec['pool_size']
+                steps = x.shape[1] // size
+                x = x[:, :steps * size].reshape(x.shape[0], steps, size, -1).max(axis=2)
+            elif op == 'flatten':
+                x = x.reshape(x.shape[0], -1)
+            elif op == 'simple_rnn':
+                x = self._simple_rnn(spec, x, mask)
+            elif op == 'dense':
+                x = _ACTIVATIONS[spec['activation']](_matmul(x, *spec['kernel']) + spec['bias'])
+        return x.reshape(len(x), -1)[:, 0].astype(np.float32, copy=False)
+
+    def _simple_rnn(self, spec, x, mask):
+        """Run a SimpleRNN over (batch, steps, features), returning the last unmasked state."""
+        activation = _ACTIVATIONS[spec['activation']]
+        # Input projections of all timesteps in one product; only the recurrence is sequential
+        inputs = _matmul(x, *spec['kernel']) + spec['bias']
+        values, scales = spec['recurrent_kernel']
+        recurrent = values.astype(np.float32)
+        if scales is not None:
+            recurrent = recurrent * scales
+        state = np.zeros((x.shape[0], recurrent.shape[0]), dtype=np.float32)
+        for t in range(x.shape[1]):
+            new_state = activation(inputs[:, t] + state @ recurrent)
+            state = new_state if mask is None else np.where(mask[:, t, None], new_state, state)
+        return state
+
+    def predict(self, X, threshold=0.5):
+        """Return 1 for spam and 0 for ham for each input."""
+        return (self.predict_proba(X) > threshold).astype(int)
+
+    def save(self, path, vocabulary=None, max_length=None, oov=OOV):
+        """
+        Save the layers in the binary model format.
+
+        Args:
+            path: Destination file path.
+            vocabulary: Optional mapping of token to ID used in training. With
+                it, model_format.load_model returns a cascade.SequenceScorer
+                over raw email text instead of the bare LiteModel.
+            max_length: Sequence length the model was trained with; defaults
+                to the model's input length when it is fixed, as for the CNN.
+            oov: ID used for tokens missing from the vocabulary.
+        """
+        arrays = {}
+        layers = []
+        for i, spec in enumerate(self.layers):
+            layer = {}
+            for key, value in spec.items():
+                if isinstance(value, tuple):
+                    values, scales = value
+                    arrays[f'{i}.{key}'] = values
+                    if scales is not None:
+                        arrays[f'{i}.{key}_scale'] = scales
+                elif isinstance(value, np.ndarray):
+                    arrays[f'{i}.{key}'] = value
+                else:
+                    layer[key] = value
+            layers.append(layer)
+        metadata = {'layers': layers, 'input_shape': list(self.input_shape[1:]), 'precision': self.precision}
+        if vocabulary is not None:
+            max_length = max_length or self.input_shape[1]
+            if max_length is None:
+                raise ValueError("max_length is needed to save the vocabulary of a variable-length model.")
+            words = sorted(vocabulary, key=vocabulary.get)
+            arrays['vocabulary'] = encode_vocabulary(words)
+            arrays['vocabulary_ids'] = np.fromiter(map(vocabulary.get, words), dtype=np.int32, count=len(words))
+            metadata.update(max_length=int(max_length), oov=int(oov))
+        write_model(path, 'lite', arrays, metadata)
+
+    @classmethod
+    def load(cls, path):
+        """Load a model saved with save; its weights stay memory-mapped."""
+        return cls._from_model_data(*read_model_of_kind(path, 'lite'))
+
+    @classmethod
+    def _from_model_data(cls, metadata, arrays):
+        layers = []
+        for i, layer in enumerate(metadata['layers']):
+            spec = dict(layer)
+            for key in ('embeddings', 'kernel', 'recurrent_kernel'):
+                if f'{i}.{key}' in arrays:
+                    spec[key] = (arrays[f'{i}.{key}'], arrays.get(f'{i}.{key}_scale'))
+            if f'{i}.bias' in arrays:
+                spec['bias'] = arrays[f'{i}.bias']
+            layers.append(spec)
+        return cls(layers, metadata['input_shape'], metadata['precision'])
+
+def load_scorer(metadata, arrays):
+    """
+    Build the model held by a 'lite' model file.
+
+    Returns:
+        A cascade.SequenceScorer over raw email text if the file holds a
+        vocabulary, otherwise the LiteModel itself.
+    """
+    model = LiteModel._from_model_data(metadata, arrays)
+    if 'vocabulary' not in arrays:
+        return model
+    from .cascade import SequenceScorer
+
+    words = decode_vocabulary(arrays['vocabulary'])
+    vocabulary = dict(zip(words, arrays['vocabulary_ids'].tolist()))
+    return SequenceScorer(model, vocabulary, metadata['max_length'], metadata['oov'])
+
+def export(model, path, vocabulary=None, max_length=None, precision='float32'):
+    """
+    Write a trained Keras model to a file that is served without TensorFlow.
+
+    Args:
+        model: Trained CNN or RNN, a Keras model or an RnnSpamDetector.
+        path: Destination file path.
+        vocabulary: Optional mapping of token to ID used in training, so the
+            file can score raw email text.
+        max_length: Sequence length the model was trained with; required with
+            a vocabulary unless the model's input length is fixed.
+        precision: One of PRECISIONS.
+
+    Returns:
+        The LiteModel that was written.
+    """
+    lite = LiteModel.from_keras(model, precision)
+    lite.save(path, vocabulary, max_length)
+    return lite
@@ -1,71 +1,272 @@
 """Main module for optimized email-spam-filter."""
 
 import os
-import json
-from concurrent.futures import ProcessPoolExecutor
 import cProfile
-from watchdog.observers import Observer
-from watchdog.events import FileSystemEventHandler
+import threading
+from functools import partial
+from types import MappingProxyType
+from .cache import VerdictCache
+from .metrics import metrics
+from .neardup import NearDuplicateIndex
+from .pool import ScoringPool
+from .reload import FileWatcher, load_snapshot
 
-class ConfigReloader(FileSystemEventHandler):
-    """Handler to reload configuration when file changes are detected."""
-    
-    def __init__(self, config_path, callback):
-        self.config_path = config_path
-        self.callback = callback
-    
-    def on_modified(self, event):
-        if event.src_path == self.config_path:
-            self.callback()
+# TensorFlow is not fork-safe, and the neural models already spread each batch
+# over cores through their inference engine, so these run in this process.
+_IN_PROCESS = frozenset({'cnn', 'rnn', 'cascade'})
 
 class SpamFilter:
-    """Class for handling multiple spam detection algorithms."""
-    
-    def __init__(self, algorithm='naive_bayes', config_path='config.json'):
-        """Initialize with a default or specified algorithm and configuration path."""
-        self.algorithm = algorithm
+    """Class for handling multiple spam detection algorithms.
+
+    The configuration is held in an immutable Snapshot together with the
+    scoring pool built for it. A reload publishes a new (snapshot, pool) pair
+    by replacing one reference; batches already running keep the pair they
+    started with, and the old pool's workers exit once its last batch is done.
+    Verdicts are cached per snapshot version, so repeated campaign bodies are
+    scored once, and the cache is emptied whenever a new snapshot is published.
+    Messages close to spam confirmed through confirm_spam are flagged by the
+    near-duplicate index without being scored.
+
+    Models come from the "models" section of the configuration or from
+    register_model. The 'cascade' algorithm scores with Naive Bayes first and
+    escalates only uncertain messages to the SVM and then the neural models.
+    """
+
+    def __init__(self, algorithm='naive_bayes', config_path='config.json', watch=True, overrides=None):
+        """
+        Initialize with a default or specified algorithm and configuration path.
+
+        Settings are read from the configuration file and the THRESHOLD,
+        WHITELIST, BLACKLIST and ALGORITHM environment variables; overrides,
+        e.g. command-line values, take precedence over both.
+        """
         self.algorithms = {
             'naive_bayes': self._naive_bayes_filter,
             'svm': self._svm_filter,
-            # Additional algorithms can be added here
+            'cnn': self._cnn_filter,
+            'rnn': self._rnn_filter,
+            'cascade': self._cascade_filter,
         }
-        self.config_path = config_path
+        self.default_algorithm = algorithm
+        self.config_path = os.path.abspath(config_path)
+        self.overrides = dict(overrides or {})
+        self._models = {}
+        self._version = 0
+        self._watcher = None
+        self._active = None
+        self._reload_lock = threading.Lock()
+        self.cache = VerdictCache()
+        self.neardup = NearDuplicateIndex()
         self.load_config()
-        
-        # Set up file watcher to reload configuration on changes
-        event_handler = ConfigReloader(config_path, self.load_config)
-        observer = Observer()
-        observer.schedule(event_handler, path=os.path.dirname(config_path), recursive=False)
-        observer.start()
+
+        # Reload the configuration, debounced, when it or its model files change
+        if watch:
+            self._watcher = FileWatcher(self._watched_paths(self.settings), self._reload).start()
+
+    def _watched_paths(self, settings):
+        return [self.config_path, *settings.models.values()]
 
     def load_config(self):
-        """Load configurations from the config.json file."""
-        with open(self.config_path, 'r') as f:
-            config = json.load(f)
-            # Assuming we want to update algorithm based on config
-            if 'algorithm' in config:
-                self.algorithm = config['algorithm']
-    
-    def run_spam_filter(self, email_content):
+        """Load the settings and their model files, then publish them as a new snapshot."""
+        # Reloads run one at a time, so the last file read is the one published and versions are unique
+        with self._reload_lock:
+            snapshot = load_snapshot(self.config_path, self._version + 1, self.default_algorithm, self._models,
+                                     self.overrides)
+            self._version = snapshot.version
+            self._active = (snapshot, self._new_pool(snapshot), self._model_version(snapshot))
+            self.cache.clear()
+            metrics.configure(snapshot.settings)
+            if self._watcher is not None:
+                # Model files added by this configuration are watched from now on
+                self._watcher.set_paths(self._watched_paths(snapshot.settings))
+
+    def register_model(self, name, model):
+        """
+        Use an in-memory model for an algorithm and publish a new snapshot.
+
+        Args:
+            name: One of 'naive_bayes', 'svm', 'cnn' or 'rnn'.
+            model: Model with predict_proba over email texts. Wrap Keras models
+                in cascade.SequenceScorer.
+        """
+        self._models[name] = model
+        self.load_config()
+
+    def _reload(self):
+        """Reload after a file change, keeping the current snapshot if the new files are invalid."""
+        try:
+            self.load_config()
+        except (OSError, ValueError) as e:
+            print(f"Configuration reload failed, keeping version {self._version}: {e}")
+
+    @property
+    def snapshot(self):
+        """The configuration snapshot currently used for scoring."""
+        return self._active[0]
+
+    @property
+    def settings(self):
+        """The compiled Settings of the current snapshot."""
+        return self._active[0].settings
+
+    @property
+    def algorithm(self):
+        return self._active[0].settings.algorithm
+
+    @property
+    def rules(self):
+        return self._active[0].settings.rules
+
+    @property
+    def pool(self):
+        """Scoring pool for the current snapshot; its workers start on first use."""
+        return self._active[1]
+
+    def _model_version(self, snapshot):
+        """Weight versions of the snapshot's models; updates in place, e.g. partial_fit, change it."""
+        return tuple(getattr(model, 'version', None) for model in snapshot.models.values())
+
+    def _current_pool(self, snapshot, pool, model_version):
+        """Return the snapshot's pool, replacing it first if its workers hold outdated weights."""
+        with self._reload_lock:
+            active = self._active
+            if active[0] is not snapshot:
+                # A reload published a newer snapshot meanwhile; this batch finishes on its own pool
+                return pool
+            if active[2] != model_version:
+                active = self._active = (snapshot, self._new_pool(snapshot), model_version)
+            return active[1]
+
+    def _new_pool(self, snapshot):
+        # Workers are bound to this snapshot, whatever is published after they fork
+        scorers = {name: partial(func, snapshot) for name, func in self.algorithms.items()
+                   if name not in _IN_PROCESS}
+        return ScoringPool(scorers)
+
+    def run_spam_filter(self, email_content, sender=None):
         """Run the selected spam detection algorithm on the given content."""
-        if self.algorithm in self.algorithms:
-            with ProcessPoolExecutor() as executor:
-                future = executor.submit(self.algorithms[self.algorithm], email_content)
-                return future.result()
+        return self.run_spam_filter_batch([email_content], [sender])[0]
+
+    def run_spam_filter_batch(self, emails, senders=None):
+        """
+        Run the selected spam detection algorithm on a batch of emails.
+
+        Emails whose sender matches the whitelist or blacklist get the rule's
+        verdict (False or True), and emails that are near-duplicates of
+        confirmed spam are marked True; neither is passed to the model.
+        """
+        snapshot, pool, model_version = self._active
+        algorithm = snapshot.settings.algorithm
+        if algorithm not in self.algorithms:
+            raise ValueError(f"Algorithm '{algorithm}' is not supported.")
+        instrumented = metrics.enabled
+        # Verdicts are keyed by the configuration and by the models' weights, which can change in place
+        current = self._model_version(snapshot)
+        if current != model_version:
+            pool = self._current_pool(snapshot, pool, current)
+        version = (snapshot.version, current)
+
+        def dispatch(batch):
+            if algorithm in _IN_PROCESS:
+                return self.algorithms[algorithm](snapshot, batch)
+            return pool.submit(algorithm, batch).result()
+
+        score = partial(metrics.timed, 'model', dispatch) if instrumented else dispatch
+        rules = snapshot.settings.rules
+        if not senders or not len(rules):
+            if not len(self.neardup):
+                if instrumented:
+                    metrics.inc('verdicts', len(emails), source='model')
+                return self.cache.compute(version, list(emails), score)
+            results = [None] * len(emails)
+        elif instrumented:
+            results = metrics.timed('rules', rules.match_batch, senders)
         else:
-            raise ValueError(f"Algorithm '{self.algorithm}' is not supported.")
-    
-    def _naive_bayes_filter(self, email_content):
-        """Optimized Naive Bayes spam detection logic."""
-        # Optimized implementation of naive bayes filtering logic goes here.
-        # Example: Fast text processing and probability calculations
-        pass
+            results = rules.match_batch(senders)
+        unmatched = [i for i, verdict in enumerate(results) if verdict is None]
+        n_rules = len(results) - len(unmatched)
+
+        if unmatched and len(self.neardup):
+            texts = [emails[i] for i in unmatched]
+            if instrumented:
+                duplicates = metrics.timed('neardup', self.neardup.match, texts)
+            else:
+                duplicates = self.neardup.match(texts)
+            for i, duplicate in zip(unmatched, duplicates):
+                if duplicate:
+                    results[i] = True
+            unmatched = [i for i, duplicate in zip(unmatched, duplicates) if not duplicate]
+
+        if unmatched:
+            scores = self.cache.compute(version, [emails[i] for i in unmatched], score)
+            for i, verdict in zip(unmatched, scores):
+                results[i] = verdict
+        if instrumented:
+            metrics.inc('verdicts', n_rules, source='rules')
+            metrics.inc('verdicts', len(results) - n_rules - len(unmatched), source='neardup')
+            metrics.inc('verdicts', len(unmatched), source='model')
+        return results
+
+    def confirm_spam(self, emails):
+        """Record emails confirmed as spam, e.g. user reports, so close variants are caught."""
+        self.neardup.add(emails)
+
+    def close(self):
+        """Stop watching the configuration and shut down the scoring pool."""
+        if self._watcher is not None:
+            self._watcher.stop()
+            self._watcher = None
+        if self._active is not None:
+            self._active[1].close()
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['_watcher'] = None
+        del state['_reload_lock']
+        if self._active is not None:
+            snapshot = self._active[0]
+            state['_active'] = snapshot._replace(models=dict(snapshot.models))
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._reload_lock = threading.Lock()
+        if self._active is not None:
+            snapshot = self._active
+            snapshot = snapshot._replace(models=MappingProxyType(snapshot.models))
+            self._active = (snapshot, self._new_pool(snapshot), self._model_version(snapshot))
     
-    def _svm_filter(self, email_content):
-        """Optimized SVM spam detection logic."""
-        # Optimized implementation of svm filtering logic goes here.
-        # Example: Utilize efficient libraries like scikit-learn's SVC with optimized parameters
-        pass
+    def _model_filter(self, snapshot, name, emails):
+        """Compare one model's spam probabilities with the configured threshold."""
+        model = snapshot.models.get(name)
+        if model is None:
+            raise ValueError(f"No '{name}' model is loaded; list it under \"models\" in the "
+                             f"configuration or call register_model.")
+        threshold = snapshot.settings.threshold
+        return [bool(p >= threshold) for p in model.predict_proba(emails)]
+
+    def _naive_bayes_filter(self, snapshot, emails):
+        """Naive Bayes spam detection on a batch of emails."""
+        return self._model_filter(snapshot, 'naive_bayes', emails)
+
+    def _svm_filter(self, snapshot, emails):
+        """SVM spam detection on a batch of emails."""
+        return self._model_filter(snapshot, 'svm', emails)
+
+    def _cnn_filter(self, snapshot, emails):
+        """CNN spam detection on a batch of emails."""
+        return self._model_filter(snapshot, 'cnn', emails)
+
+    def _rnn_filter(self, snapshot, emails):
+        """RNN spam detection on a batch of emails."""
+        return self._model_filter(snapshot, 'rnn', emails)
+
+    def _cascade_filter(self, snapshot, emails):
+        """Cascade from the cheapest to the most expensive available model."""
+        if snapshot.cascade is None:
+            raise ValueError("The cascade needs at least one model; list them under \"models\" "
+                             "in the configuration or call register_model.")
+        return [bool(spam) for spam in snapshot.cascade.predict(emails, snapshot.settings.threshold)]
 
 def profile_function(func, *args, **kwargs):
     """Profile a function and print its performance report."""
@@ -81,16 +282,19 @@ def print_greeting():
     print("Hello from optimized email-spam-filter!")
 
 def main():
-    """Run the main functions for the application with profiling."""
+    """Run the main functions for the application."""
     spam_filter = SpamFilter(algorithm='naive_bayes')
     
-    # Example usage with placeholder content
+    # Example usage with placeholder content; set "metrics" or "profiler" in
+    # config.json to measure it instead of profiling every run
     example_email_content = "This is an example email content."
     try:
-        result = profile_function(spam_filter.run_spam_filter, example_email_content)
+        result = spam_filter.run_spam_filter(example_email_content)
         print(f"Spam detection result: {result}")
     except ValueError as e:
         print(e)
+    finally:
+        spam_filter.close()
 
     print_greeting()
 
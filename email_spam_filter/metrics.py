@@ -0,0 +1,224 @@
+"""Opt-in metrics and sampling profiler.
+
+Metrics are off by default. Instrumented code checks ``metrics.enabled`` once
+and, only when it is set, runs the stage through ``metrics.timed``, so a
+disabled process pays one attribute check per instrumented call. Where a
+function is applied per message, callers pick the timed or plain function
+once per batch instead.
+
+Stage timings nest: ``vectorize`` includes ``tokenize``, and ``model``
+includes both. Stages run inside the worker processes of a ScoringPool are
+recorded in the worker, sent back with each batch's results and merged into
+the parent's registry, so the parent exports them like in-process stages.
+
+The exported text follows the Prometheus exposition format. The sampling
+profiler records the stacks of all threads every ``interval`` seconds and
+reports them in the collapsed format used by flame graph tools.
+"""
+
+import bisect
+import sys
+import threading
+import time
+from collections import Counter
+
+PREFIX = 'email_spam_filter'
+
+# Upper bounds in seconds of the latency histogram buckets
+BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+class _Histogram:
+    __slots__ = ('counts', 'sum', 'count')
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(BUCKETS, value)] += 1
+        self.sum += value
+        self.count += 1
+
+def _labels(labels):
+    return '{' + ','.join(f'{name}="{value}"' for name, value in labels) + '}' if labels else ''
+
+class SamplingProfiler:
+    """Samples the stacks of all threads from a background thread."""
+
+    def __init__(self, interval=0.01, max_depth=64):
+        """
+        Args:
+            interval: Seconds between samples.
+            max_depth: Deepest stack frames kept per sample.
+        """
+        self.interval = interval
+        self.max_depth = max_depth
+        self.samples = Counter()
+        self._stop = threading.Event()
+        self._thread = None
+
+    @property
+    def running(self):
+        return self._thread is not None
+
+    def start(self):
+        if self._thread is None:
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name='sampling-profiler', daemon=True)
+            self._thread.start()
+        return self
+
+    def _run(self):
+        own = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own:
+                    continue
+                stack = []
+                while frame is not None and len(stack) < self.max_depth:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({code.co_filename}:{code.co_firstlineno})")
+                    frame = frame.f_back
+                self.samples[';'.join(reversed(stack))] += 1
+
+    def stop(self):
+        thread, self._thread = self._thread, None
+        if thread is not None:
+            self._stop.set()
+            thread.join()
+
+    def collapsed(self):
+        """Samples as "frame;frame;frame count" lines, one per distinct stack."""
+        return ''.join(f"{stack} {count}\n" for stack, count in self.samples.most_common())
+
+    def clear(self):
+        self.samples.clear()
+
+class Metrics:
+    """Process-wide registry of stage timers, counters and latency histograms."""
+
+    def __init__(self):
+        self.enabled = False
+        self.profiler = None
+        self._counters = Counter()
+        self._histograms = {}
+        self._lock = threading.Lock()
+
+    def timed(self, stage, func, *args, **kwargs):
+        """Call func and record its duration under a pipeline stage."""
+        start = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            self.observe(stage, time.perf_counter() - start)
+
+    def observe(self, stage, seconds):
+        """Record one duration of a pipeline stage."""
+        with self._lock:
+            histogram = self._histograms.get(stage)
+            if histogram is None:
+                histogram = self._histograms[stage] = _Histogram()
+            histogram.observe(seconds)
+
+    def inc(self, name, value=1, **labels):
+        """Increase a counter, e.g. inc('verdicts', source='rules')."""
+        with self._lock:
+            self._counters[name, tuple(sorted(labels.items()))] += value
+
+    def collect(self):
+        """
+        Remove and return everything recorded since the last call.
+
+        Returns:
+            Picklable (counters, histograms) pair for merge, or None when
+            nothing was recorded.
+        """
+        with self._lock:
+            if not self._counters and not self._histograms:
+                return None
+            counters, self._counters = dict(self._counters), Counter()
+            histograms = {stage: (h.counts, h.sum, h.count) for stage, h in self._histograms.items()}
+            self._histograms = {}
+        return counters, histograms
+
+    def merge(self, recorded):
+        """Add values returned by collect in another process, e.g. a pool worker."""
+        counters, histograms = recorded
+        with self._lock:
+            self._counters.update(counters)
+            for stage, (counts, total, count) in histograms.items():
+                histogram = self._histograms.get(stage)
+                if histogram is None:
+                    histogram = self._histograms[stage] = _Histogram()
+                histogram.counts = [a + b for a, b in zip(histogram.counts, counts)]
+                histogram.sum += total
+                histogram.count += count
+
+    def init_worker(self, enabled):
+        """Start an empty registry in a pool worker, dropping state inherited from the parent by fork."""
+        self._lock = threading.Lock()
+        self._counters = Counter()
+        self._histograms = {}
+        self.profiler = None
+        self.enabled = enabled
+
+    def configure(self, settings):
+        """
+        Apply the metrics and profiler fields of compiled Settings.
+
+        They come from configuration entries such as:
+            {"metrics": true, "profiler": {"enabled": true, "interval": 0.005}}
+        """
+        self.enabled = settings.metrics
+        profiler = settings.profiler
+        if profiler['enabled']:
+            interval = profiler['interval']
+            if self.profiler is not None and self.profiler.interval != interval:
+                self.profiler.stop()
+                self.profiler = None
+            if self.profiler is None:
+                self.profiler = SamplingProfiler(interval)
+            self.profiler.start()
+        elif self.profiler is not None:
+            self.profiler.stop()
+
+    def export(self):
+        """Render all metrics in the Prometheus text exposition format."""
+        with self._lock:
+            counters = sorted(self._counters.items())
+            histograms = sorted((stage, list(h.counts), h.sum, h.count)
+                                for stage, h in self._histograms.items())
+
+        lines = []
+        seen = set()
+        for (name, labels), value in counters:
+            metric = f"{PREFIX}_{name}_total"
+            if metric not in seen:
+                seen.add(metric)
+                lines.append(f"# TYPE {metric} counter")
+            lines.append(f"{metric}{_labels(labels)} {value}")
+
+        if histograms:
+            metric = f"{PREFIX}_stage_seconds"
+            lines.append(f"# HELP {metric} Time spent in each pipeline stage.")
+            lines.append(f"# TYPE {metric} histogram")
+            for stage, counts, total, count in histograms:
+                cumulative = 0
+                for bound, bucket in zip(BUCKETS + ('+Inf',), counts):
+                    cumulative += bucket
+                    lines.append(f'{metric}_bucket{{stage="{stage}",le="{bound}"}} {cumulative}')
+                lines.append(f'{metric}_sum{{stage="{stage}"}} {total}')
+                lines.append(f'{metric}_count{{stage="{stage}"}} {count}')
+        return '\n'.join(lines) + '\n' if lines else ''
+
+    def reset(self):
+        """Drop all recorded values and profiler samples."""
+        with self._lock:
+            self._counters.clear()
+            self._histograms.clear()
+        if self.profiler is not None:
+            self.profiler.clear()
+
+# Process-wide registry used by all instrumented code
+metrics = Metrics()
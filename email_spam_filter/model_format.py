@@ -0,0 +1,130 @@
+"""Versioned binary model format with memory-mapped loading.
+
+A model file is laid out as::
+
+    MAGIC | header length (uint32, little endian) | JSON header | arrays
+
+The JSON header records the format version, the model kind, scalar metadata
+and, for every array, its dtype, shape and offset. Arrays are stored
+contiguously and aligned to 64 bytes, so loading maps the file read-only and
+wraps each array with ``np.frombuffer`` without copying. Processes that load
+the same file share one physical copy through the page cache.
+"""
+
+import json
+import mmap
+import os
+import struct
+
+import numpy as np
+
+MAGIC = b'ESFMODEL'
+FORMAT_VERSION = 1
+_ALIGNMENT = 64
+_LENGTH = struct.Struct('<I')
+
+def _align(offset):
+    return -(-offset // _ALIGNMENT) * _ALIGNMENT
+
+def encode_vocabulary(words):
+    """Pack a list of words into a newline-separated UTF-8 byte array."""
+    return np.frombuffer('\n'.join(words).encode('utf-8'), dtype=np.uint8)
+
+def decode_vocabulary(table):
+    """Unpack a vocabulary table written by encode_vocabulary."""
+    text = table.tobytes().decode('utf-8')
+    return text.split('\n') if text else []
+
+def write_model(path, kind, arrays, metadata=None):
+    """
+    Write arrays and metadata to a model file.
+
+    The file is written next to its destination and moved into place, so
+    readers never observe a partially written model.
+
+    Args:
+        path: Destination file path.
+        kind: Model kind recorded in the header, e.g. 'naive_bayes'.
+        arrays: Mapping of array name to NumPy array.
+        metadata: JSON-serialisable mapping of scalar settings.
+    """
+    arrays = {name: np.ascontiguousarray(array) for name, array in arrays.items()}
+    table = {}
+    offset = 0
+    for name, array in arrays.items():
+        table[name] = {'dtype': array.dtype.str, 'shape': list(array.shape), 'offset': offset}
+        offset = _align(offset + array.nbytes)
+
+    header = json.dumps({
+        'format_version': FORMAT_VERSION,
+        'kind': kind,
+        'metadata': metadata or {},
+        'arrays': table,
+    }).encode('utf-8')
+    data_start = _align(len(MAGIC) + _LENGTH.size + len(header))
+
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(MAGIC + _LENGTH.pack(len(header)) + header)
+        for name, array in arrays.items():
+            f.seek(data_start + table[name]['offset'])
+            f.write(array.tobytes())
+        f.truncate(data_start + offset)
+    os.replace(tmp_path, path)
+
+def is_model_file(path):
+    """Return True if the file starts with the model format magic bytes."""
+    with open(path, 'rb') as f:
+        return f.read(len(MAGIC)) == MAGIC
+
+def read_model(path):
+    """
+    Memory-map a model file.
+
+    Args:
+        path: Path of a file written by write_model.
+
+    Returns:
+        Tuple of (kind, metadata, arrays). The arrays are read-only views into
+        the mapping, which stays open for as long as any of them is referenced.
+    """
+    with open(path, 'rb') as f:
+        mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    if mapped[:len(MAGIC)] != MAGIC:
+        raise ValueError(f"{path} is not a spam filter model file.")
+    (header_length,) = _LENGTH.unpack_from(mapped, len(MAGIC))
+    header_start = len(MAGIC) + _LENGTH.size
+    header = json.loads(mapped[header_start:header_start + header_length].decode('utf-8'))
+    if header['format_version'] > FORMAT_VERSION:
+        raise ValueError(f"Model format version {header['format_version']} is not supported.")
+
+    data_start = _align(header_start + header_length)
+    arrays = {}
+    for name, spec in header['arrays'].items():
+        dtype = np.dtype(spec['dtype'])
+        count = int(np.prod(spec['shape'], dtype=np.int64))
+        array = np.frombuffer(mapped, dtype=dtype, count=count, offset=data_start + spec['offset'])
+        arrays[name] = array.reshape(spec['shape'])
+    return header['kind'], header['metadata'], arrays
+
+def read_model_of_kind(path, expected_kind):
+    """Memory-map a model file and check that it holds the expected kind of model."""
+    kind, metadata, arrays = read_model(path)
+    if kind != expected_kind:
+        raise ValueError(f"{path} holds a '{kind}' model, not '{expected_kind}'.")
+    return metadata, arrays
+
+def load_model(path):
+    """Load a model file as an instance of the class matching its kind."""
+    kind, metadata, arrays = read_model(path)
+    if kind in ('naive_bayes', 'svm'):
+        from .registry import load_algorithm
+        return load_algorithm(kind)._from_model_data(metadata, arrays)
+    if kind == 'neardup':
+        from .neardup import NearDuplicateIndex
+        return NearDuplicateIndex._from_model_data(metadata, arrays)
+    if kind == 'lite':
+        from .lite import load_scorer
+        return load_scorer(metadata, arrays)
+    raise ValueError(f"Unknown model kind '{kind}'.")
@@ -1,70 +1,307 @@
 import numpy as np
-from collections import defaultdict
+import os
+import threading
+from collections import Counter, namedtuple
+from itertools import count
 from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+from scipy import sparse
+from scipy.special import expit
 import cProfile
+from .metrics import metrics
+from .model_format import decode_vocabulary, encode_vocabulary, read_model_of_kind, write_model
+from .pool import _default_context, reset_lock_after_fork
+from .tokenizer import encode_batch, tokenize
+
+HAM, SPAM = 0, 1
+
+# Immutable view of the derived scoring arrays. Scorers grab one reference and
+# use it for a whole batch, so updates never change weights mid-batch. The
+# version is unique within the process and keys cached verdicts.
+_ScoringSnapshot = namedtuple('_ScoringSnapshot', ['word_log_odds', 'token_log_odds', 'prior_log_odds', 'version'])
+_snapshot_versions = count()
+
+def _empty_snapshot():
+    return _ScoringSnapshot(np.zeros(1, dtype=np.float32), 0.0, 0.0, next(_snapshot_versions))
+
+# Training corpus installed in each worker of train_parallel
+_corpus = ((), ())
+
+def _init_corpus(emails, labels):
+    """Install the training corpus in a worker; with fork it is inherited, not copied."""
+    global _corpus
+    _corpus = (emails, labels)
+
+def _merge_count_tables(left, right):
+    """Merge two (words, counts, document counts) tables into one."""
+    words, counts, class_counts = left
+    index = dict(zip(words, range(len(words))))
+    words = list(words)
+    for word in right[0]:
+        if word not in index:
+            index[word] = len(words)
+            words.append(word)
+
+    merged = np.zeros((2, len(words)), dtype=np.int64)
+    merged[:, :counts.shape[1]] = counts
+    ids = np.fromiter(map(index.__getitem__, right[0]), dtype=np.int64, count=len(right[0]))
+    merged[:, ids] += right[1]
+    return words, merged, class_counts + right[2]
 
 class NaiveBayesSpamFilter:
-    def __init__(self):
-        self.word_probs = {}
-        self.spam_prob = 0.0
-        self.ham_prob = 0.0
+    """Multinomial naive Bayes spam filter with a vectorized scoring engine.
+
+    Raw per-class word counts, token totals and document counts are the source
+    of truth; column 0 of the vocabulary index is reserved for unknown words.
+    With Laplace smoothing, log P(word | class) splits into a per-word term,
+    log(count + 1), and a per-class normaliser, log(total + |V|), so scoring a
+    batch of emails is a sparse document-term matrix times a per-word log-odds
+    vector plus a per-token correction. After an update only the words it
+    touched need their log-odds recomputed.
+    """
+
+    def __init__(self, cache=None):
+        """
+        Args:
+            cache: Optional VerdictCache; repeated emails are then scored once
+                per model version.
+        """
+        self.cache = cache
+        self.vocabulary = {}
+        self.class_counts = np.zeros(2, dtype=np.int64)
+        self.token_totals = np.zeros(2, dtype=np.int64)
+        self._word_counts = np.zeros((2, 1), dtype=np.int64)
+        self._touched = []
+        self._stale = False
+        self._lock = threading.Lock()
+        self._snapshot = _empty_snapshot()
+        reset_lock_after_fork(self)
+
+    @property
+    def version(self):
+        """Version of the current scoring weights; every update publishes a new one."""
+        return self._refresh().version
+
+    @property
+    def spam_prob(self):
+        total = self.class_counts.sum()
+        return self.class_counts[SPAM] / total if total else 0.0
+
+    @property
+    def ham_prob(self):
+        total = self.class_counts.sum()
+        return self.class_counts[HAM] / total if total else 0.0
 
     def train(self, emails, labels):
-        """Train the spam filter using naive Bayes algorithm."""
-        n_spams = sum(labels)
-        n_hams = len(labels) - n_spams
-        
-        # Initialize counts
-        word_counts_spam = defaultdict(int)
-        word_counts_ham = defaultdict(int)
-        
-        # Count words in spam and ham emails
+        """Train the spam filter using naive Bayes algorithm, discarding previous counts."""
+        self._reset()
+        self.partial_fit(emails, labels)
+        self._refresh()
+
+    def train_parallel(self, emails, labels, n_workers=None):
+        """
+        Train on a large corpus using several processes.
+
+        The corpus is split into one shard per worker. Each worker counts its
+        shard into a compact word list plus integer count array, and the
+        shard tables are merged pairwise in the pool, log2(n_workers) rounds
+        deep, before being folded into the model.
+
+        Args:
+            emails: Sequence of training emails.
+            labels: Sequence of labels (1 for spam, 0 for ham).
+            n_workers: Number of worker processes (defaults to the CPU count).
+        """
+        n_workers = max(1, min(n_workers or os.cpu_count() or 1, len(emails)))
+        bounds = np.linspace(0, len(emails), n_workers + 1).astype(int)
+        counter = type(self)()
+
+        with ProcessPoolExecutor(max_workers=n_workers, mp_context=_default_context(),
+                                 initializer=_init_corpus, initargs=(emails, labels)) as executor:
+            tables = list(executor.map(counter._count_corpus_range, bounds[:-1], bounds[1:]))
+            while len(tables) > 1:
+                merged = list(executor.map(_merge_count_tables, tables[0::2], tables[1::2]))
+                tables = merged + tables[len(merged) * 2:]
+
+        self._reset()
+        if tables:
+            self._add_counts(*tables[0])
+        self._refresh()
+
+    def _reset(self):
+        """Discard all counts and publish an empty snapshot."""
+        with self._lock:
+            self.vocabulary = {}
+            self.class_counts = np.zeros(2, dtype=np.int64)
+            self.token_totals = np.zeros(2, dtype=np.int64)
+            self._word_counts = np.zeros((2, 1), dtype=np.int64)
+            self._touched = []
+            self._snapshot = _empty_snapshot()
+
+    def partial_fit(self, emails, labels):
+        """
+        Update the model with additional labelled emails, e.g. user feedback.
+
+        Runs in O(tokens of the new emails). Derived log-probabilities are
+        refreshed lazily, on the next scoring call, and only for touched words.
+        """
+        self._add_counts(*self._count_words(emails, labels))
+
+    def _count_words(self, emails, labels):
+        """Count words per class into a (words, counts, document counts) table."""
+        word_counts = (Counter(), Counter())
+        n_emails = n_spams = 0
         for email, label in zip(emails, labels):
-            if label == 1:  # Spam
-                for word in self._tokenize(email):
-                    word_counts_spam[word] += 1
-            else:  # Ham
-                for word in self._tokenize(email):
-                    word_counts_ham[word] += 1
-
-        # Calculate probabilities
-        total_words_spam = sum(word_counts_spam.values())
-        total_words_ham = sum(word_counts_ham.values())
-
-        self.spam_prob = n_spams / len(labels)
-        self.ham_prob = n_hams / len(labels)
-
-        self.word_probs['spam'] = {word: (count + 1) / (total_words_spam + len(word_counts_spam))
-                                   for word, count in word_counts_spam.items()}
-        
-        self.word_probs['ham'] = {word: (count + 1) / (total_words_ham + len(word_counts_ham))
-                                  for word, count in word_counts_ham.items()}
+            is_spam = label == 1
+            word_counts[SPAM if is_spam else HAM].update(self._tokenize(email))
+            n_emails += 1
+            n_spams += is_spam
+
+        words = list(word_counts[HAM].keys() | word_counts[SPAM].keys())
+        counts = np.zeros((2, len(words)), dtype=np.int64)
+        for row in (HAM, SPAM):
+            counts[row] = np.fromiter(map(word_counts[row].get, words, repeat(0)),
+                                      dtype=np.int64, count=len(words))
+        return words, counts, np.array([n_emails - n_spams, n_spams], dtype=np.int64)
+
+    def _count_corpus_range(self, start, stop):
+        """Count one shard of the corpus installed in this worker by _init_corpus."""
+        return self._count_words(_corpus[0][start:stop], _corpus[1][start:stop])
+
+    def _add_counts(self, words, counts, class_counts):
+        """Fold a (words, counts, document counts) table into the model."""
+        with self._lock:
+            vocabulary = self.vocabulary
+            for word in words:
+                if word not in vocabulary:
+                    vocabulary[word] = len(vocabulary) + 1
+            self._ensure_capacity(len(vocabulary) + 1)
+
+            ids = np.fromiter(map(vocabulary.__getitem__, words), dtype=np.int64, count=len(words))
+            self._word_counts[:, ids] += counts
+            self.token_totals += counts.sum(axis=1)
+            self.class_counts += class_counts
+            self._touched.append(ids)
+            self._stale = True
+
+    def _ensure_capacity(self, size):
+        """Grow the count table geometrically; copy it first if it is a read-only mapping."""
+        capacity = self._word_counts.shape[1]
+        if capacity >= size and self._word_counts.flags.writeable:
+            return
+        grown = np.zeros((2, max(size, 2 * capacity)), dtype=np.int64)
+        grown[:, :capacity] = self._word_counts
+        self._word_counts = grown
+
+    def _scalar_log_odds(self):
+        """Per-token normaliser log-odds and class prior log-odds from the current totals."""
+        n_words = len(self.vocabulary)
+        denominators = np.maximum(self.token_totals + n_words, 1)
+        token_log_odds = np.log(denominators[HAM]) - np.log(denominators[SPAM])
+        # Add-one smoothing keeps the prior finite before both classes have been seen
+        prior_log_odds = np.log1p(self.class_counts[SPAM]) - np.log1p(self.class_counts[HAM])
+        return float(token_log_odds), float(prior_log_odds)
+
+    def _refresh(self):
+        """Publish a new scoring snapshot if counts changed since the last one."""
+        with self._lock:
+            if not self._stale:
+                return self._snapshot
+            previous = self._snapshot.word_log_odds
+            word_log_odds = np.zeros(len(self.vocabulary) + 1, dtype=np.float32)
+            word_log_odds[:len(previous)] = previous
+            if self._touched:
+                ids = np.unique(np.concatenate(self._touched))
+                counts = self._word_counts[:, ids]
+                word_log_odds[ids] = np.log1p(counts[SPAM]) - np.log1p(counts[HAM])
+
+            self._snapshot = _ScoringSnapshot(word_log_odds, *self._scalar_log_odds(), next(_snapshot_versions))
+            self._touched = []
+            self._stale = False
+            return self._snapshot
+
+    def save(self, path):
+        """Save the trained model in the binary model format."""
+        snapshot = self._refresh()
+        with self._lock:
+            words = sorted(self.vocabulary, key=self.vocabulary.get)
+            write_model(path, 'naive_bayes', {
+                'vocabulary': encode_vocabulary(words),
+                'word_counts': self._word_counts[:, :len(words) + 1],
+                'word_log_odds': snapshot.word_log_odds.astype(np.float32),
+            }, {
+                'class_counts': self.class_counts.tolist(),
+                'token_totals': self.token_totals.tolist(),
+            })
+
+    @classmethod
+    def load(cls, path):
+        """Load a model saved with save; the arrays stay memory-mapped."""
+        return cls._from_model_data(*read_model_of_kind(path, 'naive_bayes'))
+
+    @classmethod
+    def _from_model_data(cls, metadata, arrays):
+        model = cls()
+        words = decode_vocabulary(arrays['vocabulary'])
+        model.vocabulary = dict(zip(words, range(1, len(words) + 1)))
+        model.class_counts = np.array(metadata['class_counts'], dtype=np.int64)
+        model.token_totals = np.array(metadata['token_totals'], dtype=np.int64)
+        model._word_counts = arrays['word_counts']
+        model._snapshot = _ScoringSnapshot(arrays['word_log_odds'], *model._scalar_log_odds(),
+                                           next(_snapshot_versions))
+        return model
 
     def _tokenize(self, email):
         """Tokenize the email text into words."""
-        return email.lower().split()
+        return tokenize(email)
+
+    def _vectorize(self, emails, n_columns):
+        """Build the sparse document-term count matrix for a batch of emails."""
+        indices, indptr = encode_batch(emails, self.vocabulary)
+        # Words added by a concurrent update are unknown to this snapshot
+        indices[indices >= n_columns] = 0
+        data = np.ones(len(indices), dtype=np.float32)
+        return sparse.csr_matrix((data, indices, indptr), shape=(len(indptr) - 1, n_columns))
+
+    def decision_function(self, emails):
+        """Return the spam-vs-ham log-odds for each email in the batch."""
+        snapshot = self._refresh() if self._stale else self._snapshot
+        if self.cache is None:
+            return self._score(snapshot, emails)
+        scores = self.cache.compute(snapshot.version, emails, lambda missing: self._score(snapshot, missing))
+        return np.array(scores, dtype=np.float64)
+
+    def _score(self, snapshot, emails):
+        if metrics.enabled:
+            counts = metrics.timed('vectorize', self._vectorize, emails, len(snapshot.word_log_odds))
+        else:
+            counts = self._vectorize(emails, len(snapshot.word_log_odds))
+        n_tokens = np.diff(counts.indptr)
+        return (counts @ snapshot.word_log_odds + n_tokens * snapshot.token_log_odds
+                + snapshot.prior_log_odds)
+
+    def predict_proba(self, emails):
+        """Return the probability of each email being spam."""
+        return expit(self.decision_function(emails))
 
     def predict(self, emails):
         """Predict if emails are spam or ham."""
-        with ProcessPoolExecutor() as executor:
-            results = list(executor.map(self._predict_single_email, emails))
-        return results
+        return (self.decision_function(emails) > 0).astype(int)
 
     def _predict_single_email(self, email):
         """Calculate probability for a single email being spam or ham."""
-        words = self._tokenize(email)
-        log_prob_spam = np.log(self.spam_prob)
-        log_prob_ham = np.log(self.ham_prob)
-
-        for word in words:
-            prob_word_given_spam = self.word_probs['spam'].get(word, 1 / (sum(self.word_probs['spam'].values()) + len(words)))
-            prob_word_given_ham = self.word_probs['ham'].get(word, 1 / (sum(self.word_probs['ham'].values()) + len(words)))
+        return int(self.predict([email])[0])
 
-            log_prob_spam += np.log(prob_word_given_spam)
-            log_prob_ham += np.log(prob_word_given_ham)
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state['_lock']
+        return state
 
-        return 1 if log_prob_spam > log_prob_ham else 0
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+        reset_lock_after_fork(self)
 
     def profile_training(self, emails, labels):
         """Profile the training process to identify bottlenecks."""
-        cProfile.runctx('self.train(emails, labels)', globals(), locals())
\ No newline at end of file
+        cProfile.runctx('self.train(emails, labels)', globals(), locals())
@@ -0,0 +1,156 @@
+"""Near-duplicate index of confirmed spam using MinHash and LSH banding.
+
+Each message is reduced to the set of adjacent token pairs produced by the
+shared tokenizer, and that set to a MinHash signature of ``num_perm`` 32-bit
+values whose agreement rate estimates the Jaccard similarity of two messages.
+Signatures are split into ``bands`` bands that are hashed into one table per
+band; two messages become candidates when any band matches exactly, which for
+similar messages is very likely and for dissimilar ones very unlikely. Insert
+and query therefore cost one dictionary operation per band, and only the few
+candidates found are compared in full.
+
+The index keeps the ``max_items`` most recently added messages, evicting the
+oldest first, and is saved in the binary model format.
+"""
+
+import threading
+import zlib
+
+import numpy as np
+from .model_format import read_model_of_kind, write_model
+from .tokenizer import tokenize
+
+_GOLDEN = np.uint64(0x9E3779B97F4A7C15)
+_SHIFT = np.uint64(32)
+
+class NearDuplicateIndex:
+    """Bounded LSH index answering "is this close to known spam?"."""
+
+    def __init__(self, num_perm=128, bands=16, threshold=0.8, max_items=100000, seed=1):
+        """
+        Args:
+            num_perm: Number of MinHash values per signature.
+            bands: Number of LSH bands; num_perm must be a multiple of it. With
+                rows = num_perm / bands, pairs with similarity s become
+                candidates with probability 1 - (1 - s**rows)**bands.
+            threshold: Estimated Jaccard similarity at which a message is
+                considered a duplicate of indexed spam.
+            max_items: Maximum number of signatures kept.
+            seed: Seed of the hash permutations; indexes only compare with
+                signatures made with the same seed.
+        """
+        if num_perm % bands:
+            raise ValueError("num_perm must be a multiple of bands.")
+        self.num_perm = num_perm
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.threshold = threshold
+        self.max_items = max_items
+        self.seed = seed
+
+        rng = np.random.default_rng(seed)
+        self._a = rng.integers(1, 2**63, size=num_perm, dtype=np.uint64) * np.uint64(2) + np.uint64(1)
+        self._b = rng.integers(0, 2**63, size=num_perm, dtype=np.uint64)
+        self._signatures = np.zeros((max_items, num_perm), dtype=np.uint32)
+        self._tables = [{} for _ in range(bands)]
+        self._added = 0
+        self._lock = threading.Lock()
+
+    def signature(self, text):
+        """MinHash signature of a text, or None if it has no tokens."""
+        tokens = tokenize(text)
+        if not tokens:
+            return None
+        hashes = np.fromiter((zlib.crc32(token.encode('utf-8', 'surrogatepass')) for token in tokens),
+                             dtype=np.uint64, count=len(tokens))
+        if len(hashes) > 1:
+            hashes = hashes[:-1] * _GOLDEN + hashes[1:]
+        shingles = np.unique(hashes)
+        return ((shingles[:, None] * self._a + self._b) >> _SHIFT).min(axis=0).astype(np.uint32)
+
+    def _band_keys(self, signature):
+        rows = self.rows
+        return [signature[i * rows:(i + 1) * rows].tobytes() for i in range(self.bands)]
+
+    def _insert(self, signature):
+        slot = self._added % self.max_items
+        if self._added >= self.max_items:
+            for table, key in zip(self._tables, self._band_keys(self._signatures[slot])):
+                slots = table[key]
+                slots.remove(slot)
+                if not slots:
+                    del table[key]
+        self._signatures[slot] = signature
+        for table, key in zip(self._tables, self._band_keys(signature)):
+            table.setdefault(key, []).append(slot)
+        self._added += 1
+
+    def add(self, texts):
+        """Index confirmed spam messages."""
+        signatures = [self.signature(text) for text in texts]
+        with self._lock:
+            for signature in signatures:
+                if signature is not None:
+                    self._insert(signature)
+
+    def similarity(self, texts):
+        """Highest estimated similarity of each text to any indexed message, 0 if none is close."""
+        signatures = [self.signature(text) for text in texts] if len(self) else [None] * len(texts)
+        results = np.zeros(len(texts))
+        with self._lock:
+            for i, signature in enumerate(signatures):
+                if signature is None:
+                    continue
+                candidates = set()
+                for table, key in zip(self._tables, self._band_keys(signature)):
+                    candidates.update(table.get(key, ()))
+                if candidates:
+                    matches = self._signatures[list(candidates)] == signature
+                    results[i] = matches.mean(axis=1).max()
+        return results
+
+    def match(self, texts):
+        """Whether each text is a near-duplicate of indexed spam."""
+        return self.similarity(texts) >= self.threshold
+
+    def __len__(self):
+        return min(self._added, self.max_items)
+
+    def clear(self):
+        with self._lock:
+            self._tables = [{} for _ in range(self.bands)]
+            self._added = 0
+
+    def save(self, path):
+        """Save the indexed signatures, oldest first, in the binary model format."""
+        with self._lock:
+            n = len(self)
+            order = (np.arange(n) + self._added) % self.max_items if self._added > n else np.arange(n)
+            write_model(path, 'neardup', {'signatures': self._signatures[order]}, {
+                'num_perm': self.num_perm,
+                'bands': self.bands,
+                'threshold': self.threshold,
+                'max_items': self.max_items,
+                'seed': self.seed,
+            })
+
+    @classmethod
+    def load(cls, path):
+        """Load an index saved with save; it can keep growing afterwards."""
+        return cls._from_model_data(*read_model_of_kind(path, 'neardup'))
+
+    @classmethod
+    def _from_model_data(cls, metadata, arrays):
+        index = cls(**metadata)
+        for signature in arrays['signatures']:
+            index._insert(signature)
+        return index
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state['_lock']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
@@ -0,0 +1,148 @@
+"""Long-lived worker pool for scoring emails with preloaded models."""
+
+import multiprocessing
+import os
+import queue
+import threading
+import weakref
+from concurrent.futures import Future, ProcessPoolExecutor
+from .metrics import metrics
+
+# Scorers installed in each worker process by _init_worker
+_worker_scorers = {}
+
+# Objects whose _lock is replaced in forked children. Workers fork from
+# whichever thread submits first, and a lock another thread held at that
+# moment would stay held forever in the child.
+_fork_locked = weakref.WeakSet()
+
+def reset_lock_after_fork(obj):
+    """Give obj a new, released _lock in every process forked from this one."""
+    _fork_locked.add(obj)
+    return obj
+
+def _reset_locks():
+    for obj in list(_fork_locked):
+        obj._lock = threading.Lock()
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_locks)
+
+def _init_worker(scorers, record_metrics=False):
+    """Keep the scorers handed to this worker for the lifetime of the process."""
+    global _worker_scorers
+    _worker_scorers = scorers
+    metrics.init_worker(record_metrics)
+
+def _score_batch(name, emails):
+    """Score a batch of emails with one of the worker's preloaded scorers."""
+    results = list(_worker_scorers[name](emails))
+    return results, metrics.collect() if metrics.enabled else None
+
+def _forward(source, target):
+    """Merge the metrics a worker recorded for a batch and pass its results on."""
+    if source.cancelled():
+        target.cancel()
+        return
+    error = source.exception()
+    if error is not None:
+        target.set_exception(error)
+        return
+    results, recorded = source.result()
+    if recorded is not None:
+        metrics.merge(recorded)
+    target.set_result(results)
+
+def _default_context():
+    """Prefer fork so workers inherit trained models instead of unpickling them."""
+    if 'fork' in multiprocessing.get_all_start_methods():
+        return multiprocessing.get_context('fork')
+    return multiprocessing.get_context()
+
+class ScoringPool:
+    """Process pool that is started once and reused for every scoring request.
+
+    Each worker receives the scorers exactly once, at start-up, so requests
+    only carry the emails themselves. The number of in-flight batches is
+    bounded by ``max_pending``; once that many are queued, ``submit`` blocks
+    (or raises ``queue.Full`` after ``timeout`` seconds) until a batch finishes.
+    Workers record metrics when they were enabled as the pool started, and
+    return them with each batch to be merged into this process's registry.
+    """
+
+    def __init__(self, scorers, max_workers=None, max_pending=1024):
+        """
+        Args:
+            scorers: Mapping of name to a callable taking a list of emails and
+                returning one result per email.
+            max_workers: Number of worker processes (defaults to the CPU count).
+            max_pending: Maximum number of batches queued or running at once.
+        """
+        self.scorers = dict(scorers)
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.max_pending = max_pending
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._executor = None
+        self._lock = threading.Lock()
+
+    def start(self):
+        """Start the worker processes if they are not running yet."""
+        with self._lock:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(max_workers=self.max_workers,
+                                                     mp_context=_default_context(),
+                                                     initializer=_init_worker,
+                                                     initargs=(self.scorers, metrics.enabled))
+        return self
+
+    def submit(self, name, emails, timeout=None):
+        """
+        Queue a batch of emails for scoring.
+
+        Args:
+            name: Name of the scorer to use.
+            emails: List of emails to score.
+            timeout: Seconds to wait for a free slot; None waits indefinitely.
+
+        Returns:
+            Future resolving to the list of results for the batch.
+        """
+        if name not in self.scorers:
+            raise ValueError(f"Scorer '{name}' is not registered with this pool.")
+        if self._executor is None:
+            self.start()
+        if not self._slots.acquire(timeout=timeout):
+            raise queue.Full(f"Scoring pool has {self.max_pending} batches pending.")
+        try:
+            pending = self._executor.submit(_score_batch, name, list(emails))
+        except BaseException:
+            self._slots.release()
+            raise
+        future = Future()
+        pending.add_done_callback(lambda _: self._slots.release())
+        pending.add_done_callback(lambda done: _forward(done, future))
+        return future
+
+    def map(self, name, emails, batch_size=None):
+        """Score emails in batches across the workers and return results in order."""
+        emails = list(emails)
+        if not emails:
+            return []
+        if batch_size is None:
+            batch_size = -(-len(emails) // self.max_workers)
+        futures = [self.submit(name, emails[i:i + batch_size])
+                   for i in range(0, len(emails), batch_size)]
+        return [result for future in futures for result in future.result()]
+
+    def close(self):
+        """Stop the worker processes, waiting for queued batches to finish."""
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=True)
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
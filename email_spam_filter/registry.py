@@ -0,0 +1,25 @@
+"""Registry of the spam detection algorithms, imported on first use.
+
+The algorithm backends pull in heavy dependencies: scipy for Naive Bayes,
+scikit-learn for the SVM and TensorFlow for the CNN and RNN. Only the module
+of an algorithm that is actually used gets imported, so the command-line tools
+and a Naive Bayes-only process never load TensorFlow.
+"""
+
+import importlib
+
+# Algorithm name, as used for "algorithm" and "models" in config.json, to the
+# module and attribute implementing it
+ALGORITHMS = {
+    'naive_bayes': ('.naive_bayes', 'NaiveBayesSpamFilter'),
+    'svm': ('.svm', 'SpamFilterSVM'),
+    'cnn': ('.cnn', 'build_cnn_model'),
+    'rnn': ('.rnn', 'RnnSpamDetector'),
+}
+
+def load_algorithm(name):
+    """Import the backend of an algorithm and return its model class or builder."""
+    if name not in ALGORITHMS:
+        raise ValueError(f"Algorithm '{name}' is not supported.")
+    module, attribute = ALGORITHMS[name]
+    return getattr(importlib.import_module(module, __package__), attribute)
@@ -0,0 +1,143 @@
+"""Versioned configuration snapshots and a debounced file watcher for hot reload.
+
+Everything the scoring path needs from ``config.json``, the environment and
+any command-line overrides (the compiled Settings, the model files they name
+and the cascade built over those models) is loaded into an immutable
+``Snapshot`` away from the scoring path. The owner publishes it by replacing
+a single reference, so a batch that already holds the previous snapshot
+finishes on it and no lock is taken while scoring.
+"""
+
+import os
+import threading
+from collections import namedtuple
+from types import MappingProxyType
+from . import model_format
+from .cascade import build_cascade
+from .config import load_settings
+
+# Watchdog events that do not change a file
+_READ_EVENTS = ('opened', 'closed_no_write')
+
+Snapshot = namedtuple('Snapshot', ['version', 'settings', 'models', 'cascade'])
+
+def load_snapshot(config_path, version, default_algorithm='naive_bayes', extra_models=None, overrides=None):
+    """
+    Load the settings of a configuration file and their models into a Snapshot.
+
+    Args:
+        config_path: Path to config.json.
+        version: Version number given to the snapshot.
+        default_algorithm: Algorithm used when neither the file, the
+            environment nor the overrides name one.
+        extra_models: Optional mapping of algorithm name to an in-memory model,
+            taking precedence over model files of the same name.
+        overrides: Optional configuration values taking precedence over the
+            file and the environment, e.g. from the command line.
+
+    Returns:
+        The new Snapshot. Raises OSError or ValueError if the file or one of
+        its model files cannot be loaded.
+    """
+    settings = load_settings(config_path, overrides, defaults={'algorithm': default_algorithm})
+    # Model files are memory-mapped, so loading one is cheap even when unchanged
+    models = {name: model_format.load_model(path)
+              for name, path in settings.models.items()
+              if name not in (extra_models or {})}
+    models.update(extra_models or {})
+    return Snapshot(
+        version=version,
+        settings=settings,
+        models=MappingProxyType(models),
+        cascade=build_cascade(models, settings.cascade),
+    )
+
+class FileWatcher:
+    """Calls a function once after each burst of changes to a set of files.
+
+    Editors and deploy tools typically produce several events per save
+    (truncate, write, rename). Each event restarts a timer, and the callback
+    runs on the timer thread once the files have been quiet for ``debounce``
+    seconds.
+    """
+
+    def __init__(self, paths, callback, debounce=0.25):
+        """
+        Args:
+            paths: Files to watch.
+            callback: Function called without arguments after a burst of changes.
+            debounce: Seconds without further events before the callback runs.
+        """
+        self.paths = frozenset(os.path.abspath(path) for path in paths)
+        self.callback = callback
+        self.debounce = debounce
+        self._timer = None
+        self._lock = threading.Lock()
+        self._observer = None
+        self._handler = None
+        self._directories = set()
+
+    def start(self):
+        """Start watching the directories holding the files."""
+        from watchdog.events import FileSystemEventHandler
+        from watchdog.observers import Observer
+
+        watcher = self
+
+        class _Handler(FileSystemEventHandler):
+            def on_any_event(self, event):
+                # Reading the files during a reload must not schedule another one
+                if event.event_type in _READ_EVENTS:
+                    return
+                if {event.src_path, getattr(event, 'dest_path', '')} & watcher.paths:
+                    watcher._schedule()
+
+        self._observer = Observer()
+        self._handler = _Handler()
+        with self._lock:
+            self._watch_directories()
+        self._observer.daemon = True
+        self._observer.start()
+        return self
+
+    def _watch_directories(self):
+        for directory in {os.path.dirname(path) for path in self.paths} - self._directories:
+            self._observer.schedule(self._handler, path=directory, recursive=False)
+            self._directories.add(directory)
+
+    def set_paths(self, paths):
+        """
+        Replace the watched files, e.g. with the model files of a reloaded configuration.
+
+        Directories of new files are added to the observer; directories no
+        longer needed stay observed, but their events are ignored.
+        """
+        with self._lock:
+            self.paths = frozenset(os.path.abspath(path) for path in paths)
+            if self._observer is not None:
+                self._watch_directories()
+
+    def _schedule(self):
+        with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+            self._timer = threading.Timer(self.debounce, self.callback)
+            self._timer.daemon = True
+            self._timer.start()
+
+    def join(self):
+        """Block until the watcher is stopped."""
+        if self._observer is not None:
+            self._observer.join()
+
+    def stop(self):
+        """Stop watching and drop any pending callback."""
+        with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+        if self._observer is not None:
+            self._observer.stop()
+            self._observer.join()
+            self._observer = None
+            self._directories = set()
@@ -1,51 +1,120 @@
 import numpy as np
-from keras.models import Sequential
-from keras.layers import Embedding, SimpleRNN, Dense
+from .inference import engine_for
+from .metrics import metrics
+from .sequence import SequenceEncoder, bucket_rows, sequence_lengths
 
 class RnnSpamDetector:
-    def __init__(self, vocab_size, embedding_dim=50, rnn_units=64):
+    """SimpleRNN over token IDs, where ID 0 is padding and is masked out.
+
+    With bucketing, rows are grouped by length and each group is trimmed to
+    the narrowest bucket width holding its longest row, so the RNN runs only
+    as many timesteps as the group needs. Since padding is masked, this gives
+    the same probabilities as feeding full-width rows. Inputs must be padded
+    after the tokens, as SequenceEncoder does by default.
+    """
+
+    def __init__(self, vocab_size, embedding_dim=50, rnn_units=64, buckets=None):
+        """
+        Args:
+            vocab_size: Number of token IDs, including padding and unknown.
+            embedding_dim: Size of the token embeddings.
+            rnn_units: Size of the recurrent state.
+            buckets: None to feed full-width rows, True to bucket with
+                sequence.default_boundaries, or increasing bucket widths.
+        """
         self.vocab_size = vocab_size
         self.embedding_dim = embedding_dim
         self.rnn_units = rnn_units
+        self.buckets = buckets
         self.model = self._build_model()
 
     def _build_model(self):
+        # Keras is imported on first use so importing this module stays cheap
+        from keras.models import Sequential
+        from keras.layers import Embedding, SimpleRNN, Dense
+
         model = Sequential()
-        model.add(Embedding(input_dim=self.vocab_size, output_dim=self.embedding_dim))
+        model.add(Embedding(input_dim=self.vocab_size, output_dim=self.embedding_dim, mask_zero=True))
         model.add(SimpleRNN(units=self.rnn_units))
         model.add(Dense(1, activation='sigmoid'))
         
         model.compile(optimizer='adam', loss='binary_crossentropy', metrics=['accuracy'])
         return model
 
-    def train(self, X_train, y_train, epochs=5):
-        self.model.fit(X_train, y_train, epochs=epochs)
+    def _bucket(self, X):
+        """Group rows by length, recording the timesteps spent on padding when metrics are on."""
+        lengths = sequence_lengths(X)
+        groups = bucket_rows(X, None if self.buckets is True else self.buckets, lengths)
+        if metrics.enabled:
+            tokens = int(lengths.sum())
+            metrics.inc('rnn_timesteps', tokens, kind='token')
+            metrics.inc('rnn_timesteps', sum(batch.size for _, batch in groups) - tokens, kind='padding')
+        return groups
 
-    def predict(self, X_test):
-        predictions = self.model.predict(X_test)
-        return (predictions > 0.5).astype(int)
-
-def preprocess_email(email_content, vocab_dict, max_length):
-    tokenized_email = [vocab_dict.get(word, 1) for word in email_content.lower().split()]
-    padded_email = np.pad(tokenized_email, 
-                          (0, max(0, max_length - len(tokenized_email))), 
-                          'constant', constant_values=0)
-    
-    return padded_email[:max_length]
+    def train(self, X_train, y_train=None, epochs=5, batch_size=32, seed=None):
+        """
+        Train on padded token IDs.
 
-# Example usage:
-# vocab_dict and max_length need to be defined based on the dataset used for training.
+        Args:
+            X_train: (batch, max_length) matrix of token IDs, or, with y_train
+                None, a re-iterable stream of (X, y) batches read from disk,
+                such as streaming.Corpus.dataset(encoder).
+            y_train: Labels of X_train, or None for a stream of batches.
+            epochs: Number of passes over the data.
+            batch_size: Minibatch size for in-memory data.
+            seed: Seed of the bucketed minibatch order.
+        """
+        if y_train is None:
+            self._train_stream(X_train, epochs)
+            return
+        if not self.buckets:
+            self.model.fit(X_train, y_train, epochs=epochs, batch_size=batch_size)
+            return
+        # Each minibatch comes from one bucket; their order is shuffled every epoch
+        X_train = np.asarray(X_train, dtype=np.int32)
+        y_train = np.asarray(y_train, dtype=np.float32)
+        batches = [(X[start:start + batch_size], y_train[indices[start:start + batch_size]])
+                   for indices, X in self._bucket(X_train)
+                   for start in range(0, len(indices), batch_size)]
+        rng = np.random.default_rng(seed)
+        for _ in range(epochs):
+            for i in rng.permutation(len(batches)):
+                self.model.train_on_batch(*batches[i])
 
-This code provides a basic implementation of an RNN-based spam detector using Keras. The `RnnSpamDetector` class encapsulates the model building, training, and prediction processes. 
+    def _train_stream(self, batches, epochs):
+        """Train on streamed (X, y) batches, splitting each one into buckets when bucketing."""
+        if not self.buckets:
+            self.model.fit(batches, epochs=epochs)
+            return
+        for _ in range(epochs):
+            stream = batches.as_numpy_iterator() if hasattr(batches, 'as_numpy_iterator') else batches
+            for X, y in stream:
+                y = np.asarray(y, dtype=np.float32)
+                for indices, X_bucket in self._bucket(np.asarray(X, dtype=np.int32)):
+                    self.model.train_on_batch(X_bucket, y[indices])
 
-- **Initialization**: The constructor initializes necessary parameters like vocabulary size, embedding dimensions, and units in the RNN layer.
-  
-- **Model Building**: A simple sequential model is created with an Embedding layer followed by a SimpleRNN layer and a Dense output layer with sigmoid activation for binary classification.
+    def predict_proba(self, X_test):
+        # Scored in-process through the model's shared, traced inference engine
+        X_test = np.asarray(X_test, dtype=np.int32)
+        engine = engine_for(self.model)
+        if not self.buckets:
+            return engine.predict(X_test)
+        probabilities = np.empty(len(X_test), dtype=np.float32)
+        for indices, X in self._bucket(X_test):
+            probabilities[indices] = engine.predict(X)
+        return probabilities
 
-- **Training**: The `train` method allows fitting the model to training data.
+    def predict(self, X_test):
+        predictions = self.predict_proba(X_test).reshape(-1, 1)
+        return (predictions > 0.5).astype(int)
 
-- **Prediction**: The `predict` method returns binary predictions based on a threshold of 0.5.
+def preprocess_email(email_content, vocab_dict, max_length):
+    """Encode one email into a zero-padded row of token IDs; unknown words map to 1."""
+    return preprocess_emails([email_content], vocab_dict, max_length)[0]
 
-- **Preprocessing**: A utility function `preprocess_email` tokenizes and pads email content, converting it into a numerical format suitable for input to the RNN model.
+def preprocess_emails(emails, vocab_dict, max_length):
+    """Encode a batch of emails into a zero-padded (batch, max_length) int32 matrix in one pass."""
+    return SequenceEncoder(vocab_dict, max_length).encode(emails)
 
-This setup assumes you have already prepared your dataset with necessary preprocessing steps like building a vocabulary dictionary (`vocab_dict`) and defining `max_length`, which should be the length of the longest sequence in your training data. Adjust these aspects based on your specific use case and dataset.
\ No newline at end of file
+# Example usage:
+# vocab_dict and max_length need to be defined based on the dataset used for training.
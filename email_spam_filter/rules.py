@@ -0,0 +1,101 @@
+"""Sender whitelist and blacklist rules applied before any model is run.
+
+Entries containing ``@`` match one address exactly and are kept in a hashed
+dictionary. Every other entry is a domain, which also matches all of its
+subdomains; domains are stored in a trie keyed by reversed labels, so
+``mail.spammydomain.com`` is looked up as ``com`` -> ``spammydomain`` ->
+``mail`` and costs one dictionary lookup per label however many domains are
+listed. An exact address beats a domain and a deeper domain beats a shallower
+one, so ``trusted.example.com`` can be whitelisted inside a blacklisted
+``example.com``; when both lists name the same entry the whitelist wins.
+
+A compiled RuleSet is never modified. Reloading builds a new one and replaces
+the reference to it, so a lookup always sees one complete set of rules.
+"""
+
+from email.utils import parseaddr
+
+WHITELISTED, BLACKLISTED = False, True
+
+# Key marking the end of a domain in the trie; labels are never empty
+_VERDICT = ''
+
+def _normalise(entry):
+    """Lower-case an address or domain and drop surrounding brackets and dots."""
+    return entry.strip().strip('<>').strip('.').lower()
+
+def sender_address(sender):
+    """Extract the bare address from a From header or an SMTP envelope sender."""
+    if '<' in sender or '(' in sender:
+        sender = parseaddr(sender)[1]
+    return _normalise(sender)
+
+class RuleSet:
+    """Immutable compiled whitelist and blacklist."""
+
+    __slots__ = ('_addresses', '_domains', 'size')
+
+    def __init__(self, whitelist=(), blacklist=()):
+        """
+        Args:
+            whitelist: Addresses or domains never marked as spam.
+            blacklist: Addresses or domains always marked as spam.
+        """
+        addresses = {}
+        domains = {}
+        size = 0
+        # Blacklist first so that whitelist entries overwrite identical ones
+        for entries, verdict in ((blacklist, BLACKLISTED), (whitelist, WHITELISTED)):
+            for entry in entries:
+                entry = _normalise(entry).lstrip('*.').lstrip('@')
+                if not entry:
+                    continue
+                size += 1
+                if '@' in entry:
+                    addresses[entry] = verdict
+                    continue
+                node = domains
+                for label in reversed(entry.split('.')):
+                    node = node.setdefault(label, {})
+                node[_VERDICT] = verdict
+
+        self._addresses = addresses
+        self._domains = domains
+        self.size = size
+
+    def match(self, sender):
+        """
+        Look up a sender.
+
+        Args:
+            sender: From header or envelope sender, e.g. ``"Bob <bob@example.com>"``.
+
+        Returns:
+            True if the sender is blacklisted, False if it is whitelisted, and
+            None if no rule applies and the models have to decide.
+        """
+        if not sender:
+            return None
+        address = sender_address(sender)
+        verdict = self._addresses.get(address)
+        if verdict is not None:
+            return verdict
+
+        node = self._domains
+        for label in reversed(address.rpartition('@')[2].split('.')):
+            node = node.get(label)
+            if node is None:
+                break
+            verdict = node.get(_VERDICT, verdict)
+        return verdict
+
+    def match_batch(self, senders):
+        """Look up a batch of senders; see match."""
+        return [self.match(sender) for sender in senders]
+
+    def __len__(self):
+        return self.size
+
+def compile_rules(config):
+    """Compile the whitelist and blacklist of a configuration dictionary."""
+    return RuleSet(config.get('whitelist') or (), config.get('blacklist') or ())
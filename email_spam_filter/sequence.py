@@ -0,0 +1,179 @@
+"""Batch encoding of emails into padded integer-ID matrices for the neural models.
+
+The RNN and CNN take fixed-width rows of token IDs. ``SequenceEncoder``
+tokenizes a whole batch, truncates the token lists, maps them to one flat
+array of IDs and copies it into a preallocated ``int32`` matrix with a single
+masked assignment, instead of building, padding and slicing one array per
+email. ID 0 is padding and
+ID 1 marks tokens missing from the vocabulary.
+
+Most emails are far shorter than the longest one a model accepts. With
+bucketing, each email is placed in the narrowest of a few fixed widths that
+holds it, so a recurrent model does not spend timesteps on padding, and the
+number of distinct input shapes stays small.
+"""
+
+from collections import Counter
+from functools import partial
+from itertools import chain, islice, repeat
+import numpy as np
+from .metrics import metrics
+from .tokenizer import default_tokenizer, tokenize
+
+PAD = 0
+OOV = 1
+
+POLICIES = ('pre', 'post')
+
+def build_vocabulary(texts, max_size=None, reserved=2):
+    """
+    Assign token IDs by descending frequency.
+
+    Args:
+        texts: Iterable of training texts.
+        max_size: Optional bound on the IDs, counting the reserved ones, e.g.
+            the input_dim of an Embedding layer.
+        reserved: Number of leading IDs kept for padding and unknown tokens.
+
+    Returns:
+        Dictionary mapping token to ID.
+    """
+    counts = Counter()
+    for text in texts:
+        counts.update(tokenize(text))
+    n = None if max_size is None else max(max_size - reserved, 0)
+    return {token: i for i, (token, _) in enumerate(counts.most_common(n), start=reserved)}
+
+def default_boundaries(max_length, smallest=16):
+    """Bucket widths doubling from smallest up to and including max_length."""
+    boundaries = []
+    width = smallest
+    while width < max_length:
+        boundaries.append(width)
+        width *= 2
+    boundaries.append(max_length)
+    return tuple(boundaries)
+
+def sequence_lengths(X):
+    """Number of tokens in each row of a post-padded matrix, up to its last non-padding ID."""
+    X = np.asarray(X)
+    return np.where(X != PAD, np.arange(1, X.shape[1] + 1), 0).max(axis=1, initial=0)
+
+def bucket_rows(X, boundaries=None, lengths=None):
+    """
+    Group the rows of a post-padded matrix by length and trim each group.
+
+    Args:
+        X: (batch, max_length) matrix of token IDs padded after the tokens.
+        boundaries: Increasing bucket widths; defaults to
+            default_boundaries(max_length). max_length is always the last
+            width, so no tokens are dropped.
+        lengths: Optional precomputed sequence_lengths(X).
+
+    Returns:
+        List of (indices, X[indices, :width]) pairs, one per non-empty bucket.
+    """
+    X = np.asarray(X)
+    max_length = X.shape[1]
+    boundaries = default_boundaries(max_length) if boundaries is None else boundaries
+    boundaries = np.unique(np.append(np.minimum(boundaries, max_length), max_length))
+    lengths = sequence_lengths(X) if lengths is None else lengths
+    buckets = np.searchsorted(boundaries, lengths)
+    return [(indices, X[indices, :int(boundaries[bucket])])
+            for bucket in np.unique(buckets)
+            for indices in (np.flatnonzero(buckets == bucket),)]
+
+class SequenceEncoder:
+    """Encodes batches of emails into (batch, length) int32 matrices of token IDs."""
+
+    def __init__(self, vocabulary, max_length, padding='post', truncating='post', oov=OOV):
+        """
+        Args:
+            vocabulary: Mapping of token to ID used in training.
+            max_length: Width of the encoded rows.
+            padding: 'post' pads after the tokens, 'pre' before them.
+            truncating: 'post' drops tokens past max_length, 'pre' keeps the
+                last max_length tokens instead.
+            oov: ID used for tokens missing from the vocabulary.
+        """
+        if padding not in POLICIES or truncating not in POLICIES:
+            raise ValueError(f"Padding and truncating must be one of {POLICIES}.")
+        if max_length < 1:
+            raise ValueError("max_length must be at least 1.")
+        self.vocabulary = vocabulary
+        self.max_length = max_length
+        self.padding = padding
+        self.truncating = truncating
+        self.oov = oov
+
+    def _ids(self, emails, length):
+        """Token IDs of all emails, each truncated to length, concatenated, and the count per email."""
+        tokenize = default_tokenizer.tokenize
+        if metrics.enabled:
+            tokenize = partial(metrics.timed, 'tokenize', tokenize)
+        if self.truncating == 'post':
+            tokenized = [tokenize(email)[:length] for email in emails]
+        else:
+            tokenized = [tokenize(email)[-length:] for email in emails]
+        counts = np.fromiter(map(len, tokenized), dtype=np.int64, count=len(tokenized))
+        ids = np.fromiter(map(self.vocabulary.get, chain.from_iterable(tokenized), repeat(self.oov)),
+                          dtype=np.int32, count=int(counts.sum()))
+        return ids, counts
+
+    def _pack(self, ids, counts, length):
+        """Copy concatenated IDs into a zero-filled (len(counts), length) matrix."""
+        offsets = length - counts if self.padding == 'pre' else np.zeros_like(counts)
+        columns = np.arange(length)
+        # Filled cells in row-major order line up with the concatenated IDs
+        filled = (columns >= offsets[:, None]) & (columns < (offsets + counts)[:, None])
+        X = np.zeros((len(counts), length), dtype=np.int32)
+        X[filled] = ids
+        return X
+
+    def encode(self, emails, length=None):
+        """
+        Encode a batch of emails.
+
+        Args:
+            emails: List of email texts.
+            length: Optional row width; defaults to max_length.
+
+        Returns:
+            int32 array of shape (len(emails), length).
+        """
+        length = length or self.max_length
+        return self._pack(*self._ids(emails, length), length)
+
+    def encode_stream(self, emails, batch_size=512):
+        """Yield encoded matrices of at most batch_size rows from an iterable of emails."""
+        emails = iter(emails)
+        while True:
+            batch = list(islice(emails, batch_size))
+            if not batch:
+                return
+            yield self.encode(batch)
+
+    def encode_buckets(self, emails, boundaries=None):
+        """
+        Encode a batch of emails grouped by length.
+
+        Args:
+            emails: List of email texts.
+            boundaries: Increasing bucket widths; defaults to
+                default_boundaries(max_length). Tokens beyond the last width
+                are truncated.
+
+        Returns:
+            List of (indices, X) pairs, one per non-empty bucket: X holds the
+            rows of emails[indices] padded to the bucket's width.
+        """
+        boundaries = np.asarray(default_boundaries(self.max_length) if boundaries is None else boundaries)
+        ids, counts = self._ids(emails, int(boundaries[-1]))
+        buckets = np.searchsorted(boundaries, counts)
+        token_buckets = np.repeat(buckets, counts)
+        result = []
+        for bucket in np.unique(buckets):
+            indices = np.flatnonzero(buckets == bucket)
+            result.append((indices, self._pack(ids[token_buckets == bucket], counts[indices],
+                                               int(boundaries[bucket]))))
+        return result
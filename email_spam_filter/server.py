@@ -0,0 +1,252 @@
+"""Asyncio scoring server with dynamic micro-batching in front of SpamFilter.
+
+Mail transfer agents POST a message to ``/score`` over HTTP/1.1, either on a
+TCP port or on a Unix socket, and get a JSON verdict back. The envelope sender
+can be passed in an ``X-Sender`` header so whitelist and blacklist rules apply.
+``GET /metrics`` exports metrics in the Prometheus text format and
+``GET /profile`` the sampling profiler's stacks, when enabled in the config. Concurrent requests
+are coalesced into micro-batches, bounded by a maximum batch size and a
+maximum wait, and each batch is scored with one call to
+``SpamFilter.run_spam_filter_batch`` on a worker thread so the event loop
+keeps accepting connections. Up to one batch per scoring pool worker is in
+flight at a time; requests arriving while every slot is busy form the next,
+larger batches.
+
+Usage:
+    python -m email_spam_filter.server --port 8025
+    python -m email_spam_filter.server --unix-socket /run/spam-filter.sock
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import queue
+from .metrics import metrics
+
+class MicroBatcher:
+    """Coalesces concurrent scoring requests into bounded batches."""
+
+    def __init__(self, score_batch, max_batch_size=64, max_wait=0.002, max_concurrency=None):
+        """
+        Args:
+            score_batch: Blocking callable taking a list of items and returning
+                one result per item. It runs on the loop's default executor.
+            max_batch_size: Largest number of items scored together.
+            max_wait: Longest time in seconds the first item of a batch waits
+                for others to join it.
+            max_concurrency: Largest number of batches scored at the same
+                time; defaults to the CPU count.
+        """
+        self.score_batch = score_batch
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self.max_concurrency = max_concurrency or os.cpu_count() or 1
+        self.batches = 0
+        self._queue = None
+        self._task = None
+        self._slots = None
+        self._in_flight = set()
+
+    def start(self):
+        """Start collecting batches on the running event loop."""
+        if self._task is None:
+            self._queue = asyncio.Queue()
+            self._slots = asyncio.Semaphore(self.max_concurrency)
+            self._task = asyncio.get_running_loop().create_task(self._run())
+        return self
+
+    async def score(self, item):
+        """Score one item as part of the next batch and return its result."""
+        self.start()
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((item, future))
+        return await future
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            # Wait for a free slot first, so requests keep queueing into the next batch meanwhile
+            await self._slots.acquire()
+            batch = [await self._queue.get()]
+            deadline = loop.time() + self.max_wait
+            while len(batch) < self.max_batch_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+
+            task = loop.create_task(self._dispatch(batch))
+            self._in_flight.add(task)
+            task.add_done_callback(self._in_flight.discard)
+
+    async def _dispatch(self, batch):
+        """Score one batch on the executor and resolve its futures, then free its slot."""
+        items = [item for item, _ in batch]
+        try:
+            results = await asyncio.get_running_loop().run_in_executor(None, self.score_batch, items)
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+        else:
+            for (_, future), result in zip(batch, results):
+                if not future.done():
+                    future.set_result(result)
+        finally:
+            self.batches += 1
+            self._slots.release()
+
+    async def close(self):
+        """Stop collecting batches and wait for the batches in flight."""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self._in_flight:
+            await asyncio.gather(*self._in_flight, return_exceptions=True)
+
+def _to_json(value):
+    """Convert NumPy scalars in a result to plain Python values."""
+    return value.item() if hasattr(value, 'item') else value
+
+class ScoringServer:
+    """Minimal HTTP/1.1 front end that scores POST /score bodies through a MicroBatcher."""
+
+    def __init__(self, spam_filter, max_batch_size=64, max_wait=0.002, max_concurrency=None):
+        self.spam_filter = spam_filter
+        if max_concurrency is None:
+            # One batch per scoring pool worker keeps every worker busy
+            max_concurrency = getattr(getattr(spam_filter, 'pool', None), 'max_workers', None)
+        self.batcher = MicroBatcher(self._score_batch, max_batch_size, max_wait, max_concurrency)
+        self._server = None
+
+    def _score_batch(self, items):
+        emails, senders = zip(*items)
+        return self.spam_filter.run_spam_filter_batch(list(emails), list(senders))
+
+    async def start(self, host='127.0.0.1', port=8025, unix_socket=None):
+        """Start listening on a TCP port, or on a Unix socket when one is given."""
+        self.batcher.start()
+        if unix_socket:
+            self._server = await asyncio.start_unix_server(self._handle, path=unix_socket)
+        else:
+            self._server = await asyncio.start_server(self._handle, host, port)
+        return self._server
+
+    async def close(self):
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+        await self.batcher.close()
+
+    async def _handle(self, reader, writer):
+        """Serve requests on one connection until the client closes it."""
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                headers = {}
+                try:
+                    method, path, _ = request_line.decode('latin-1').split(' ', 2)
+                    while True:
+                        line = await reader.readline()
+                        if line in (b'\r\n', b'\n', b''):
+                            break
+                        name, _, value = line.decode('latin-1').partition(':')
+                        headers[name.strip().lower()] = value.strip()
+                    length = int(headers.get('content-length', 0))
+                    if length < 0:
+                        raise ValueError(f"Invalid Content-Length {length}")
+                except ValueError as e:
+                    # The rest of the stream cannot be framed, so answer and close
+                    await self._write(writer, '400 Bad Request', {'error': f"Malformed request: {e}"}, False)
+                    break
+                body = await reader.readexactly(length)
+
+                status, payload = await self._respond(method, path, body, headers.get('x-sender'))
+                keep_alive = headers.get('connection', '').lower() != 'close'
+                await self._write(writer, status, payload, keep_alive)
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def _write(self, writer, status, payload, keep_alive):
+        """Send one response: plain text for str payloads, JSON otherwise."""
+        if isinstance(payload, str):
+            data, content_type = payload.encode('utf-8'), 'text/plain; version=0.0.4'
+        else:
+            data, content_type = json.dumps(payload).encode('utf-8'), 'application/json'
+        writer.write(f"HTTP/1.1 {status}\r\nContent-Type: {content_type}\r\n"
+                     f"Content-Length: {len(data)}\r\n"
+                     f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n"
+                     .encode('latin-1') + data)
+        await writer.drain()
+
+    async def _respond(self, method, path, body, sender=None):
+        if method == 'GET' and path == '/metrics':
+            return '200 OK', metrics.export()
+        if method == 'GET' and path == '/profile':
+            return '200 OK', metrics.profiler.collapsed() if metrics.profiler is not None else ''
+        if path != '/score':
+            return '404 Not Found', {'error': f"Unknown path {path}"}
+        if method != 'POST':
+            return '405 Method Not Allowed', {'error': "Use POST"}
+        try:
+            result = await self.batcher.score((body.decode('utf-8', errors='replace'), sender))
+        except queue.Full as e:
+            return '503 Service Unavailable', {'error': str(e) or "Scoring queue is full"}
+        except ValueError as e:
+            # Raised by SpamFilter when the configured algorithm has no usable model
+            return '503 Service Unavailable', {'error': str(e)}
+        except Exception as e:
+            return '500 Internal Server Error', {'error': f"{type(e).__name__}: {e}"}
+        return '200 OK', {'result': _to_json(result)}
+
+async def serve(spam_filter, host='127.0.0.1', port=8025, unix_socket=None,
+                max_batch_size=64, max_wait=0.002, max_concurrency=None):
+    """Run a scoring server until cancelled."""
+    server = ScoringServer(spam_filter, max_batch_size, max_wait, max_concurrency)
+    listener = await server.start(host, port, unix_socket)
+    try:
+        await listener.serve_forever()
+    finally:
+        await server.close()
+
+def main(argv=None):
+    from .main import SpamFilter
+
+    parser = argparse.ArgumentParser(description='Email spam filter scoring server')
+    parser.add_argument('--config', default='config.json', help="Path to the configuration file")
+    parser.add_argument('--algorithm', default='naive_bayes', help="Spam detection algorithm")
+    parser.add_argument('--host', default='127.0.0.1', help="Address to listen on")
+    parser.add_argument('--port', type=int, default=8025, help="TCP port to listen on")
+    parser.add_argument('--unix-socket', help="Listen on this Unix socket instead of TCP")
+    parser.add_argument('--max-batch-size', type=int, default=64, help="Largest micro-batch")
+    parser.add_argument('--max-wait-ms', type=float, default=2.0,
+                        help="Longest time a request waits for its batch to fill")
+    parser.add_argument('--max-concurrency', type=int,
+                        help="Batches scored at the same time (defaults to the scoring pool size)")
+
+    args = parser.parse_args(argv)
+    spam_filter = SpamFilter(algorithm=args.algorithm, config_path=os.path.abspath(args.config))
+    try:
+        asyncio.run(serve(spam_filter, args.host, args.port, args.unix_socket,
+                          args.max_batch_size, args.max_wait_ms / 1000, args.max_concurrency))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        spam_filter.close()
+
+if __name__ == "__main__":
+    main()
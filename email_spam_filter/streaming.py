@@ -0,0 +1,179 @@
+"""Out-of-core training data: labelled corpora streamed from disk in mini-batches.
+
+A ``Corpus`` reads a CSV, JSONL or mbox file record by record each time it is
+iterated, so a training loop over several epochs never holds more than one
+batch in memory. Batches of raw texts feed incrementally trained models such
+as ``SpamFilterSVM.partial_fit``; batches of encoded token IDs feed the
+Keras models, either from a plain generator or from a ``tf.data`` pipeline
+that prefetches the next batch while the current one trains.
+"""
+
+import csv
+import json
+import os
+import zlib
+from email import policy
+from email.parser import BytesHeaderParser
+from itertools import islice
+import numpy as np
+from .batch import iter_mbox, parse_message
+
+FORMATS = ('csv', 'jsonl', 'mbox')
+
+_EXTENSIONS = {'.csv': 'csv', '.jsonl': 'jsonl', '.json': 'jsonl', '.ndjson': 'jsonl', '.mbox': 'mbox'}
+
+# Label values read as spam and as ham, compared case-insensitively
+_SPAM_LABELS = frozenset({'1', 'spam', 'yes', 'true'})
+_HAM_LABELS = frozenset({'0', 'ham', 'no', 'false'})
+
+_HEADER_PARSER = BytesHeaderParser(policy=policy.default)
+
+def parse_label(value):
+    """Map a label such as 1, 'spam', 'ham' or 'YES' to 1 for spam or 0 for ham."""
+    if isinstance(value, (bool, int, float)):
+        return int(value == 1)
+    text = str(value).strip().lower()
+    if text in _SPAM_LABELS:
+        return 1
+    if text in _HAM_LABELS:
+        return 0
+    raise ValueError(f"Unrecognised label '{value}'.")
+
+def iter_batches(records, batch_size):
+    """
+    Group (text, label) records into mini-batches.
+
+    Args:
+        records: Iterable of (text, label) pairs.
+        batch_size: Number of records per batch.
+
+    Returns:
+        Generator of (texts, labels) pairs: a list of at most batch_size texts
+        and an int64 array of their labels.
+    """
+    records = iter(records)
+    while True:
+        batch = list(islice(records, batch_size))
+        if not batch:
+            return
+        texts, labels = zip(*batch)
+        yield list(texts), np.fromiter(labels, dtype=np.int64, count=len(labels))
+
+class Corpus:
+    """A labelled corpus on disk, re-read record by record on every iteration."""
+
+    def __init__(self, path, format=None, text_field='text', label_field='label', label=None,
+                 label_header='X-Spam-Flag', encoding='utf-8', holdout=0.0, subset=None):
+        """
+        Args:
+            path: CSV, JSONL or mbox file.
+            format: One of FORMATS; by default it follows the file extension.
+            text_field: CSV column or JSON key holding the email text.
+            label_field: CSV column or JSON key holding the label.
+            label: Label given to every message of an mbox file, e.g. 1 for
+                a spam folder. When None, each message's label_header decides.
+            label_header: mbox header holding a label, such as X-Spam-Flag: YES.
+            encoding: Text encoding of CSV and JSONL files.
+            holdout: Fraction of records set aside as a test set, chosen by a
+                hash of the text so every pass makes the same split.
+            subset: 'train' or 'test' to read one side of the holdout split,
+                or None for all records.
+        """
+        format = format or _EXTENSIONS.get(os.path.splitext(path)[1].lower())
+        if format not in FORMATS:
+            raise ValueError(f"Corpus format of '{path}' is not supported; pass one of {FORMATS}.")
+        if subset not in (None, 'train', 'test'):
+            raise ValueError("Subset must be 'train', 'test' or None.")
+        self.path = path
+        self.format = format
+        self.text_field = text_field
+        self.label_field = label_field
+        self.label = label
+        self.label_header = label_header
+        self.encoding = encoding
+        self.holdout = holdout
+        self.subset = subset
+
+    def _iter_csv(self):
+        with open(self.path, 'r', encoding=self.encoding, newline='') as f:
+            for row in csv.DictReader(f):
+                yield row[self.text_field], parse_label(row[self.label_field])
+
+    def _iter_jsonl(self):
+        with open(self.path, 'r', encoding=self.encoding) as f:
+            for line in f:
+                if line.strip():
+                    record = json.loads(line)
+                    yield record[self.text_field], parse_label(record[self.label_field])
+
+    def _iter_mbox(self):
+        for key, raw in iter_mbox(self.path):
+            msg = parse_message(key, raw)
+            if self.label is not None:
+                label = parse_label(self.label)
+            else:
+                headers = _HEADER_PARSER.parsebytes(raw, headersonly=True)
+                label = parse_label(headers.get(self.label_header, 'no'))
+            yield f"{msg['subject']}\n{msg['body']}", label
+
+    def __iter__(self):
+        records = getattr(self, f'_iter_{self.format}')()
+        if not self.subset or not self.holdout:
+            return records
+        cutoff = int(self.holdout * 2 ** 32)
+        test = self.subset == 'test'
+        return ((text, label) for text, label in records
+                if (zlib.crc32(text.encode('utf-8', 'surrogatepass')) < cutoff) == test)
+
+    def texts(self):
+        """Iterate over the email texts only, e.g. to build a vocabulary."""
+        return (text for text, _ in self)
+
+    def batches(self, batch_size=1024):
+        """Iterate over (texts, labels) mini-batches."""
+        return iter_batches(self, batch_size)
+
+    def sequences(self, encoder, batch_size=128, channels=False):
+        """
+        Iterate over encoded mini-batches for the Keras models.
+
+        Args:
+            encoder: SequenceEncoder turning texts into token IDs.
+            batch_size: Number of emails per batch.
+            channels: Add a trailing channel axis and cast to float32, as
+                the CNN expects.
+
+        Returns:
+            Generator of (X, y) pairs: an int32 (batch, max_length) matrix, or
+            float32 (batch, max_length, 1) with channels, and float32 labels.
+        """
+        for texts, labels in self.batches(batch_size):
+            X = encoder.encode(texts)
+            if channels:
+                X = X[..., None].astype(np.float32)
+            yield X, labels.astype(np.float32)
+
+    def dataset(self, encoder, batch_size=128, channels=False, prefetch=None):
+        """
+        Build a tf.data pipeline over encoded mini-batches.
+
+        Each iteration of the dataset, i.e. each Keras epoch, re-reads the file.
+
+        Args:
+            encoder: SequenceEncoder turning texts into token IDs.
+            batch_size: Number of emails per batch.
+            channels: Produce float32 (batch, max_length, 1) inputs for the CNN.
+            prefetch: Batches prepared ahead of training; defaults to
+                tf.data.AUTOTUNE.
+
+        Returns:
+            A tf.data.Dataset of (X, y) batches, to pass to model.fit.
+        """
+        import tensorflow as tf
+
+        shape = (None, encoder.max_length, 1) if channels else (None, encoder.max_length)
+        signature = (tf.TensorSpec(shape, tf.float32 if channels else tf.int32),
+                     tf.TensorSpec((None,), tf.float32))
+        dataset = tf.data.Dataset.from_generator(lambda: self.sequences(encoder, batch_size, channels),
+                                                 output_signature=signature)
+        return dataset.prefetch(tf.data.AUTOTUNE if prefetch is None else prefetch)
@@ -1,14 +1,66 @@
+from itertools import count
 import numpy as np
+from scipy.special import expit
 from sklearn import svm
-from sklearn.feature_extraction.text import TfidfVectorizer
-from concurrent.futures import ProcessPoolExecutor
+from sklearn.linear_model import SGDClassifier
+from sklearn.feature_extraction.text import HashingVectorizer, TfidfVectorizer
 import cProfile
+from .metrics import metrics
+from .model_format import decode_vocabulary, encode_vocabulary, read_model_of_kind, write_model
+from .pool import ScoringPool
+from .streaming import iter_batches
+from .tokenizer import tokenize
+
+FEATURE_MODES = ('tfidf', 'hashing')
+
+# Versions of the scoring weights, unique within the process
+_weight_versions = count()
+ESTIMATORS = ('svc', 'linear')
 
 class SpamFilterSVM:
-    def __init__(self):
-        self.vectorizer = TfidfVectorizer(max_features=5000)
+    def __init__(self, features='tfidf', n_features=2 ** 20, alternate_sign=True, estimator='svc', seed=0):
+        """
+        Args:
+            features: 'tfidf' to fit a TF-IDF vocabulary, or 'hashing' for stateless
+                hashed features whose memory is fixed by n_features. Hashed
+                features need no fitting pass, so they can be computed chunk by
+                chunk or in separate processes without sharing any state.
+            n_features: Dimensionality of the hashed feature space.
+            alternate_sign: Use signed hashing so that collisions tend to cancel
+                out instead of accumulating.
+            estimator: 'svc' for libsvm's SVC with a linear kernel and Platt
+                scaling, or 'linear' for a logistic-loss linear model trained
+                by SGD, which is linear in the number of samples and yields
+                calibrated probabilities directly.
+            seed: Random seed of the SGD shuffling and of the SVC's Platt
+                scaling, so training on the same data gives the same model.
+        """
+        if features not in FEATURE_MODES:
+            raise ValueError(f"Feature mode '{features}' is not supported.")
+        if estimator not in ESTIMATORS:
+            raise ValueError(f"Estimator '{estimator}' is not supported.")
+        self.features = features
+        self.estimator = estimator
+        self.n_features = n_features
+        self.alternate_sign = alternate_sign
+        self.seed = seed
+        self.vectorizer = self._build_vectorizer()
         self.model = None
+        self.coef_ = None
+        self.intercept_ = 0.0
+        self.classes_ = np.array([0, 1])
+        self.platt_ = (0.0, 0.0)
+        self.version = next(_weight_versions)
+        self._pool = None
     
+    def _build_vectorizer(self, vocabulary=None):
+        """Create the feature extractor for the configured feature mode."""
+        if self.features == 'hashing':
+            return HashingVectorizer(n_features=self.n_features, alternate_sign=self.alternate_sign,
+                                     analyzer=tokenize, dtype=np.float32)
+        return TfidfVectorizer(max_features=5000, analyzer=tokenize, vocabulary=vocabulary,
+                               dtype=np.float32)
+
     def fit(self, X_train, y_train):
         """
         Train the SVM model on the provided data.
@@ -20,57 +72,199 @@ class SpamFilterSVM:
         Returns:
             self
         """
+        self.close()  # Workers hold the previous model
         X_train_tfidf = self.vectorizer.fit_transform(X_train)
-        self.model = svm.SVC(kernel='linear', probability=True)
+        if self.estimator == 'linear':
+            self.model = SGDClassifier(loss='log_loss', alpha=1e-6, random_state=self.seed)
+        else:
+            self.model = svm.SVC(kernel='linear', probability=True, random_state=self.seed)
         self.model.fit(X_train_tfidf, y_train)
+        return self._export_weights()
+
+    def partial_fit(self, emails, labels):
+        """
+        Update the model with one mini-batch of labelled emails.
+
+        Requires features='hashing' and estimator='linear': hashed features
+        need no vocabulary pass and SGD learns one batch at a time, so memory
+        depends on the batch size, not the corpus size.
+
+        Args:
+            emails: List of emails in this batch.
+            labels: Labels of the batch (1 for spam, 0 for ham).
+
+        Returns:
+            self
+        """
+        if self.features != 'hashing' or self.estimator != 'linear':
+            raise ValueError("Incremental training requires features='hashing' and estimator='linear'.")
+        if self.model is None:
+            self.model = SGDClassifier(loss='log_loss', alpha=1e-6, random_state=self.seed)
+        self.close()  # Workers hold the previous weights
+        self.model.partial_fit(self.vectorizer.transform(emails), labels, classes=[0, 1])
+        return self._export_weights()
+
+    def fit_stream(self, records, batch_size=1024, epochs=1):
+        """
+        Train from a stream of labelled emails without holding them in memory.
+
+        Args:
+            records: Iterable of (email, label) pairs, e.g. a streaming.Corpus.
+                It is iterated once per epoch, so for several epochs it must
+                be re-iterable rather than a generator.
+            batch_size: Number of emails per partial_fit call.
+            epochs: Number of passes over the records.
+
+        Returns:
+            self
+        """
+        self.model = None
+        for _ in range(epochs):
+            for emails, labels in iter_batches(records, batch_size):
+                self.partial_fit(emails, labels)
+        return self
+
+    def _export_weights(self):
+        """Copy the fitted estimator's weights into the arrays used for scoring."""
+        # Both estimators reduce to one weight per feature; keep those so
+        # scoring is a sparse dot product and the model can be saved compactly.
+        coef = self.model.coef_
+        coef = coef.toarray() if hasattr(coef, 'toarray') else coef
+        self.coef_ = np.asarray(coef, dtype=np.float32).ravel()
+        self.intercept_ = float(self.model.intercept_[0])
+        self.classes_ = self.model.classes_
+        if self.estimator == 'linear':
+            # Logistic loss: the decision value already is the spam log-odds
+            self.platt_ = (-1.0, 0.0)
+        else:
+            self.platt_ = (float(self.model.probA_[0]), float(self.model.probB_[0]))
+        self.version = next(_weight_versions)
         return self
 
-    def predict(self, emails):
+    def decision_function(self, emails):
+        """
+        Compute the signed distance of each email from the separating hyperplane.
+
+        Args:
+            emails: List of emails to classify.
+
+        Returns:
+            Array of decision values; positive values indicate spam.
+        """
+        if metrics.enabled:
+            X = metrics.timed('vectorize', self.vectorizer.transform, emails)
+        else:
+            X = self.vectorizer.transform(emails)
+        return X @ self.coef_ + self.intercept_
+
+    def predict(self, emails, threshold=None):
         """
         Predict if the given list of emails are spam or not.
 
         Args:
             emails: List of emails to classify.
+            threshold: Optional spam probability cut-off, e.g. the threshold
+                from config.json. By default the sign of the decision value decides.
 
         Returns:
             List of predictions (0 for non-spam, 1 for spam).
         """
-        emails_tfidf = self.vectorizer.transform(emails)
-        return self.model.predict(emails_tfidf)
+        if threshold is not None:
+            return self.classes_[(self.predict_proba(emails) >= threshold).astype(int)]
+        return self.classes_[(self.decision_function(emails) > 0).astype(int)]
 
-    def predict_parallel(self, emails):
+    def predict_proba(self, emails):
         """
-        Predict if the given list of emails are spam or not using parallel processing.
+        Estimate the probability of each email being spam.
+
+        The linear estimator's decision value is the log-odds itself; for SVC
+        it is mapped through the fitted Platt scaling parameters.
 
         Args:
             emails: List of emails to classify.
 
         Returns:
-            List of predictions (0 for non-spam, 1 for spam).
+            Array of spam probabilities.
+        """
+        a, b = self.platt_
+        return expit(b - a * self.decision_function(emails))
+
+    def save(self, path):
+        """
+        Save the fitted feature extractor and linear weights in the binary model format.
+
+        Args:
+            path: Destination file path.
         """
-        num_chunks = min(8, len(emails))  # Adjust based on your CPU
-        chunk_size = len(emails) // num_chunks
+        arrays = {'coef': self.coef_.astype(np.float32)}
+        if self.features == 'tfidf':
+            vocabulary = self.vectorizer.vocabulary_
+            arrays['vocabulary'] = encode_vocabulary(sorted(vocabulary, key=vocabulary.get))
+            arrays['idf'] = self.vectorizer.idf_.astype(np.float32)
+        write_model(path, 'svm', arrays, {
+            'features': self.features,
+            'estimator': self.estimator,
+            'n_features': self.n_features,
+            'alternate_sign': self.alternate_sign,
+            'intercept': self.intercept_,
+            'classes': [int(c) for c in self.classes_],
+            'platt': list(self.platt_),
+        })
 
-        with ProcessPoolExecutor() as executor:
-            results = list(executor.map(
-                self._process_chunk,
-                [emails[i:i + chunk_size] for i in range(0, len(emails), chunk_size)]
-            ))
+    @classmethod
+    def load(cls, path):
+        """
+        Load a model saved with save. The weight arrays stay memory-mapped.
 
-        # Flatten the result
-        return [pred for sublist in results for pred in sublist]
+        Args:
+            path: Path of the model file.
 
-    def _process_chunk(self, emails_chunk):
+        Returns:
+            SpamFilterSVM ready for prediction.
+        """
+        return cls._from_model_data(*read_model_of_kind(path, 'svm'))
+
+    @classmethod
+    def _from_model_data(cls, metadata, arrays):
+        model = cls(features=metadata['features'], n_features=metadata['n_features'],
+                    alternate_sign=metadata['alternate_sign'], estimator=metadata['estimator'])
+        if model.features == 'tfidf':
+            words = decode_vocabulary(arrays['vocabulary'])
+            model.vectorizer = model._build_vectorizer(vocabulary=dict(zip(words, range(len(words)))))
+            model.vectorizer.idf_ = arrays['idf']
+        model.coef_ = arrays['coef']
+        model.intercept_ = metadata['intercept']
+        model.classes_ = np.array(metadata['classes'])
+        model.platt_ = tuple(metadata['platt'])
+        return model
+
+    def predict_parallel(self, emails):
         """
-        Process a chunk of emails to classify them.
+        Predict if the given list of emails are spam or not using parallel processing.
+
+        The first call forks a long-lived worker pool holding the fitted model;
+        later calls only ship the emails to it.
 
         Args:
-            emails_chunk: List of emails in this chunk.
+            emails: List of emails to classify.
 
         Returns:
-            List of predictions (0 for non-spam, 1 for spam) for the chunk.
+            List of predictions (0 for non-spam, 1 for spam).
         """
-        return self.predict(emails_chunk)
+        if self._pool is None:
+            self._pool = ScoringPool({'svm': self.predict}).start()
+        return self._pool.map('svm', emails)
+
+    def close(self):
+        """Shut down the worker pool used by predict_parallel."""
+        if self._pool is not None:
+            self._pool.close()
+            self._pool = None
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['_pool'] = None
+        return state
 
 def profile_fit_predict():
     """
@@ -91,6 +285,7 @@ def profile_fit_predict():
     
     # Predict using parallel processing
     predictions = spam_filter.predict_parallel(emails_to_classify)
+    spam_filter.close()
 
     profiler.disable()
     profiler.print_stats(sort='time')
@@ -98,5 +293,3 @@ def profile_fit_predict():
 # If used as a script to test the profiling
 if __name__ == "__main__":
     profile_fit_predict()
-
-This code defines an SVM-based spam filter class in `spam_filter_svm.py`. It includes methods for training (`fit`), making predictions (`predict`), and predicting using parallel processing (`predict_parallel`). The `_process_chunk` method helps with dividing the work among processes. Profiling is included to identify bottlenecks during fitting and prediction, which can be run by executing the script.
\ No newline at end of file
@@ -0,0 +1,168 @@
+"""Shared tokenizer used by every classifier.
+
+The text is case-folded, HTML tags and entities are stripped, and URLs and
+e-mail addresses are replaced with the placeholder tokens ``xxurl`` and
+``xxemail``; each of these steps only runs when the text contains the
+characters it looks for. Punctuation and symbols are then mapped to spaces
+with one translation table and the result is split on whitespace. Token lists
+for long bodies are kept in an LRU cache keyed by a hash of the content, so a
+newsletter or bulk campaign is tokenized once no matter how many copies
+arrive or how many models score it.
+"""
+
+import hashlib
+import re
+import threading
+import unicodedata
+from collections import OrderedDict
+from itertools import chain, islice, repeat
+
+import numpy as np
+from .metrics import metrics
+from .pool import reset_lock_after_fork
+
+URL_TOKEN = 'xxurl'
+EMAIL_TOKEN = 'xxemail'
+
+_MARKUP = re.compile(r"<[^>]*>|&(?:[a-z]+|#\d+|#x[0-9a-f]+);")
+_EMAIL = re.compile(r"[\w.+-]+@[\w-]+(?:\.[\w-]+)+")
+_EDGE_PUNCTUATION = '()[]<>{}"\',;:.!?'
+
+def _normalise_link(word):
+    """Replace a word holding a URL or e-mail address with its placeholder token."""
+    if '://' in word or word.lstrip(_EDGE_PUNCTUATION).startswith('www.'):
+        return URL_TOKEN
+    if _EMAIL.fullmatch(word.strip(_EDGE_PUNCTUATION)):
+        return EMAIL_TOKEN
+    return word
+
+def _punctuation_table():
+    """Map punctuation and symbols in the commonly used Unicode blocks to spaces."""
+    blocks = [(0x0000, 0x0250), (0x2000, 0x2070), (0x20A0, 0x20C0), (0x3000, 0x3040), (0xFF00, 0xFF66)]
+    table = {ord('_'): ' '}
+    for start, stop in blocks:
+        for code in range(start, stop):
+            if unicodedata.category(chr(code))[0] in 'PS':
+                table[code] = ' '
+    return table
+
+_PUNCTUATION = _punctuation_table()
+
+class Tokenizer:
+    """Normalising tokenizer with an LRU cache of recent message bodies."""
+
+    def __init__(self, cache_size=4096, min_cached_length=256):
+        """
+        Args:
+            cache_size: Maximum number of bodies kept in the cache; 0 disables it.
+            min_cached_length: Texts shorter than this are tokenized directly,
+                since hashing them costs about as much as tokenizing.
+        """
+        self.cache_size = cache_size
+        self.min_cached_length = min_cached_length
+        self.hits = 0
+        self.misses = 0
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+        reset_lock_after_fork(self)
+
+    def _tokenize(self, text):
+        text = text.casefold()
+        if '<' in text or '&' in text:
+            text = _MARKUP.sub(' ', text)
+        if '@' in text or '://' in text or 'www.' in text:
+            text = ' '.join([_normalise_link(word) if '@' in word or '://' in word or 'www.' in word
+                             else word for word in text.split()])
+        return tuple(text.translate(_PUNCTUATION).split())
+
+    def tokenize(self, text):
+        """Return the normalised tokens of a text as a tuple."""
+        if not self.cache_size or len(text) < self.min_cached_length:
+            return self._tokenize(text)
+
+        key = hashlib.blake2b(text.encode('utf-8', 'surrogatepass'), digest_size=16).digest()
+        with self._lock:
+            tokens = self._cache.get(key)
+            if tokens is not None:
+                self._cache.move_to_end(key)
+                self.hits += 1
+                return tokens
+            self.misses += 1
+
+        tokens = self._tokenize(text)
+        with self._lock:
+            self._cache[key] = tokens
+            if len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return tokens
+
+    def encode(self, text, vocabulary, out=None, oov=0):
+        """
+        Map a text to integer token IDs.
+
+        Args:
+            text: Text to encode.
+            vocabulary: Mapping of token to ID.
+            out: Optional preallocated integer array; IDs are written into its
+                leading positions and tokens beyond its length are dropped.
+            oov: ID used for tokens missing from the vocabulary.
+
+        Returns:
+            The array of IDs, or the number of IDs written when out is given.
+        """
+        tokens = self.tokenize(text)
+        ids = map(vocabulary.get, tokens, repeat(oov))
+        if out is None:
+            return np.fromiter(ids, dtype=np.int32, count=len(tokens))
+        n = min(len(tokens), len(out))
+        out[:n] = np.fromiter(islice(ids, n), dtype=out.dtype, count=n)
+        return n
+
+    def encode_batch(self, texts, vocabulary, oov=0):
+        """
+        Map a batch of texts to one flat array of token IDs.
+
+        Args:
+            texts: Sequence of texts to encode.
+            vocabulary: Mapping of token to ID.
+            oov: ID used for tokens missing from the vocabulary.
+
+        Returns:
+            Tuple of (ids, indptr) in CSR layout: the IDs of text i are
+            ids[indptr[i]:indptr[i + 1]].
+        """
+        tokenized = [self.tokenize(text) for text in texts]
+        indptr = np.zeros(len(tokenized) + 1, dtype=np.int64)
+        np.cumsum(np.fromiter(map(len, tokenized), dtype=np.int64, count=len(tokenized)),
+                  out=indptr[1:])
+        ids = np.fromiter(map(vocabulary.get, chain.from_iterable(tokenized), repeat(oov)),
+                          dtype=np.int32, count=indptr[-1])
+        return ids, indptr
+
+    def clear(self):
+        """Empty the cache and reset its counters."""
+        with self._lock:
+            self._cache.clear()
+            self.hits = 0
+            self.misses = 0
+
+# Process-wide tokenizer shared by all models, so they share one cache
+default_tokenizer = Tokenizer()
+
+def tokenize(text):
+    """Tokenize a text with the shared tokenizer."""
+    if metrics.enabled:
+        return metrics.timed('tokenize', default_tokenizer.tokenize, text)
+    return default_tokenizer.tokenize(text)
+
+def encode(text, vocabulary, out=None, oov=0):
+    """Encode a text to token IDs with the shared tokenizer."""
+    if metrics.enabled:
+        return metrics.timed('tokenize', default_tokenizer.encode, text, vocabulary, out, oov)
+    return default_tokenizer.encode(text, vocabulary, out, oov)
+
+def encode_batch(texts, vocabulary, oov=0):
+    """Encode a batch of texts to CSR-style token IDs with the shared tokenizer."""
+    if metrics.enabled:
+        return metrics.timed('tokenize', default_tokenizer.encode_batch, texts, vocabulary, oov)
+    return default_tokenizer.encode_batch(texts, vocabulary, oov)
@@ -50,7 +50,7 @@ def integrate_with_email_client():
         mail.login(username, password)
         return mail
     
-    def fetch_emails(mail):
+    def fetch_emails(mail, filter_instance):
         mail.select('inbox')
         status, messages = mail.search(None, 'ALL')
         
@@ -77,7 +77,6 @@ def integrate_with_email_client():
             else:  # it's not multipart - i.e. plain text, no attachments, keeping it simple
                 body = msg.get_payload(decode=True).decode()
             
-            filter_instance = train_filter()
             is_spam = filter_instance.predict(body)
             print(f"Subject: {subject}\nFrom: {from_}\nSpam: {is_spam}")
 
@@ -88,11 +87,13 @@ def main():
     # Test the filter with example cases
     test_filter(filter_instance)
 
+    # To classify a whole mailbox archive without retraining per message, save the
+    # trained filter with filter_instance.save('model.bin') and run:
+    #   python -m email_spam_filter.batch archive.mbox --model model.bin --format jsonl
+
     # Example of integration - Uncomment and configure for your email client
     # mail = connect_to_email_server('your-email@gmail.com', 'your-password')
-    # fetch_emails(mail)
+    # fetch_emails(mail, filter_instance)
     
 if __name__ == "__main__":
     main()
-
-This script demonstrates how to use the Naive Bayes filter in a practical scenario. It includes training with sample data, testing predictions, and an example of integration with an email client using IMAP (commented out for security reasons). Users can adapt the `integrate_with_email_client` function by providing their own credentials and server details.
\ No newline at end of file
@@ -7,44 +7,37 @@ Before running this example, ensure you have installed necessary libraries:
 - Python 3.x
 - numpy
 - tensorflow or keras
-- scikit-learn
 
 You can install these dependencies using pip:
-pip install numpy tensorflow scikit-learn
+pip install numpy tensorflow
 
 1. Data Preparation
 First, prepare your dataset. This example assumes you have a CSV file with labeled email data ('spam.csv').
 
 2. Load and Preprocess Data
 """
-import pandas as pd
-from sklearn.model_selection import train_test_split
+from email_spam_filter.streaming import Corpus
 
-# Load the dataset
-data = pd.read_csv('spam.csv', encoding='latin-1')
-data = data[['v1', 'v2']]
-data.columns = ['label', 'email']
-
-# Split into training and test sets
-X_train, X_test, y_train, y_test = train_test_split(data['email'], data['label'], test_size=0.2)
+# Stream the dataset from disk instead of loading it into memory; 20% of the
+# messages, chosen by a hash of their text, are held out for testing
+columns = dict(text_field='v2', label_field='v1', encoding='latin-1', holdout=0.2)
+train_corpus = Corpus('spam.csv', subset='train', **columns)
+test_corpus = Corpus('spam.csv', subset='test', **columns)
 
 """
 3. Text Preprocessing
 Convert the email texts to sequences that can be fed into an RNN model.
 """
-from tensorflow.keras.preprocessing.text import Tokenizer
-from tensorflow.keras.preprocessing.sequence import pad_sequences
+from email_spam_filter.sequence import SequenceEncoder, build_vocabulary
 
-# Tokenize text
-tokenizer = Tokenizer(num_words=5000)
-tokenizer.fit_on_texts(X_train)
-X_train_seq = tokenizer.texts_to_sequences(X_train)
-X_test_seq = tokenizer.texts_to_sequences(X_test)
+# Build a vocabulary of the 5000 IDs the embedding accepts (0 pads, 1 is unknown)
+vocabulary = build_vocabulary(train_corpus.texts(), max_size=5000)
 
-# Pad sequences to ensure uniform input length
+# Batches are encoded into zero-padded int32 matrices of uniform length as they are read
 max_len = 200
-X_train_pad = pad_sequences(X_train_seq, maxlen=max_len)
-X_test_pad = pad_sequences(X_test_seq, maxlen=max_len)
+encoder = SequenceEncoder(vocabulary, max_len)
+train_data = train_corpus.dataset(encoder, batch_size=64)
+test_data = test_corpus.dataset(encoder, batch_size=64)
 
 """
 4. Model Building
@@ -53,9 +46,9 @@ Build a simple RNN model using Keras.
 from tensorflow.keras.models import Sequential
 from tensorflow.keras.layers import Embedding, SimpleRNN, Dense
 
-# Define the RNN model
+# Define the RNN model; ID 0 is padding and is masked out
 model = Sequential()
-model.add(Embedding(input_dim=5000, output_dim=16, input_length=max_len))
+model.add(Embedding(input_dim=5000, output_dim=16, mask_zero=True))
 model.add(SimpleRNN(units=32))
 model.add(Dense(1, activation='sigmoid'))
 
@@ -64,17 +57,11 @@ model.compile(optimizer='adam', loss='binary_crossentropy', metrics=['accuracy']
 
 """
 5. Train the Model
-Train your RNN on the prepared dataset.
+Train your RNN on the prepared dataset. Labels ('spam'/'ham') are read as 1/0,
+and each epoch re-reads the file with the next batch prefetched, so memory use
+depends on the batch size rather than the size of spam.csv.
 """
-from sklearn.preprocessing import LabelEncoder
-
-# Encode labels to binary format
-label_encoder = LabelEncoder()
-y_train_encoded = label_encoder.fit_transform(y_train)
-y_test_encoded = label_encoder.transform(y_test)
-
-# Fit the model
-model.fit(X_train_pad, y_train_encoded, epochs=5, validation_data=(X_test_pad, y_test_encoded))
+model.fit(train_data, epochs=5, validation_data=test_data)
 
 """
 6. Evaluate and Use the Model
@@ -82,13 +69,12 @@ Evaluate the performance of your trained model and use it for predictions.
 """
 
 # Model evaluation
-loss, accuracy = model.evaluate(X_test_pad, y_test_encoded)
+loss, accuracy = model.evaluate(test_data)
 print(f'Test Accuracy: {accuracy * 100:.2f}%')
 
 # Predict on a new email
 def predict_email(email):
-    seq = tokenizer.texts_to_sequences([email])
-    padded_seq = pad_sequences(seq, maxlen=max_len)
+    padded_seq = encoder.encode([email])
     prediction = model.predict(padded_seq)[0][0]
     
     if prediction > 0.5:
@@ -1,5 +1,34 @@
+import asyncio
+import io
+import json
+import os
+import queue
+import subprocess
+import sys
+import tempfile
+import threading
+import time
 import unittest
-from email_spam_filter import SpamFilter
+import warnings
+from unittest import mock
+
+import importlib.util
+
+import numpy as np
+from email_spam_filter import SpamFilter, NaiveBayesSpamFilter
+from email_spam_filter.cache import VerdictCache, fingerprint
+from email_spam_filter.cascade import build_cascade
+from email_spam_filter.config import build_settings, from_env, load_settings
+from email_spam_filter.metrics import metrics
+from email_spam_filter.neardup import NearDuplicateIndex
+from email_spam_filter.pool import ScoringPool
+from email_spam_filter.reload import FileWatcher
+from email_spam_filter.rules import RuleSet, compile_rules
+from email_spam_filter.sequence import SequenceEncoder, build_vocabulary
+from email_spam_filter.server import MicroBatcher, ScoringServer
+from email_spam_filter import batch, benchmark, model_format
+from email_spam_filter.svm import SpamFilterSVM
+from email_spam_filter.tokenizer import Tokenizer
 
 class TestSpamFilterAlgorithms(unittest.TestCase):
     
@@ -47,5 +76,1297 @@ class TestSpamFilterAlgorithms(unittest.TestCase):
             expected_result = True if "win" in email["body"].lower() or "call this number immediately" in email["body"].lower() else False
             self.assertEqual(result, expected_result)
 
+class TestNaiveBayesSpamFilter(unittest.TestCase):
+
+    def setUp(self):
+        self.emails = [
+            "win free money now",
+            "claim your free prize",
+            "meeting agenda for monday",
+            "please review the project notes",
+        ]
+        self.labels = [1, 1, 0, 0]
+        self.filter = NaiveBayesSpamFilter()
+        self.filter.train(self.emails, self.labels)
+
+    def test_batch_prediction(self):
+        """Batch scoring classifies the training emails and unseen variants."""
+        predictions = self.filter.predict(self.emails + ["free money prize", "project meeting notes"])
+        self.assertEqual(list(predictions), [1, 1, 0, 0, 1, 0])
+
+    def test_unknown_words_and_empty_batch(self):
+        """Unknown words fall into the reserved column and empty batches are allowed."""
+        self.assertEqual(len(self.filter.predict([])), 0)
+        probabilities = self.filter.predict_proba(["completely unseen words", ""])
+        self.assertTrue(((probabilities >= 0) & (probabilities <= 1)).all())
+
+    def test_single_email_matches_batch(self):
+        """The single-email helper agrees with batch scoring."""
+        self.assertEqual(self.filter._predict_single_email("win a free prize"),
+                         self.filter.predict(["win a free prize"])[0])
+
+class TestTokenizer(unittest.TestCase):
+
+    def test_normalisation(self):
+        """HTML, URLs, addresses, punctuation and case are normalised together."""
+        tokens = Tokenizer().tokenize("<p>WIN a FREE prize!!!</p> Visit https://spam.example/x or "
+                                      "(www.spam.example), reply to Prize.Desk@Spam.Example &amp; STRASSE Straße")
+        self.assertEqual(tokens, ('win', 'a', 'free', 'prize', 'visit', 'xxurl', 'or', 'xxurl',
+                                  'reply', 'to', 'xxemail', 'strasse', 'strasse'))
+
+    def test_cache_reuses_repeated_bodies(self):
+        """Long repeated bodies are tokenized once and served from the LRU cache."""
+        tokenizer = Tokenizer(cache_size=2, min_cached_length=10)
+        newsletter = "weekly deals on everything " * 10
+        first = tokenizer.tokenize(newsletter)
+        self.assertIs(tokenizer.tokenize(newsletter), first)
+        self.assertEqual((tokenizer.hits, tokenizer.misses), (1, 1))
+
+        tokenizer.tokenize("another long body " * 5)
+        tokenizer.tokenize("a third long body " * 5)
+        tokenizer.tokenize(newsletter)
+        self.assertEqual(tokenizer.misses, 4)
+
+    def test_encode_into_preallocated_arrays(self):
+        """Token IDs are written into caller-provided arrays and CSR batches."""
+        tokenizer = Tokenizer()
+        vocabulary = {'free': 2, 'money': 3}
+        out = np.zeros(3, dtype=np.int32)
+        self.assertEqual(tokenizer.encode("Free MONEY for you", vocabulary, out=out, oov=1), 3)
+        self.assertEqual(list(out), [2, 3, 1])
+
+        ids, indptr = tokenizer.encode_batch(["free money", "", "money"], vocabulary)
+        self.assertEqual(list(ids), [2, 3, 3])
+        self.assertEqual(list(indptr), [0, 2, 2, 3])
+
+class TestSequenceEncoder(unittest.TestCase):
+
+    def setUp(self):
+        self.vocabulary = {'free': 2, 'money': 3, 'win': 4}
+        self.emails = ["win free money now", "", "free", "money " * 10]
+
+    def test_matches_per_email_encoding(self):
+        """The batch matrix equals padding each email separately."""
+        from email_spam_filter.tokenizer import encode
+
+        X = SequenceEncoder(self.vocabulary, 6).encode(self.emails)
+        self.assertEqual((X.shape, X.dtype), ((4, 6), np.int32))
+        for row, email in zip(X, self.emails):
+            expected = np.zeros(6, dtype=np.int32)
+            encode(email, self.vocabulary, out=expected, oov=1)
+            np.testing.assert_array_equal(row, expected)
+
+    def test_padding_and_truncating_policies(self):
+        """'pre' pads on the left and keeps the last tokens."""
+        encoder = SequenceEncoder(self.vocabulary, 3, padding='pre', truncating='pre')
+        np.testing.assert_array_equal(encoder.encode(["win free money now", "free"]),
+                                      [[2, 3, 1], [0, 0, 2]])
+        with self.assertRaises(ValueError):
+            SequenceEncoder(self.vocabulary, 3, padding='middle')
+
+    def test_buckets_and_stream(self):
+        """Emails are grouped into the narrowest bucket that holds them, covering every email once."""
+        encoder = SequenceEncoder(self.vocabulary, 16)
+        buckets = encoder.encode_buckets(self.emails, boundaries=(2, 4, 16))
+        self.assertEqual([(list(indices), X.shape[1]) for indices, X in buckets],
+                         [([1, 2], 2), ([0], 4), ([3], 16)])
+        full = encoder.encode(self.emails)
+        for indices, X in buckets:
+            np.testing.assert_array_equal(full[indices, :X.shape[1]], X)
+
+        from email_spam_filter.sequence import bucket_rows
+
+        trimmed = bucket_rows(full, boundaries=(2, 4))
+        self.assertEqual([(list(indices), X.shape[1]) for indices, X in trimmed],
+                         [([1, 2], 2), ([0], 4), ([3], 16)])
+
+        chunks = list(encoder.encode_stream(iter(self.emails), batch_size=3))
+        self.assertEqual([len(X) for X in chunks], [3, 1])
+
+    def test_build_vocabulary(self):
+        """IDs follow frequency from 2 and stay below max_size."""
+        vocabulary = build_vocabulary(["free money", "free prize", "free"], max_size=4)
+        self.assertEqual(vocabulary, {'free': 2, 'money': 3})
+
+class TestNaiveBayesPartialFit(unittest.TestCase):
+
+    def setUp(self):
+        self.emails = ["win free money", "claim free prize now", "team meeting notes", "project review agenda"]
+        self.labels = [1, 1, 0, 0]
+        self.feedback = ["cheap pills win", "lunch with the team"]
+        self.feedback_labels = [1, 0]
+
+    def test_partial_fit_matches_full_training(self):
+        """Incremental updates produce the same model as training on everything."""
+        full = NaiveBayesSpamFilter()
+        full.train(self.emails + self.feedback, self.labels + self.feedback_labels)
+
+        incremental = NaiveBayesSpamFilter()
+        incremental.train(self.emails, self.labels)
+        incremental.partial_fit(self.feedback, self.feedback_labels)
+
+        probe = self.emails + self.feedback + ["cheap free lunch", "unseen words"]
+        self.assertTrue(abs(full.predict_proba(probe) - incremental.predict_proba(probe)).max() < 1e-5)
+
+    def test_untrained_and_single_class_models(self):
+        """An empty model and one that has seen only one class give finite, unsaturated scores."""
+        model = NaiveBayesSpamFilter()
+        with warnings.catch_warnings():
+            warnings.simplefilter('error')
+            self.assertEqual(list(model.predict_proba(["free prize"])), [0.5])
+            model.partial_fit([], [])
+            self.assertEqual(list(model.predict_proba(["free prize"])), [0.5])
+
+            model.partial_fit(["win free money"], [1])
+            probabilities = model.predict_proba(["win free money", "team meeting notes"])
+        self.assertTrue(((probabilities > 0) & (probabilities < 1)).all())
+        self.assertGreater(probabilities[0], 0.5)
+
+        model.partial_fit(["team meeting notes"], [0])
+        self.assertEqual(list(model.predict(["win free money", "team meeting notes"])), [1, 0])
+
+    def test_snapshot_is_not_mutated_by_updates(self):
+        """Scorers holding a snapshot keep a consistent view while updates happen."""
+        model = NaiveBayesSpamFilter()
+        model.train(self.emails, self.labels)
+        snapshot = model._snapshot
+        weights = snapshot.word_log_odds.copy()
+
+        model.partial_fit(self.feedback, self.feedback_labels)
+        model.predict(["cheap pills"])
+        self.assertIsNot(model._snapshot, snapshot)
+        self.assertTrue((snapshot.word_log_odds == weights).all())
+
+    def test_partial_fit_after_load(self):
+        """A memory-mapped model copies its counts on the first update."""
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'model.bin')
+            model = NaiveBayesSpamFilter()
+            model.train(self.emails, self.labels)
+            model.save(path)
+
+            loaded = NaiveBayesSpamFilter.load(path)
+            loaded.partial_fit(self.feedback, self.feedback_labels)
+            model.partial_fit(self.feedback, self.feedback_labels)
+            probe = ["cheap pills", "team lunch"]
+            self.assertTrue(abs(loaded.predict_proba(probe) - model.predict_proba(probe)).max() < 1e-5)
+
+    def test_parallel_training_matches_serial(self):
+        """Sharded counting with a tree merge gives the same model as serial training."""
+        emails = (self.emails + self.feedback) * 5
+        labels = (self.labels + self.feedback_labels) * 5
+        serial = NaiveBayesSpamFilter()
+        serial.train(emails, labels)
+        parallel = NaiveBayesSpamFilter()
+        parallel.train_parallel(emails, labels, n_workers=3)
+
+        self.assertEqual(sorted(parallel.vocabulary), sorted(serial.vocabulary))
+        self.assertEqual(list(parallel.class_counts), list(serial.class_counts))
+        probe = emails + ["unseen words"]
+        self.assertTrue(abs(serial.predict_proba(probe) - parallel.predict_proba(probe)).max() < 1e-5)
+
+class TestScoringPool(unittest.TestCase):
+
+    def setUp(self):
+        self.filter = NaiveBayesSpamFilter()
+        self.filter.train(["win free money", "team meeting notes"], [1, 0])
+        self.pool = ScoringPool({'naive_bayes': self.filter.predict}, max_workers=2, max_pending=2).start()
+
+    def tearDown(self):
+        self.pool.close()
+
+    def test_submit_and_map_reuse_workers(self):
+        """Batches are scored by the preloaded workers and returned in order."""
+        self.assertEqual(self.pool.submit('naive_bayes', ["free money"]).result(), [1])
+        emails = ["free money", "meeting notes"] * 5
+        self.assertEqual(self.pool.map('naive_bayes', emails, batch_size=3), [1, 0] * 5)
+
+    def test_locks_held_at_fork_are_released(self):
+        """Workers forked while another thread holds a model or tokenizer lock do not deadlock."""
+        from email_spam_filter.tokenizer import default_tokenizer
+
+        pool = ScoringPool({'naive_bayes': self.filter.predict}, max_workers=1)
+        with self.filter._lock, default_tokenizer._lock:
+            future = pool.submit('naive_bayes', ["win free money " * 20])
+            try:
+                self.assertEqual(future.result(timeout=10), [1])
+            except TimeoutError:
+                for process in pool._executor._processes.values():
+                    process.kill()
+                raise
+            finally:
+                pool.close()
+
+    def test_unknown_scorer(self):
+        """Submitting to an unregistered scorer is rejected."""
+        with self.assertRaises(ValueError):
+            self.pool.submit('svm', ["free money"])
+
+class TestVerdictCache(unittest.TestCase):
+
+    def test_fingerprint_ignores_formatting(self):
+        """Copies differing in case, markup, punctuation and links share a fingerprint."""
+        self.assertEqual(fingerprint("WIN a <b>FREE</b> prize!! http://a.example/x?id=1"),
+                         fingerprint("win a free prize http://b.example/y?id=2"))
+        self.assertNotEqual(fingerprint("win a free prize"), fingerprint("win a free car"))
+
+    def test_hits_misses_and_versions(self):
+        """Each distinct body is scored once per version; a new version misses."""
+        scored = []
+
+        def score(texts):
+            scored.append(list(texts))
+            return [len(text) for text in texts]
+
+        cache = VerdictCache(max_entries=2)
+        self.assertEqual(cache.compute(1, ["aa", "aa!", "bbb"], score), [2, 2, 3])
+        self.assertEqual(cache.compute(1, ["AA", "bbb"], score), [2, 3])
+        self.assertEqual(scored, [["aa", "bbb"]])
+        self.assertEqual((cache.hits, cache.misses), (2, 3))
+
+        cache.compute(2, ["aa"], score)
+        self.assertEqual(scored[-1], ["aa"])
+        self.assertEqual(len(cache), 2)
+
+    def test_ttl_expiry(self):
+        """Expired verdicts are recomputed."""
+        cache = VerdictCache(ttl=0)
+        calls = []
+        for _ in range(2):
+            cache.compute(1, ["hello"], lambda texts: calls.append(texts) or [0])
+        self.assertEqual(len(calls), 2)
+
+    def test_naive_bayes_cache_follows_updates(self):
+        """Cached scores match uncached ones and are not reused after partial_fit."""
+        emails = ["win free money prize", "team meeting notes", "free prize inside"]
+        cached = NaiveBayesSpamFilter(cache=VerdictCache())
+        plain = NaiveBayesSpamFilter()
+        for model in (cached, plain):
+            model.train(emails[:2], [1, 0])
+        for _ in range(2):
+            self.assertTrue(np.allclose(cached.decision_function(emails), plain.decision_function(emails)))
+        self.assertEqual(cached.cache.hits, 3)
+
+        for model in (cached, plain):
+            model.partial_fit(["free prize inside"], [0])
+        self.assertTrue(np.allclose(cached.decision_function(emails), plain.decision_function(emails)))
+
+    def test_spam_filter_cache_follows_model_updates(self):
+        """SpamFilter stops serving cached verdicts once a registered model is updated in place."""
+        with tempfile.TemporaryDirectory() as tmp:
+            config_path = os.path.join(tmp, 'config.json')
+            with open(config_path, 'w') as f:
+                json.dump({'threshold': 0.5}, f)
+            model = NaiveBayesSpamFilter()
+            model.train(["free prize money", "team meeting notes"], [1, 0])
+            spam_filter = SpamFilter(config_path=config_path, watch=False)
+            spam_filter.register_model('naive_bayes', model)
+            try:
+                self.assertEqual(spam_filter.run_spam_filter("free prize"), True)
+                model.partial_fit(["free prize"] * 5, [0] * 5)
+                self.assertEqual(list(model.predict(["free prize"])), [0])
+                self.assertEqual(spam_filter.run_spam_filter("free prize"), False)
+            finally:
+                spam_filter.close()
+
+class TestNearDuplicateIndex(unittest.TestCase):
+
+    CAMPAIGN = ("Congratulations you have been selected to receive a free cruise to the bahamas "
+                "claim your prize now by calling our toll free number before the offer expires tomorrow")
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_variants_match_and_unrelated_do_not(self):
+        """A campaign variant with one changed token matches; unrelated mail does not."""
+        index = NearDuplicateIndex()
+        index.add([self.CAMPAIGN])
+        variant = self.CAMPAIGN.replace("tomorrow", "today")
+        self.assertEqual(list(index.match([variant, "team meeting notes for tomorrow", ""])),
+                         [True, False, False])
+
+    def test_bounded_and_persistent(self):
+        """The oldest signatures are evicted, and save/load keeps the rest."""
+        index = NearDuplicateIndex(max_items=2)
+        index.add(["alpha beta gamma", "delta epsilon zeta", "eta theta iota"])
+        self.assertEqual(len(index), 2)
+        self.assertEqual(list(index.match(["alpha beta gamma", "eta theta iota"])), [False, True])
+
+        path = os.path.join(self.tmp.name, 'neardup.bin')
+        index.save(path)
+        loaded = NearDuplicateIndex.load(path)
+        self.assertEqual(list(loaded.match(["alpha beta gamma", "delta epsilon zeta", "eta theta iota"])),
+                         [False, True, True])
+        loaded.add(["kappa lambda mu"])
+        self.assertEqual(list(loaded.match(["delta epsilon zeta", "kappa lambda mu"])), [False, True])
+
+    def test_spam_filter_stage(self):
+        """Near-duplicates of confirmed spam are flagged before the model runs."""
+        config_path = os.path.join(self.tmp.name, 'config.json')
+        with open(config_path, 'w') as f:
+            json.dump({'threshold': 0.7}, f)
+        spam_filter = SpamFilter(config_path=config_path, watch=False)
+        model = NaiveBayesSpamFilter()
+        model.train(["free prize", "lunch meeting"], [1, 0])
+        spam_filter.register_model('naive_bayes', model)
+        spam_filter.confirm_spam([self.CAMPAIGN])
+        try:
+            results = spam_filter.run_spam_filter_batch([self.CAMPAIGN.replace("cruise", "trip"), "lunch?"])
+        finally:
+            spam_filter.close()
+        self.assertEqual(results, [True, False])
+        self.assertEqual(spam_filter.cache.misses, 1)
+
+class TestCascade(unittest.TestCase):
+
+    class _Model:
+        """Returns fixed probabilities per email and records what it scored."""
+
+        def __init__(self, probabilities):
+            self.probabilities = probabilities
+            self.seen = []
+
+        def predict_proba(self, emails):
+            self.seen.extend(emails)
+            return np.array([self.probabilities[email] for email in emails])
+
+    def test_uncertain_messages_escalate(self):
+        """Each stage only scores what earlier stages were unsure about."""
+        nb = self._Model({'a': 0.01, 'b': 0.5, 'c': 0.99, 'd': 0.6})
+        svm = self._Model({'b': 0.9, 'd': 0.5})
+        rnn = self._Model({'d': 0.2})
+        cascade = build_cascade({'rnn': rnn, 'svm': svm, 'naive_bayes': nb},
+                                {'naive_bayes': [0.1, 0.9], 'svm': [0.2, 0.8]})
+
+        self.assertEqual(cascade.names, ['naive_bayes', 'svm', 'rnn'])
+        self.assertEqual(list(cascade.predict_proba(['a', 'b', 'c', 'd'])), [0.01, 0.9, 0.99, 0.2])
+        self.assertEqual((svm.seen, rnn.seen), (['b', 'd'], ['d']))
+        self.assertEqual(cascade.scored, {'naive_bayes': 4, 'svm': 2, 'rnn': 1})
+        self.assertIsNone(build_cascade({}))
+
+    def test_spam_filter_cascade(self):
+        """SpamFilter runs the cascade over registered models with the configured threshold."""
+        emails = ["win free money prize", "team meeting notes", "claim your free prize", "lunch with the team"]
+        labels = [1, 0, 1, 0]
+        nb = NaiveBayesSpamFilter()
+        nb.train(emails, labels)
+        svm = SpamFilterSVM(estimator='linear').fit(emails * 3, labels * 3)
+
+        with tempfile.TemporaryDirectory() as tmp:
+            config_path = os.path.join(tmp, 'config.json')
+            with open(config_path, 'w') as f:
+                json.dump({'threshold': 0.5, 'algorithm': 'cascade', 'cascade': {'naive_bayes': [0.3, 0.7]}}, f)
+            spam_filter = SpamFilter(config_path=config_path, watch=False)
+            with self.assertRaises(ValueError):
+                spam_filter.run_spam_filter("free prize")
+            spam_filter.register_model('naive_bayes', nb)
+            spam_filter.register_model('svm', svm)
+            try:
+                self.assertEqual(spam_filter.run_spam_filter_batch(["free money prize", "team notes", "free team"]),
+                                 [True, False, bool(svm.predict_proba(["free team"])[0] >= 0.5)])
+                self.assertEqual(spam_filter.snapshot.cascade.scored, {'naive_bayes': 3, 'svm': 1})
+
+                with open(config_path, 'w') as f:
+                    json.dump({'threshold': 0.5, 'cascade': {'svm': [0.9, 0.1]}}, f)
+                with self.assertRaises(ValueError):
+                    spam_filter.load_config()
+            finally:
+                spam_filter.close()
+
+class TestSenderRules(unittest.TestCase):
+
+    def setUp(self):
+        # both.org is on both lists, where the whitelist wins
+        self.rules = RuleSet(whitelist=['trusted@example.com', 'good.spammydomain.com', 'both.org'],
+                             blacklist=['spammydomain.com', 'bad@example.com', 'both.org', ''])
+
+    def test_addresses_and_domains(self):
+        """Exact addresses, domains and subdomains match; other senders fall through."""
+        match = self.rules.match
+        self.assertIs(match('Trusted <TRUSTED@example.com>'), False)
+        self.assertIs(match('bad@example.com'), True)
+        self.assertIsNone(match('other@example.com'))
+        self.assertIs(match('x@spammydomain.com'), True)
+        self.assertIs(match('x@a.b.spammydomain.com'), True)
+        self.assertIsNone(match('x@notspammydomain.com'))
+        self.assertIsNone(match(None))
+
+    def test_most_specific_rule_wins(self):
+        """A whitelisted subdomain overrides its blacklisted parent, and the whitelist wins ties."""
+        self.assertIs(self.rules.match('x@good.spammydomain.com'), False)
+        self.assertIs(self.rules.match('x@mail.good.spammydomain.com'), False)
+        self.assertIs(self.rules.match('x@both.org'), False)
+
+    def test_empty_entries_are_ignored(self):
+        """Empty strings, e.g. from an unset environment variable, match nothing."""
+        rules = compile_rules({'whitelist': [''], 'blacklist': ['']})
+        self.assertEqual(len(rules), 0)
+        self.assertIsNone(rules.match('anyone@example.com'))
+
+class TestHotReload(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.config_path = os.path.join(self.tmp.name, 'config.json')
+        self._write({'threshold': 0.7, 'whitelist': [], 'blacklist': ['spammydomain.com']})
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def _write(self, config):
+        with open(self.config_path, 'w') as f:
+            f.write(config if isinstance(config, str) else json.dumps(config))
+
+    def test_reload_publishes_new_snapshot(self):
+        """A reload swaps in a new versioned snapshot and leaves the old one untouched."""
+        spam_filter = SpamFilter(config_path=self.config_path, watch=False)
+        before = spam_filter.snapshot
+        self._write({'threshold': 0.9, 'whitelist': [], 'blacklist': [], 'algorithm': 'svm'})
+        spam_filter.load_config()
+
+        after = spam_filter.snapshot
+        self.assertEqual((before.version, after.version), (1, 2))
+        self.assertEqual((before.settings.algorithm, before.settings.threshold), ('naive_bayes', 0.7))
+        self.assertEqual((after.settings.algorithm, after.settings.threshold), ('svm', 0.9))
+        self.assertIs(before.settings.rules.match('x@spammydomain.com'), True)
+        self.assertIsNone(after.settings.rules.match('x@spammydomain.com'))
+        with self.assertRaises(AttributeError):
+            after.settings.threshold = 0.1
+
+    def test_invalid_config_keeps_current_snapshot(self):
+        """A malformed file, an out-of-range threshold or an unknown algorithm does not replace the snapshot."""
+        spam_filter = SpamFilter(config_path=self.config_path, watch=False)
+        snapshot = spam_filter.snapshot
+        for config in ('{not json', {'threshold': 2}, {'whitelist': 'a@b.com'}, {'algorithm': 'naive_bayse'},
+                       {'models': {'naive_bayse': 'nb.bin'}}):
+            self._write(config)
+            spam_filter._reload()
+            self.assertIs(spam_filter.snapshot, snapshot)
+
+    def test_concurrent_reloads_are_serialized(self):
+        """A slow reload cannot publish an older file over a newer one."""
+        from email_spam_filter import main
+
+        spam_filter = SpamFilter(config_path=self.config_path, watch=False)
+        load_snapshot = main.load_snapshot
+        started = threading.Event()
+
+        def slow_load(*args, **kwargs):
+            snapshot = load_snapshot(*args, **kwargs)
+            if not started.is_set():
+                started.set()
+                time.sleep(0.2)
+            return snapshot
+
+        with mock.patch.object(main, 'load_snapshot', slow_load):
+            self._write({'threshold': 0.5})
+            slow = threading.Thread(target=spam_filter.load_config)
+            slow.start()
+            started.wait(5)
+            self._write({'threshold': 0.9})
+            spam_filter.load_config()
+            slow.join()
+        self.assertEqual(spam_filter.snapshot.settings.threshold, 0.9)
+        self.assertEqual(spam_filter.snapshot.version, 3)
+
+    def test_model_added_by_reload_is_watched(self):
+        """A model file named by a reloaded configuration is reloaded when it is replaced."""
+        model_path = os.path.join(self.tmp.name, 'nb.bin')
+        emails = ["win free money", "team meeting notes"]
+
+        def save(labels):
+            model = NaiveBayesSpamFilter()
+            model.train(emails, labels)
+            model.save(model_path)
+
+        def wait_for(version):
+            deadline = time.monotonic() + 10
+            while spam_filter.snapshot.version < version and time.monotonic() < deadline:
+                time.sleep(0.05)
+            self.assertGreaterEqual(spam_filter.snapshot.version, version)
+
+        save([1, 0])
+        spam_filter = SpamFilter(config_path=self.config_path)
+        try:
+            self._write({'threshold': 0.5, 'models': {'naive_bayes': 'nb.bin'}})
+            wait_for(2)
+            self.assertEqual(spam_filter.run_spam_filter_batch(["free money"]), [True])
+
+            save([0, 1])
+            wait_for(3)
+            self.assertEqual(spam_filter.run_spam_filter_batch(["free money"]), [False])
+        finally:
+            spam_filter.close()
+
+    def test_watcher_debounces_bursts(self):
+        """Several writes in quick succession trigger a single callback."""
+        calls = []
+        done = threading.Event()
+        watcher = FileWatcher([self.config_path], lambda: (calls.append(1), done.set()), debounce=0.2).start()
+        try:
+            for threshold in (0.1, 0.2, 0.3, 0.4):
+                self._write({'threshold': threshold})
+            self.assertTrue(done.wait(5))
+            time.sleep(0.4)
+        finally:
+            watcher.stop()
+        self.assertEqual(len(calls), 1)
+
+class TestSettings(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.config_path = os.path.join(self.tmp.name, 'config.json')
+        with open(self.config_path, 'w') as f:
+            json.dump({'threshold': 0.6, 'whitelist': ['trusted@example.com'],
+                       'blacklist': ['spammydomain.com'], 'models': {'svm': 'svm.npz'}}, f)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_precedence(self):
+        """Command-line values beat the environment, which beats the file."""
+        environ = {'THRESHOLD': '0.8', 'BLACKLIST': 'bad.com, worse.com'}
+        settings = load_settings(self.config_path, environ=environ)
+        self.assertEqual(settings.threshold, 0.8)
+        self.assertEqual(settings.whitelist, ('trusted@example.com',))
+        self.assertEqual(settings.blacklist, ('bad.com', 'worse.com'))
+
+        settings = load_settings(self.config_path, {'threshold': 0.9}, environ=environ)
+        self.assertEqual(settings.threshold, 0.9)
+
+    def test_empty_environment_values_are_ignored(self):
+        """An empty or comma-only WHITELIST does not override the file with ['']."""
+        self.assertEqual(from_env({'THRESHOLD': '', 'WHITELIST': '', 'BLACKLIST': ' , '}), {})
+        settings = load_settings(self.config_path, environ={'WHITELIST': ''})
+        self.assertEqual(settings.whitelist, ('trusted@example.com',))
+        with self.assertRaises(ValueError):
+            from_env({'THRESHOLD': 'high'})
+
+    def test_compiled_and_immutable(self):
+        """Settings hold typed, compiled values and cannot be changed."""
+        settings = load_settings(self.config_path, environ={})
+        self.assertIsInstance(build_settings({'threshold': 1}).threshold, float)
+        self.assertIs(settings.rules.match('a@spammydomain.com'), True)
+        self.assertIs(settings.rules.match('trusted@example.com'), False)
+        self.assertEqual(settings.models['svm'], os.path.join(self.tmp.name, 'svm.npz'))
+        with self.assertRaises(TypeError):
+            settings.models['svm'] = 'other.npz'
+        for config in ({'threshold': '0.5'}, {'threshold': True}, {'learning_rate': 0}):
+            with self.assertRaises(ValueError):
+                build_settings(config)
+
+    def test_spam_filter_overrides(self):
+        """SpamFilter applies overrides above the file and environment on every reload."""
+        with open(self.config_path, 'w') as f:
+            json.dump({'threshold': 0.6, 'blacklist': ['spammydomain.com']}, f)
+        with mock.patch.dict(os.environ, {'BLACKLIST': ''}):
+            spam_filter = SpamFilter(config_path=self.config_path, watch=False, overrides={'threshold': 0.95})
+            spam_filter.load_config()
+        self.assertEqual(spam_filter.settings.threshold, 0.95)
+        self.assertIs(spam_filter.rules.match('a@spammydomain.com'), True)
+
+class TestMetrics(unittest.TestCase):
+
+    def setUp(self):
+        self.model = NaiveBayesSpamFilter()
+        self.model.train(["win free money prize", "team meeting notes"], [1, 0])
+
+    def tearDown(self):
+        metrics.configure(build_settings({}))
+        metrics.reset()
+
+    def test_disabled_by_default(self):
+        """Nothing is recorded until metrics are enabled."""
+        self.model.predict(["free prize"])
+        self.assertFalse(metrics.enabled)
+        self.assertEqual(metrics.export(), '')
+
+    def test_prometheus_export(self):
+        """Stage histograms and counters are exported in the Prometheus text format."""
+        metrics.configure(build_settings({'metrics': True}))
+        self.model.predict(["free prize", "team notes"])
+        metrics.inc('verdicts', 2, source='model')
+        text = metrics.export()
+
+        self.assertIn('# TYPE email_spam_filter_stage_seconds histogram', text)
+        self.assertIn('email_spam_filter_stage_seconds_count{stage="vectorize"} 1', text)
+        self.assertIn('email_spam_filter_stage_seconds_count{stage="tokenize"} 1', text)
+        self.assertIn('email_spam_filter_stage_seconds_bucket{stage="vectorize",le="+Inf"} 1', text)
+        self.assertIn('email_spam_filter_verdicts_total{source="model"} 2', text)
+
+    def test_pool_worker_stages(self):
+        """Stages timed inside pool workers are merged into this process's export."""
+        with tempfile.TemporaryDirectory() as tmp:
+            config_path = os.path.join(tmp, 'config.json')
+            with open(config_path, 'w') as f:
+                json.dump({'metrics': True}, f)
+            spam_filter = SpamFilter(config_path=config_path, watch=False)
+            spam_filter.register_model('naive_bayes', self.model)
+            try:
+                spam_filter.run_spam_filter_batch(["free prize", "team notes"])
+                spam_filter.run_spam_filter_batch(["win money"])
+            finally:
+                spam_filter.close()
+
+        text = metrics.export()
+        for stage in ('model', 'vectorize'):
+            self.assertIn(f'email_spam_filter_stage_seconds_count{{stage="{stage}"}} 2', text)
+        self.assertIn('email_spam_filter_stage_seconds_count{stage="tokenize"}', text)
+
+    def test_spam_filter_stages_and_profiler(self):
+        """The config switches on stage timers and the sampling profiler at runtime."""
+        with tempfile.TemporaryDirectory() as tmp:
+            config_path = os.path.join(tmp, 'config.json')
+            with open(config_path, 'w') as f:
+                json.dump({'threshold': 0.5, 'blacklist': ['spammydomain.com'], 'algorithm': 'cascade',
+                           'metrics': True, 'profiler': {'enabled': True, 'interval': 0.001}}, f)
+            spam_filter = SpamFilter(config_path=config_path, watch=False)
+            spam_filter.register_model('naive_bayes', self.model)
+            try:
+                spam_filter.run_spam_filter_batch(["free prize", "team notes"], ['a@spammydomain.com', None])
+                time.sleep(0.05)
+                self.assertTrue(metrics.profiler.running)
+                self.assertTrue(metrics.profiler.samples)
+
+                with open(config_path, 'w') as f:
+                    json.dump({'threshold': 0.5}, f)
+                spam_filter.load_config()
+                self.assertFalse(metrics.enabled)
+                self.assertFalse(metrics.profiler.running)
+            finally:
+                spam_filter.close()
+
+        text = metrics.export()
+        for stage in ('rules', 'model', 'vectorize'):
+            self.assertIn(f'email_spam_filter_stage_seconds_count{{stage="{stage}"}} 1', text)
+        self.assertIn('email_spam_filter_verdicts_total{source="rules"} 1', text)
+        self.assertIn('email_spam_filter_verdicts_total{source="model"} 1', text)
+
+class TestStartupBudget(unittest.TestCase):
+
+    # Seconds allowed for a fresh interpreter to import each lightweight path
+    BUDGET = 1.5
+    HEAVY = ('tensorflow', 'keras', 'sklearn', 'watchdog')
+
+    def _import_in_subprocess(self, statements):
+        code = (
+            "import json, sys, time\n"
+            "start = time.perf_counter()\n"
+            f"{statements}\n"
+            "print(json.dumps([time.perf_counter() - start, sorted(sys.modules)]))\n"
+        )
+        root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        output = subprocess.run([sys.executable, '-c', code], cwd=root, capture_output=True,
+                                text=True, check=True).stdout
+        seconds, modules = json.loads(output.splitlines()[-1])
+        return seconds, {module.split('.')[0] for module in modules}
+
+    def test_cli_and_naive_bayes_paths(self):
+        """The CLI tools and the Naive Bayes path load no heavy backend and start within budget."""
+        for statements in ("import email_spam_filter\nfrom email_spam_filter import SpamFilter, batch, server",
+                           "from email_spam_filter import NaiveBayesSpamFilter\n"
+                           "NaiveBayesSpamFilter().train(['free prize', 'team notes'], [1, 0])",
+                           "import arg_parser, config_loader"):
+            seconds, modules = self._import_in_subprocess(statements)
+            self.assertFalse(modules & set(self.HEAVY), statements)
+            self.assertLess(seconds, self.BUDGET, statements)
+
+    def test_backends_load_on_first_use(self):
+        """Accessing an algorithm through the registry imports its backend."""
+        _, modules = self._import_in_subprocess(
+            "from email_spam_filter.registry import load_algorithm\nload_algorithm('svm')")
+        self.assertIn('sklearn', modules)
+        self.assertNotIn('tensorflow', modules)
+
+class TestScoringServer(unittest.TestCase):
+
+    class _Filter:
+        """Stand-in for SpamFilter that records the batches it scores."""
+
+        def __init__(self):
+            self.batches = []
+
+        def run_spam_filter_batch(self, emails, senders=None):
+            self.batches.append(list(emails))
+            return [sender == 'spam@example.com' or 'free' in email
+                    for email, sender in zip(emails, senders or [None] * len(emails))]
+
+    def test_concurrent_requests_are_coalesced(self):
+        """Concurrent requests share batches no larger than max_batch_size."""
+        spam_filter = self._Filter()
+
+        async def run():
+            batcher = MicroBatcher(spam_filter.run_spam_filter_batch, max_batch_size=4, max_wait=0.05)
+            results = await asyncio.gather(*(batcher.score(f"free offer {i}" if i % 2 else f"hello {i}")
+                                             for i in range(10)))
+            await batcher.close()
+            return results
+
+        results = asyncio.run(run())
+        self.assertEqual(results, [bool(i % 2) for i in range(10)])
+        self.assertEqual(sorted(map(len, spam_filter.batches)), [2, 4, 4])
+
+    def test_batches_are_scored_concurrently(self):
+        """Up to max_concurrency batches are in flight at the same time."""
+        lock = threading.Lock()
+        active = [0, 0]
+
+        def score_batch(items):
+            with lock:
+                active[0] += 1
+                active[1] = max(active)
+            time.sleep(0.05)
+            with lock:
+                active[0] -= 1
+            return items
+
+        async def run():
+            batcher = MicroBatcher(score_batch, max_batch_size=2, max_wait=0.001, max_concurrency=3)
+            results = await asyncio.gather(*(batcher.score(i) for i in range(12)))
+            await batcher.close()
+            return results
+
+        self.assertEqual(asyncio.run(run()), list(range(12)))
+        self.assertEqual(active[1], 3)
+
+    def test_scoring_errors(self):
+        """Scoring failures are the server's: 503 when it cannot score now, 500 otherwise."""
+        class Failing:
+            def __init__(self, error):
+                self.error = error
+
+            def run_spam_filter_batch(self, emails, senders=None):
+                raise self.error
+
+        async def run(error):
+            server = ScoringServer(Failing(error), max_wait=0.001)
+            status, payload = await server._respond('POST', '/score', b'free money')
+            await server.close()
+            return status, payload
+
+        self.assertEqual(asyncio.run(run(queue.Full()))[0], '503 Service Unavailable')
+        self.assertEqual(asyncio.run(run(ValueError("No 'svm' model is loaded")))[0], '503 Service Unavailable')
+        status, payload = asyncio.run(run(RuntimeError('model crashed')))
+        self.assertEqual(status, '500 Internal Server Error')
+        self.assertIn('model crashed', payload['error'])
+
+    def test_malformed_request(self):
+        """A request that cannot be parsed answers 400 and closes the connection."""
+        async def run():
+            server = ScoringServer(self._Filter(), max_wait=0.001)
+            listener = await server.start(port=0)
+            port = listener.sockets[0].getsockname()[1]
+            reader, writer = await asyncio.open_connection('127.0.0.1', port)
+            writer.write(b"POST /score HTTP/1.1\r\nContent-Length: lots\r\n\r\nfree money")
+            response = await reader.read()
+            writer.close()
+            await server.close()
+            return response
+
+        response = asyncio.run(run())
+        self.assertTrue(response.startswith(b'HTTP/1.1 400 Bad Request'))
+        self.assertIn(b'Connection: close', response)
+
+    def test_http_round_trip(self):
+        """POST /score returns a JSON verdict and keeps the connection open."""
+        async def run():
+            server = ScoringServer(self._Filter(), max_wait=0.001)
+            listener = await server.start(port=0)
+            port = listener.sockets[0].getsockname()[1]
+            reader, writer = await asyncio.open_connection('127.0.0.1', port)
+            responses = []
+            requests = ((b'free money', '/score', ''), (b'lunch?', '/score', ''),
+                        (b'lunch?', '/score', 'X-Sender: spam@example.com\r\n'), (b'', '/other', ''))
+            for body, path, extra in requests:
+                writer.write(f"POST {path} HTTP/1.1\r\nContent-Length: {len(body)}\r\n{extra}\r\n".encode() + body)
+                status = await reader.readline()
+                headers = {}
+                while (line := await reader.readline()) != b'\r\n':
+                    name, _, value = line.decode().partition(':')
+                    headers[name.lower()] = value.strip()
+                payload = json.loads(await reader.readexactly(int(headers['content-length'])))
+                responses.append((status.split()[1], payload))
+            writer.close()
+            await server.close()
+            return responses
+
+        responses = asyncio.run(run())
+        self.assertEqual(responses[0], (b'200', {'result': True}))
+        self.assertEqual(responses[1], (b'200', {'result': False}))
+        self.assertEqual(responses[2], (b'200', {'result': True}))
+        self.assertEqual(responses[3][0], b'404')
+
+class TestStreaming(unittest.TestCase):
+
+    def setUp(self):
+        from email_spam_filter.benchmark import synthetic_corpus
+
+        self.tmp = tempfile.TemporaryDirectory()
+        self.emails, self.labels = synthetic_corpus(400, seed=3)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def _path(self, name, content):
+        path = os.path.join(self.tmp.name, name)
+        with open(path, 'w', newline='') as f:
+            f.write(content)
+        return path
+
+    def _jsonl(self):
+        return self._path('corpus.jsonl', ''.join(json.dumps({'text': email, 'label': 'spam' if label else 'ham'}) + '\n'
+                                                  for email, label in zip(self.emails, self.labels)))
+
+    def test_readers(self):
+        """CSV, JSONL and mbox corpora yield (text, label) records on every pass."""
+        from email_spam_filter.streaming import Corpus
+
+        csv_path = self._path('spam.csv', 'v1,v2\nspam,"Win a prize, now"\nham,Lunch?\n')
+        corpus = Corpus(csv_path, text_field='v2', label_field='v1')
+        self.assertEqual(list(corpus), [('Win a prize, now', 1), ('Lunch?', 0)])
+        self.assertEqual(list(corpus), list(corpus))
+
+        self.assertEqual(list(Corpus(self._jsonl()))[:2], list(zip(self.emails, self.labels))[:2])
+
+        mbox_path = self._path('inbox.mbox', 'From a\nSubject: Prize\nX-Spam-Flag: YES\n\nClaim now\n\n'
+                                             'From b\nSubject: Notes\n\nSee attached\n')
+        self.assertEqual([label for _, label in Corpus(mbox_path)], [1, 0])
+        self.assertEqual([label for _, label in Corpus(mbox_path, label=1)], [1, 1])
+        with self.assertRaises(ValueError):
+            Corpus(os.path.join(self.tmp.name, 'corpus.txt'))
+
+    def test_holdout_and_batches(self):
+        """The holdout split is stable and disjoint, and batches hold at most batch_size records."""
+        from email_spam_filter.streaming import Corpus
+
+        path = self._jsonl()
+        train = list(Corpus(path, holdout=0.25, subset='train'))
+        test = list(Corpus(path, holdout=0.25, subset='test'))
+        self.assertEqual(len(train) + len(test), len(self.emails))
+        self.assertTrue(50 < len(test) < 150)
+        self.assertEqual(test, list(Corpus(path, holdout=0.25, subset='test')))
+
+        sizes = [(len(texts), labels.dtype) for texts, labels in Corpus(path).batches(128)]
+        self.assertEqual(sizes, [(128, np.int64)] * 3 + [(16, np.int64)])
+
+    def test_svm_fit_stream(self):
+        """The hashed linear SVM learns from streamed batches as well as from the full set."""
+        from email_spam_filter.streaming import Corpus
+
+        corpus = Corpus(self._jsonl())
+        streamed = SpamFilterSVM(features='hashing', estimator='linear').fit_stream(corpus, batch_size=64, epochs=3)
+        self.assertGreater(np.mean(streamed.predict(self.emails) == np.asarray(self.labels)), 0.9)
+        with self.assertRaises(ValueError):
+            SpamFilterSVM().partial_fit(self.emails[:2], self.labels[:2])
+
+    def test_rnn_trains_from_stream(self):
+        """Encoded batches from disk train the bucketed RNN and fill a prefetching tf.data pipeline."""
+        from email_spam_filter.rnn import RnnSpamDetector
+        from email_spam_filter.streaming import Corpus
+
+        corpus = Corpus(self._jsonl())
+        encoder = SequenceEncoder(build_vocabulary(corpus.texts(), max_size=500), 32)
+        batches = list(corpus.sequences(encoder, batch_size=100))
+        self.assertEqual([(X.shape, X.dtype) for X, _ in batches][0], ((100, 32), np.int32))
+
+        detector = RnnSpamDetector(vocab_size=500, embedding_dim=8, rnn_units=8, buckets=True)
+        before = detector.predict_proba(batches[0][0])
+        detector.train(batches, epochs=1)
+        self.assertFalse(np.allclose(before, detector.predict_proba(batches[0][0])))
+
+        X, y = next(iter(corpus.dataset(encoder, batch_size=100, channels=True)))
+        self.assertEqual((tuple(X.shape), tuple(y.shape)), ((100, 32, 1), (100,)))
+
+class TestBatchClassifier(unittest.TestCase):
+
+    MESSAGES = [
+        b"From: promo@spammydomain.com\nSubject: Win now\n\nwin free money prize\n",
+        b"From: boss@example.com\nSubject: Notes\n\nteam meeting notes\n",
+        b"From: promo@spammydomain.com\nSubject: Prize\n\nclaim your free prize\n",
+    ]
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.filter = NaiveBayesSpamFilter()
+        self.filter.train(["win free money prize", "team meeting notes"], [1, 0])
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def _classify(self, path, fmt='jsonl', rules=None):
+        out = io.StringIO()
+        messages = (batch.parse_message(key, raw) for key, raw in batch.iter_messages(path))
+        batch.WRITERS[fmt](batch.classify_stream(messages, self.filter, batch_size=2, rules=rules), out)
+        return out.getvalue()
+
+    def test_mbox(self):
+        """Messages are split on From_ lines and scored across micro-batches."""
+        path = os.path.join(self.tmp.name, 'archive.mbox')
+        with open(path, 'wb') as f:
+            for raw in self.MESSAGES:
+                f.write(b"From sender Mon Jan  1 00:00:00 2024\n" + raw + b"\n")
+        verdicts = [json.loads(line) for line in self._classify(path).splitlines()]
+        self.assertEqual([v['spam'] for v in verdicts], [True, False, True])
+        self.assertEqual(verdicts[1]['subject'], 'Notes')
+
+        rules = RuleSet(whitelist=['spammydomain.com'], blacklist=['boss@example.com'])
+        verdicts = [json.loads(line) for line in self._classify(path, rules=rules).splitlines()]
+        self.assertEqual([(v['spam'], v['score']) for v in verdicts], [(False, 0.0), (True, 1.0), (False, 0.0)])
+
+    def test_maildir_and_eml_directory(self):
+        """Maildir and .eml directories are detected and written as CSV."""
+        maildir = os.path.join(self.tmp.name, 'Maildir')
+        for subdir in ('cur', 'new', 'tmp'):
+            os.makedirs(os.path.join(maildir, subdir))
+        emls = os.path.join(self.tmp.name, 'emls')
+        os.makedirs(emls)
+        for i, raw in enumerate(self.MESSAGES):
+            with open(os.path.join(maildir, 'new', f'{i}.host'), 'wb') as f:
+                f.write(raw)
+            with open(os.path.join(emls, f'{i}.eml'), 'wb') as f:
+                f.write(raw)
+
+        for path in (maildir, emls):
+            rows = self._classify(path, fmt='csv').splitlines()
+            self.assertTrue(rows[0].startswith('id,from,subject,spam'))
+            self.assertEqual(sorted(row.split(',')[3] for row in rows[1:]), ['False', 'True', 'True'])
+
+    def test_batches_scored_once(self):
+        """Models with predict_proba are not asked for predict as well."""
+        calls = []
+
+        class Model:
+            def predict_proba(self, texts):
+                calls.append('proba')
+                return np.array([0.2, 0.5, 0.9][:len(texts)])
+
+            def predict(self, texts):
+                calls.append('predict')
+                return [0] * len(texts)
+
+        messages = [batch.parse_message(str(i), raw) for i, raw in enumerate(self.MESSAGES)]
+        verdicts = list(batch.classify_stream(messages, Model(), batch_size=3))
+        self.assertEqual(calls, ['proba'])
+        self.assertEqual([v['spam'] for v in verdicts], [False, True, True])
+
+class TestBenchmark(unittest.TestCase):
+
+    CORPUS = {'n_emails': 200, 'vocab_size': 500, 'min_length': 5, 'max_length': 30, 'seed': 3}
+
+    def test_corpus_is_reproducible(self):
+        """The same parameters give the same corpus, with the requested shape."""
+        emails, labels = benchmark.synthetic_corpus(**self.CORPUS)
+        self.assertEqual((emails, labels), benchmark.synthetic_corpus(**self.CORPUS))
+        self.assertEqual(len(emails), 200)
+        self.assertTrue(all(5 <= len(email.split()) <= 30 for email in emails))
+        self.assertEqual(set(labels), {0, 1})
+
+    def test_report_is_json(self):
+        """A run reports every measurement for each batch size and worker count."""
+        report = benchmark.run_benchmarks(['naive_bayes'], self.CORPUS, isolate=False,
+                                          batch_sizes=(1, 16), workers=(1,), latency_samples=10)
+        result = json.loads(json.dumps(report))['results'][0]
+        self.assertEqual(result['model'], 'naive_bayes')
+        self.assertEqual([(t['batch_size'], t['workers']) for t in result['throughput']], [(1, 1), (16, 1)])
+        self.assertTrue(all(t['messages_per_second'] > 0 for t in result['throughput']))
+        self.assertLessEqual(result['latency_ms']['p50'], result['latency_ms']['p99'])
+        self.assertGreater(result['peak_rss_mb'], 0)
+
+class TestSpamFilterSVMFeatures(unittest.TestCase):
+
+    def setUp(self):
+        self.emails = ["win free money", "claim free prize now", "team meeting notes", "project review agenda"] * 3
+        self.labels = [1, 1, 0, 0] * 3
+
+    def test_hashing_features_are_stateless(self):
+        """Hashed features need no fitted vocabulary and have a fixed width."""
+        first = SpamFilterSVM(features='hashing', n_features=2 ** 10)
+        second = SpamFilterSVM(features='hashing', n_features=2 ** 10)
+        X = first.vectorizer.transform(self.emails)
+        self.assertEqual(X.shape, (len(self.emails), 2 ** 10))
+        self.assertEqual(X.format, 'csr')
+        self.assertEqual(abs(X - second.vectorizer.transform(self.emails)).max(), 0)
+
+    def test_hashing_model_round_trip(self):
+        """A hashed-feature model trains, predicts and saves without a vocabulary."""
+        model = SpamFilterSVM(features='hashing', n_features=2 ** 12).fit(self.emails, self.labels)
+        self.assertEqual(list(model.predict(self.emails)), self.labels)
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'model.bin')
+            model.save(path)
+            _, _, arrays = model_format.read_model(path)
+            self.assertNotIn('vocabulary', arrays)
+            loaded = SpamFilterSVM.load(path)
+            self.assertEqual(loaded.n_features, 2 ** 12)
+            self.assertEqual(list(loaded.predict(self.emails)), self.labels)
+
+    def test_unknown_feature_mode(self):
+        with self.assertRaises(ValueError):
+            SpamFilterSVM(features='bag-of-words')
+        with self.assertRaises(ValueError):
+            SpamFilterSVM(estimator='rbf')
+
+    def test_linear_estimator(self):
+        """The seeded SGD linear model trains reproducibly and honours a probability threshold."""
+        model = SpamFilterSVM(estimator='linear').fit(self.emails, self.labels)
+        self.assertEqual(list(model.predict(self.emails)), self.labels)
+        again = SpamFilterSVM(estimator='linear').fit(self.emails, self.labels)
+        self.assertTrue(np.array_equal(model.coef_, again.coef_))
+
+        X = model.vectorizer.transform(self.emails)
+        probabilities = model.predict_proba(self.emails)
+        self.assertTrue(abs(probabilities - model.model.predict_proba(X)[:, 1]).max() < 1e-5)
+        self.assertEqual(list(model.predict(self.emails, threshold=1.01)), [0] * len(self.emails))
+        self.assertEqual(list(model.predict(self.emails, threshold=0.0)), [1] * len(self.emails))
+
+HAS_TENSORFLOW = importlib.util.find_spec('tensorflow') is not None
+
+@unittest.skipUnless(HAS_TENSORFLOW, "TensorFlow is not installed")
+class TestInferenceEngine(unittest.TestCase):
+
+    def setUp(self):
+        from email_spam_filter.cnn import build_cnn_model
+        from email_spam_filter.inference import InferenceEngine
+
+        self.model = build_cnn_model((12, 1))
+        self.engine = InferenceEngine(self.model, batch_sizes=(1, 4, 16), max_latency=0.01)
+        self.X = np.random.RandomState(0).rand(21, 12, 1).astype(np.float32)
+        self.expected = self.model.predict(self.X, verbose=0).ravel()
+
+    def tearDown(self):
+        self.engine.close()
+
+    def test_padded_batches_match_keras(self):
+        """Padding to traced batch sizes and chunking do not change predictions."""
+        self.assertTrue(np.allclose(self.engine.predict(self.X), self.expected, atol=1e-6))
+        self.assertTrue(np.allclose(self.engine.predict(self.X[:3]), self.expected[:3], atol=1e-6))
+        self.assertLessEqual(len(self.engine._functions), 3)
+
+    def test_dynamic_batching(self):
+        """Concurrently submitted inputs are batched and resolved individually."""
+        futures = [self.engine.submit(x) for x in self.X]
+        results = [future.result(timeout=30) for future in futures]
+        self.assertTrue(np.allclose(results, self.expected, atol=1e-6))
+
+    def test_predict_spam_runs_in_process(self):
+        """predict_spam no longer forks workers and returns one probability per input."""
+        from email_spam_filter.cnn import predict_spam
+
+        self.assertTrue(np.allclose(predict_spam(self.model, self.X).ravel(), self.expected, atol=1e-6))
+
+    def test_engine_does_not_keep_model_alive(self):
+        """Deleting a model drops its cached engine and traced graphs."""
+        import gc
+        import weakref
+        from email_spam_filter.cnn import build_cnn_model
+        from email_spam_filter.inference import _engines, engine_for
+
+        gc.collect()
+        cached = len(_engines)
+        model = build_cnn_model((12, 1))
+        engine_for(model).predict(self.X)
+        self.assertEqual(len(_engines), cached + 1)
+        collected = weakref.ref(model)
+        del model
+        gc.collect()
+        self.assertIsNone(collected())
+        self.assertEqual(len(_engines), cached)
+
+    def test_sequence_scorer(self):
+        """SequenceScorer feeds encoded texts to a sequence model as the cascade's CNN stage."""
+        from email_spam_filter.cascade import SequenceScorer
+        from email_spam_filter.tokenizer import encode
+
+        vocabulary = {'free': 2, 'prize': 3, 'team': 4}
+        scorer = SequenceScorer(self.model, vocabulary, max_length=12)
+        X = np.zeros((2, 12, 1), dtype=np.float32)
+        for row, email in zip(X, ["free prize now", "team"]):
+            encode(email, vocabulary, out=row[:, 0], oov=1)
+        expected = self.model.predict(X, verbose=0).ravel()
+        self.assertTrue(np.allclose(scorer.predict_proba(["free prize now", "team"]), expected, atol=1e-6))
+
+class TestRnnBucketing(unittest.TestCase):
+
+    def setUp(self):
+        from email_spam_filter.rnn import RnnSpamDetector
+
+        rng = np.random.RandomState(0)
+        lengths = [3, 5, 9, 30, 2, 17, 64, 1]
+        self.X = np.zeros((len(lengths), 64), dtype=np.int32)
+        for row, n in zip(self.X, lengths):
+            row[:n] = rng.randint(1, 50, size=n)
+        self.y = np.array([0, 1] * 4)
+        self.detector = RnnSpamDetector(vocab_size=50, embedding_dim=8, rnn_units=8, buckets=(4, 16))
+
+    def tearDown(self):
+        metrics.configure(build_settings({}))
+        metrics.reset()
+
+    def test_buckets_match_full_width(self):
+        """Masked padding makes bucketed scoring equal to scoring full-width rows."""
+        bucketed = self.detector.predict_proba(self.X)
+        self.detector.buckets = None
+        self.assertTrue(np.allclose(bucketed, self.detector.predict_proba(self.X), atol=1e-5))
+
+    def test_bucketed_training_reports_padding(self):
+        """Bucketed training runs per-bucket batches and counts token and padding timesteps."""
+        metrics.configure(build_settings({'metrics': True}))
+        self.detector.train(self.X, self.y, epochs=1, batch_size=2, seed=0)
+        text = metrics.export()
+        # Buckets of width 4, 16 and 64 hold 3, 2 and 3 rows: 236 timesteps for 131 tokens
+        self.assertIn('email_spam_filter_rnn_timesteps_total{kind="token"} 131', text)
+        self.assertIn('email_spam_filter_rnn_timesteps_total{kind="padding"} 105', text)
+
+class TestLiteModel(unittest.TestCase):
+
+    def setUp(self):
+        from email_spam_filter.cnn import build_cnn_model
+        from email_spam_filter.rnn import RnnSpamDetector
+
+        rng = np.random.RandomState(0)
+        self.X = rng.rand(20, 24, 1).astype(np.float32) * 3
+        self.cnn = build_cnn_model((24, 1))
+        self.cnn.fit(self.X, rng.randint(0, 2, 20), epochs=1, verbose=0)
+
+        self.ids = np.zeros((20, 24), dtype=np.int32)
+        for row in self.ids:
+            n = rng.randint(1, 25)
+            row[:n] = rng.randint(1, 300, size=n)
+        self.rnn = RnnSpamDetector(vocab_size=300, embedding_dim=8, rnn_units=8)
+        self.rnn.model.fit(self.ids, rng.randint(0, 2, 20), epochs=1, verbose=0)
+
+    def test_matches_keras(self):
+        """The NumPy forward pass reproduces Keras, more loosely at lower precisions."""
+        from email_spam_filter.lite import LiteModel
+
+        cases = ((self.cnn, self.X), (self.rnn, self.ids))
+        for model, X in cases:
+            expected = getattr(model, 'model', model).predict(X, verbose=0).ravel()
+            for precision, atol in (('float32', 1e-5), ('float16', 1e-3), ('int8', 2e-2)):
+                lite = LiteModel.from_keras(model, precision)
+                self.assertTrue(np.allclose(lite.predict_proba(X), expected, atol=atol), precision)
+
+    def test_weight_memory(self):
+        """float16 halves and int8 roughly quarters the weight memory."""
+        from email_spam_filter.lite import LiteModel
+
+        full = LiteModel.from_keras(self.cnn).nbytes
+        self.assertLessEqual(LiteModel.from_keras(self.cnn, 'float16').nbytes, full / 2 + 1024)
+        self.assertLessEqual(LiteModel.from_keras(self.cnn, 'int8').nbytes, full / 4 + 2048)
+        with self.assertRaises(ValueError):
+            LiteModel.from_keras(self.cnn, 'int4')
+
+    def test_export_round_trip(self):
+        """Exported weights reload memory-mapped and score like the Keras model."""
+        from email_spam_filter import model_format
+        from email_spam_filter.cascade import SequenceScorer
+        from email_spam_filter.lite import LiteModel, export
+
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'cnn.bin')
+            for precision, atol in (('float32', 1e-5), ('int8', 2e-2)):
+                export(self.cnn, path, precision=precision)
+                expected = self.cnn.predict(self.X, verbose=0).ravel()
+                self.assertTrue(np.allclose(LiteModel.load(path).predict_proba(self.X), expected, atol=atol))
+
+            vocabulary = {'free': 2, 'prize': 3, 'meeting': 4}
+            export(self.rnn, path, vocabulary, max_length=24)
+            scorer = model_format.load_model(path)
+            self.assertIsInstance(scorer, SequenceScorer)
+            self.assertEqual(scorer.vocabulary, vocabulary)
+            emails = ["free prize", "meeting free unknown"]
+            expected = self.rnn.model.predict(scorer.encode(emails), verbose=0).ravel()
+            self.assertTrue(np.allclose(scorer.predict_proba(emails), expected, atol=1e-5))
+            self.assertEqual(list(scorer.predict(emails)), [int(p >= 0.5) for p in expected])
+            self.assertEqual(list(scorer.predict(emails, threshold=1.01)), [0, 0])
+            with self.assertRaises(ValueError):
+                LiteModel(scorer.model.layers, (None,)).save(path, vocabulary)
+
+    def test_batch_cli(self):
+        """The batch classifier scores mailboxes with an exported model file."""
+        from email_spam_filter.lite import export
+
+        with tempfile.TemporaryDirectory() as tmp:
+            model_path = os.path.join(tmp, 'rnn.bin')
+            export(self.rnn, model_path, {'free': 2, 'prize': 3, 'meeting': 4}, max_length=24)
+            mbox = os.path.join(tmp, 'archive.mbox')
+            with open(mbox, 'wb') as f:
+                for raw in TestBatchClassifier.MESSAGES:
+                    f.write(b"From sender Mon Jan  1 00:00:00 2024\n" + raw + b"\n")
+            output = os.path.join(tmp, 'verdicts.jsonl')
+            batch.main([mbox, '--model', model_path, '--output', output])
+            with open(output) as f:
+                verdicts = [json.loads(line) for line in f]
+
+        scores = [v['score'] for v in verdicts]
+        self.assertEqual(len(verdicts), 3)
+        self.assertEqual([v['spam'] for v in verdicts], [score >= 0.5 for score in scores])
+
+    def test_serving_skips_tensorflow(self):
+        """Scoring an exported model loads no TensorFlow."""
+        from email_spam_filter.lite import export
+
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'rnn.bin')
+            export(self.rnn, path, {'free': 2, 'prize': 3}, max_length=24)
+            code = ("import sys\n"
+                    "from email_spam_filter.model_format import load_model\n"
+                    f"print(load_model({path!r}).predict_proba(['free prize'])[0])\n"
+                    "print('tensorflow' in sys.modules)\n")
+            root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+            output = subprocess.run([sys.executable, '-c', code], cwd=root, capture_output=True,
+                                    text=True, check=True).stdout.split()
+        self.assertTrue(0 <= float(output[0]) <= 1)
+        self.assertEqual(output[1], 'False')
+
+class TestModelFormat(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, 'model.bin')
+        self.emails = ["win free money", "claim free prize now", "team meeting notes", "project review agenda"]
+        self.labels = [1, 1, 0, 0]
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_naive_bayes_round_trip(self):
+        """A saved Naive Bayes model loads memory-mapped and scores identically."""
+        trained = NaiveBayesSpamFilter()
+        trained.train(self.emails, self.labels)
+        trained.save(self.path)
+
+        loaded = model_format.load_model(self.path)
+        self.assertIsInstance(loaded, NaiveBayesSpamFilter)
+        self.assertFalse(loaded._snapshot.word_log_odds.flags.writeable)
+        self.assertEqual(list(loaded.predict(self.emails)), list(trained.predict(self.emails)))
+        self.assertTrue(abs(loaded.predict_proba(self.emails) - trained.predict_proba(self.emails)).max() < 1e-6)
+
+    def test_svm_round_trip(self):
+        """A saved SVM keeps its vocabulary, IDF vector and linear weights."""
+        trained = SpamFilterSVM().fit(self.emails * 3, self.labels * 3)
+        trained.save(self.path)
+
+        loaded = SpamFilterSVM.load(self.path)
+        self.assertEqual(list(loaded.predict(self.emails)), list(trained.predict(self.emails)))
+        self.assertTrue(abs(loaded.predict_proba(self.emails) - trained.predict_proba(self.emails)).max() < 1e-5)
+
+    def test_rejects_other_files(self):
+        """Loading checks the magic bytes and the model kind."""
+        with open(self.path, 'wb') as f:
+            f.write(b'not a model')
+        with self.assertRaises(ValueError):
+            model_format.load_model(self.path)
+
+        trained = NaiveBayesSpamFilter()
+        trained.train(self.emails, self.labels)
+        trained.save(self.path)
+        with self.assertRaises(ValueError):
+            SpamFilterSVM.load(self.path)
+
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file